@@ -0,0 +1 @@
+"""Offline benchmarks for gensio_modems (run from the repository root)."""
@@ -0,0 +1,150 @@
+"""
+A station reconnecting in a loop, with and without admission control.
+
+`--stations` well-behaved stations each connect once through a simulated
+KISS TNC to an AX25ListenerEvent gateway in front of an echo server and
+ping-pong `--messages` payloads, while one more station connects and hangs
+up as fast as it can for the whole run. The "open" case admits everything;
+the "limited" case allows `--max-sessions` sessions, one per callsign, and
+`--callsign-rate` connects a second per callsign, queueing the overflow.
+Reported: gateway connections spawned, the well-behaved sessions' times,
+and the connections turned away.
+
+    python -m benchmarks.admission --stations 4 --max-sessions 4 --callsign-rate 0.5
+"""
+import argparse
+import statistics
+import time
+
+from gensio_modems.admission import Admission
+from gensio_modems.ax25 import AX25ListenerEvent
+from gensio_modems.gutils import IOEvent
+
+from .fakes import KissHub
+from .harness import EchoListener, PingPongClient, service_until, start_listener
+from .loopback import opener, tcp
+
+GATEWAY = "BENCH-1"
+LOOPER = "LOOP-1"
+
+
+def station(call, hub_port):
+    return opener(
+        lambda n: 'ax25(laddr={0},addr="0,{1},{0}"),kiss,{2}'.format(
+            call, GATEWAY, tcp(hub_port)
+        )
+    )
+
+
+class Looper(IOEvent):
+    """Hang up as soon as the link is up (or turned away), then reconnect."""
+
+    def __init__(self, connect):
+        super().__init__()
+        self.connect = connect
+        self.connects = 0
+        self.stopped = False
+
+    def start(self):
+        if self.stopped:
+            return
+        self.connects += 1
+        self.in_close = self.in_error = False
+        self.bufA.clear()
+        self.connect(self)
+
+    def open_done(self, io, err):
+        super().open_done(io, err)
+        if not err:
+            self.close(io)
+        elif not self.stopped:
+            self.start()
+
+    def close_done(self, io, wake_when_closed=True):
+        super().close_done(io, wake_when_closed)
+        self.start()
+
+
+def run_case(name, admission, echo, hub_port, args):
+    gateway = AX25ListenerEvent.from_gensio_str(
+        gensio_str="ax25(laddr={},extended=0),kiss,conacc,{}".format(
+            GATEWAY, tcp(hub_port)
+        ),
+        spawn_gensio_str=tcp(args.port),
+        admission=admission,
+    )
+    spawned = echo.accepted
+    looper = Looper(station(LOOPER, hub_port))
+    clients = [PingPongClient(args.size, args.messages) for _ in range(args.stations)]
+    started = time.monotonic()
+    times = {}
+    try:
+        looper.start()
+        for ix, client in enumerate(clients):
+            station("BENCH-{}".format(ix + 2), hub_port)(client)
+        service_until(
+            lambda: all(c.done or c.io is None for c in clients), timeout=args.timeout
+        )
+        for client in clients:
+            if client.done and not client.failed:
+                times[client] = time.monotonic() - started
+        looper.stopped = True
+        for client in clients:
+            if client.io is not None:
+                client.close(client.io)
+        service_until(
+            lambda: looper.io is None and all(c.io is None for c in clients),
+            timeout=30,
+        )
+    finally:
+        gateway.shutdown()
+    rejected = sum(admission.rejected.values()) if admission is not None else 0
+    print(
+        "{:>8}: {} gateway connections for {} loop connects, "
+        "{} of {} sessions ok, p50 {:.2f}s, {} turned away".format(
+            name,
+            echo.accepted - spawned,
+            looper.connects,
+            len(times),
+            args.stations,
+            statistics.median(times.values()) if times else float("nan"),
+            rejected,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stations", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=4)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--max-sessions", type=int, default=4)
+    parser.add_argument("--callsign-rate", type=float, default=0.5)
+    parser.add_argument("--queue", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=20000, help="first port to use")
+    args = parser.parse_args()
+
+    echo = start_listener(EchoListener(), tcp(args.port))
+    hub = start_listener(KissHub(), tcp(args.port + 1))
+    try:
+        run_case("open", None, echo, args.port + 1, args)
+        run_case(
+            "limited",
+            Admission(
+                max_sessions=args.max_sessions,
+                max_per_callsign=1,
+                callsign_rate=args.callsign_rate,
+                queue_size=args.queue,
+            ),
+            echo,
+            args.port + 1,
+            args,
+        )
+    finally:
+        hub.shutdown()
+        echo.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Microbenchmark: per-session address work when a station connects.
+
+Compares the old setup path (an address control call for the listener, one
+for the gateway command and one per RMS `callsign` read, each re-parsed and
+substituted through a fresh replacement dict) against one AX25Address per
+connection and a CommandTemplate compiled at startup.
+
+    python benchmarks/bench_ax25addr.py
+"""
+import argparse
+import time
+
+from gensio_modems.ax25 import AX25Address, CommandTemplate
+
+
+COMMAND = "stdio,/usr/local/bin/rmsgw -l debug -P %d %U"
+CALLSIGN_READS = 2  # RMS login reads `callsign` at least this often
+
+
+class FakeAX25IO:
+    """Answers address controls like an ax25 gensio would."""
+
+    def __init__(self):
+        self.controls = 0
+
+    def control(self, depth, get, option, data):
+        self.controls += 1
+        return "ax25:0,N0CALL-7,KF7HVM-10,WIDE1-1"
+
+
+def old_remote_addr(io):
+    addr = io.control(0, True, 0, b"")
+    gensio_name, _, addr_str = addr.partition(":")
+    addrs = addr_str.split(",")
+    return addrs[1] if len(addrs) > 1 else addrs[0]
+
+
+def old_substitution(io, command):
+    remote_addr = old_remote_addr(io)
+    remote_callsign = remote_addr.partition("-")[0]
+    replmap = {
+        "%d": "gax25",
+        "%U": remote_callsign.upper(),
+        "%u": remote_callsign.lower(),
+        "%S": remote_addr.upper(),
+        "%s": remote_addr.lower(),
+        "%P": "%%",
+        "%p": "%%",
+        "%R": "%%",
+        "%r": "%%",
+        "%%": "%%",
+    }
+    for find, repl in replmap.items():
+        if find in command:
+            command = command.replace(find, repl)
+    return command
+
+
+def session_old(io):
+    old_remote_addr(io).partition("-")[0]  # listener tracking
+    old_substitution(io, COMMAND)
+    for _ in range(CALLSIGN_READS):
+        old_remote_addr(io).partition("-")[0].encode("utf-8")
+
+
+def session_new(io, template=CommandTemplate(COMMAND)):
+    addr = AX25Address.from_io(io)
+    template.render(addr)
+    for _ in range(CALLSIGN_READS):
+        addr.callsign.encode("utf-8")
+
+
+def run(session, sessions):
+    io = FakeAX25IO()
+    start = time.perf_counter()
+    for _ in range(sessions):
+        session(io)
+    return time.perf_counter() - start, io.controls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200000)
+    args = parser.parse_args()
+    for name, session in (("old", session_old), ("cached", session_new)):
+        elapsed, controls = run(session, args.sessions)
+        print(
+            "{:>6}: {:.2f} us/session, {:.1f} address controls/session".format(
+                name, elapsed / args.sessions * 1e6, controls / args.sessions
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
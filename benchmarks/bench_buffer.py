@@ -0,0 +1,67 @@
+"""
+Microbenchmark: cost per byte of draining a backlog through partial writes.
+
+Compares the old `array.array` transfer buffer (copy the whole backlog on
+every write, then shift it down) against `gensio_modems.buffer.ChunkBuffer`.
+
+    python benchmarks/bench_buffer.py
+"""
+import argparse
+import array
+import time
+
+from gensio_modems.buffer import ChunkBuffer
+
+
+READ_SIZE = 1024  # bytes per simulated read_callback
+WRITE_SIZE = 256  # bytes accepted per simulated (partial) io.write
+
+
+def drain_array(backlog):
+    buf = array.array("B")
+    chunk = b"x" * READ_SIZE
+    for _ in range(backlog // READ_SIZE):
+        buf.extend(chunk)
+    start = time.perf_counter()
+    while buf:
+        data = buf.tobytes()
+        count = min(len(data), WRITE_SIZE)
+        buf[:] = buf[count:]
+    return time.perf_counter() - start
+
+
+def drain_chunk(backlog):
+    buf = ChunkBuffer()
+    chunk = b"x" * READ_SIZE
+    for _ in range(backlog // READ_SIZE):
+        buf.extend(chunk)
+    start = time.perf_counter()
+    while buf:
+        data = bytes(buf.peek())
+        count = min(len(data), WRITE_SIZE)
+        buf.consume(count)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        default="16384,65536,262144,1048576",
+        help="comma separated backlog sizes in bytes",
+    )
+    args = parser.parse_args()
+
+    print("{:>10} {:>14} {:>14}".format("backlog", "array ns/B", "chunk ns/B"))
+    for size in (int(s) for s in args.sizes.split(",")):
+        t_array = drain_array(size)
+        t_chunk = drain_chunk(size)
+        print(
+            "{:>10} {:>14.2f} {:>14.2f}".format(
+                size, t_array / size * 1e9, t_chunk / size * 1e9
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Microbenchmark: cost of recording one read into the capture journal.
+
+Each payload size is appended `--records` times to a journal in a
+temporary directory (wrapping the ring several times), reporting the time
+per record and the capture bandwidth. Compare with the per-read cost of
+the pipe itself in `benchmarks.loopback --capture`.
+
+    python benchmarks/bench_capture.py --size-mb 16
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from gensio_modems.capture import READ, Journal
+
+
+class Session:
+    capture_id = None
+    conn_id = 1
+
+
+def run(journal, payload, records):
+    ioev = Session()
+    start = time.perf_counter()
+    for _ in range(records):
+        journal.record(ioev, "io", READ, payload)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--sizes", default="64,1024,16384")
+    parser.add_argument("--size-mb", type=int, default=16, help="journal size")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = Journal(os.path.join(tmp, "capture.bin"), args.size_mb << 20)
+        for size in (int(s) for s in args.sizes.split(",")):
+            payload = os.urandom(size)
+            elapsed = run(journal, payload, args.records)
+            print(
+                "{:>6} bytes: {:.2f} us/record, {:.0f} MB/s ({} wraps)".format(
+                    size,
+                    elapsed / args.records * 1e6,
+                    size * args.records / elapsed / 1e6,
+                    journal.wraps,
+                )
+            )
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: connect/disconnect churn against a ListenerEvent.
+
+Opens `--count` loopback TCP connections in batches of `--batch`, waits for
+the listener to accept them, then closes them and waits for the listener to
+forget them. Finally measures a non-blocking `shutdown()` with `--batch`
+connections still open.
+
+    python benchmarks/bench_listener.py --count 5000 --batch 200
+"""
+import argparse
+import time
+
+import gensio
+
+from gensio_modems.gutils import IOEvent, ListenerEvent, osfuncs
+
+
+class BenchListener(ListenerEvent):
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        ioev = IOEvent()
+        ioev.io = io
+        self.track(ioev)
+        io.read_cb_enable(True)
+        return io
+
+
+class Client(IOEvent):
+    def __init__(self):
+        super().__init__()
+        self.opened = False
+
+    def open_done(self, io, err):
+        super().open_done(io, err)
+        self.opened = not err
+
+
+def service_until(waiter, predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark stalled")
+        waiter.service(10)
+
+
+def open_clients(port, count):
+    clients = []
+    for _ in range(count):
+        client = Client()
+        client.io = gensio.gensio(osfuncs(), "tcp,localhost,{}".format(port), client)
+        client.io.open(client)
+        clients.append(client)
+    return clients
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--port", type=int, default=18772)
+    args = parser.parse_args()
+
+    waiter = gensio.waiter(osfuncs())
+    listener = BenchListener()
+    listener.acc = gensio.gensio_accepter(
+        osfuncs(), "tcp,localhost,{}".format(args.port), listener
+    )
+    listener.acc.startup()
+
+    start = time.perf_counter()
+    for _ in range(args.count // args.batch):
+        expected = listener.accepted + args.batch
+        clients = open_clients(args.port, args.batch)
+        service_until(waiter, lambda: listener.accepted >= expected)
+        for client in clients:
+            client.close(client.io)
+        service_until(
+            waiter,
+            lambda: not listener.connections and all(c.io is None for c in clients),
+        )
+    elapsed = time.perf_counter() - start
+    print(
+        "churn: {} connections in {:.2f}s ({:.1f} us/connection)".format(
+            listener.accepted, elapsed, elapsed / max(listener.accepted, 1) * 1e6
+        )
+    )
+
+    expected = listener.accepted + args.batch
+    clients = open_clients(args.port, args.batch)
+    service_until(waiter, lambda: listener.accepted >= expected)
+    start = time.perf_counter()
+    listener.shutdown()
+    call_time = time.perf_counter() - start
+    service_until(waiter, lambda: listener.acc is None and not listener.connections)
+    print(
+        "shutdown: {} open connections, shutdown() returned in {:.2f}ms, "
+        "all closed in {:.2f}ms".format(
+            args.batch, call_time * 1e3, (time.perf_counter() - start) * 1e3
+        )
+    )
+    for client in clients:
+        if client.io is not None:
+            client.close(client.io)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+AX.25 frames on air with and without paclen write coalescing.
+
+An upstream "CMS" dribbles `--total` bytes to every session in
+`--segment`-byte writes, `--interval` seconds apart, like a busy server
+trickling out small TCP segments. A station connects to an
+AX25ListenerEvent gateway through a simulated KISS TNC (gensio_modems.sim)
+and reads until it has everything; the TNC's channel counts the frames and
+bytes each case put on air.
+
+    python -m benchmarks.coalesce --paclen 128 --segment 16 --bitrate 1200
+"""
+import argparse
+import time
+
+from gensio_modems import sim
+from gensio_modems.ax25 import AX25ListenerEvent
+from gensio_modems.gutils import IOEvent, ListenerEvent, TIMERS
+
+from .fakes import KissHub
+from .harness import service_until, start_listener
+from .loopback import opener, tcp
+
+GATEWAY = "BENCH-1"
+MYCALL = "BENCH-2"
+
+
+class DribbleSession(IOEvent):
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+        self.left = source.total
+
+    def send_next(self):
+        if self.io is None or not self.left:
+            return
+        size = min(self.source.segment, self.left)
+        self.left -= size
+        self.bufB.extend(b"x" * size)
+        self.io.write_cb_enable(True)
+        TIMERS.call_later(self.source.interval, self.send_next)
+
+
+class DribbleSource(ListenerEvent):
+    """Send every connection `total` bytes, `segment` bytes at a time."""
+
+    def __init__(self, total, segment, interval):
+        super().__init__()
+        self.total = total
+        self.segment = segment
+        self.interval = interval
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        session = DribbleSession(self)
+        session.io = io
+        self.track(session)
+        io.read_cb_enable(True)
+        session.send_next()
+        return io
+
+
+class Station(IOEvent):
+    def __init__(self, total):
+        super().__init__()
+        self.total = total
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        if self.elapsed is None and len(self.bufA) >= self.total:
+            self.elapsed = time.perf_counter() - self.started
+        return count
+
+
+def run_case(name, paclen, hub, ports, args):
+    gateway = AX25ListenerEvent.from_gensio_str(
+        gensio_str="ax25(laddr={},extended=0,max_write_size={}),kiss,conacc,{}".format(
+            GATEWAY, args.paclen, tcp(ports + 1)
+        ),
+        spawn_gensio_str=tcp(ports),
+        pipe_kwargs=dict(paclen=paclen, coalesce_delay=args.coalesce_delay),
+    )
+    channel = hub.channel
+    frames, sent = channel.frames, channel.bytes
+    station = Station(args.total)
+    try:
+        opener(
+            lambda n: 'ax25(laddr={0},addr="0,{1},{0}",extended=0),kiss,{2}'.format(
+                MYCALL, GATEWAY, tcp(ports + 1)
+            )
+        )(station)
+        service_until(
+            lambda: station.elapsed is not None or station.io is None,
+            timeout=args.timeout,
+        )
+        if station.elapsed is None:
+            raise RuntimeError("{}: session failed".format(name))
+        if station.io is not None:
+            station.close(station.io)
+        service_until(lambda: station.io is None, timeout=10)
+    finally:
+        gateway.shutdown()
+    frames = channel.frames - frames
+    sent = channel.bytes - sent
+    print(
+        "{:>10}: {} frames, {} bytes on air ({:.1f} per frame), "
+        "{:.2f}s, {:.0f} B/s".format(
+            name,
+            frames,
+            sent,
+            sent / frames,
+            station.elapsed,
+            args.total / station.elapsed,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--total", type=int, default=4096, help="bytes per session")
+    parser.add_argument("--segment", type=int, default=16, help="bytes per write")
+    parser.add_argument(
+        "--interval", type=float, default=0.005, help="seconds between writes"
+    )
+    parser.add_argument("--paclen", type=int, default=128)
+    parser.add_argument("--coalesce-delay", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--port", type=int, default=19700, help="first port to use")
+    sim.add_channel_arguments(parser)
+    args = parser.parse_args()
+
+    source = start_listener(
+        DribbleSource(args.total, args.segment, args.interval), tcp(args.port)
+    )
+    hub = start_listener(
+        KissHub(channel=sim.channel_from_args(args)), tcp(args.port + 1)
+    )
+    try:
+        run_case("immediate", None, hub, args.port, args)
+        run_case("coalesced", args.paclen, hub, args.port, args)
+    finally:
+        hub.shutdown()
+        source.shutdown()
+
+
+if __name__ == "__main__":
+    main()
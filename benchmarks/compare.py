@@ -0,0 +1,47 @@
+"""
+Compare two loopback benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import argparse
+import json
+
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        (r["scenario"], r["size"], r["concurrency"]): r for r in data["results"]
+    }
+
+
+def ratio(new, old):
+    return new / old if old else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    old, new = load(args.baseline), load(args.candidate)
+    print(
+        "{:<8} {:>7} {:>5} {:>10} {:>10} {:>10}".format(
+            "scenario", "size", "conc", "MB/s x", "p99 x", "cpu/MB x"
+        )
+    )
+    for key in sorted(old.keys() & new.keys()):
+        o, n = old[key], new[key]
+        print(
+            "{:<8} {:>7} {:>5} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                *key,
+                ratio(n["mb_per_s"], o["mb_per_s"]),
+                ratio(n["rtt_p99_ms"], o["rtt_p99_ms"]),
+                ratio(n["cpu_s_per_mb"], o["cpu_s_per_mb"]),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+VARA graceful disconnect against a slow fake modem.
+
+A station connects through the fake VARA, then the gateway side is closed so
+VaraControlEvent has to DISCONNECT the link. The fake modem delays (or never
+sends) DISCONNECTED, and while the disconnect is pending an unrelated pipe
+session keeps ping-ponging on the same selector; its round trip times show
+the event loop is not blocked.
+
+    ack    - DISCONNECTED arrives after --delay seconds
+    abort  - DISCONNECT is ignored, ABORT brings the link down
+    expire - the modem never answers, the link is dropped at the deadline
+
+    python -m benchmarks.disconnect --wait 4 --delay 1
+"""
+import argparse
+import time
+
+from gensio_modems import vara
+from gensio_modems.vara import VaraControlEvent
+
+from .fakes import FakeVara
+from .harness import (
+    EchoListener,
+    PingPongClient,
+    print_results,
+    run_clients,
+    service_until,
+    start_listener,
+)
+from .loopback import PipeListener, opener, tcp
+
+
+def modem_delays(case, delay):
+    """(disconnect_delay, abort_delay) for the fake modem."""
+    return {
+        "ack": (delay, 0),
+        "abort": (None, 0),
+        "expire": (None, None),
+    }[case]
+
+
+def run_case(case, port, echo_port, pipe_port, args):
+    disconnect_delay, abort_delay = modem_delays(case, args.delay)
+    modem = FakeVara(
+        port, disconnect_delay=disconnect_delay, abort_delay=abort_delay
+    )
+    control = VaraControlEvent.from_gensio_str(
+        gensio_str=tcp(port),
+        laddr="BENCH-1",
+        data_port=tcp(port + 1),
+        spawn=tcp(echo_port),
+    )
+    station = None
+    try:
+        service_until(lambda: modem.mycall and modem.data is not None, timeout=10)
+        station = PingPongClient(args.size, 1)
+        opener(lambda n: tcp(port + 2))(station)
+        service_until(lambda: station.done, timeout=10)
+
+        # the gateway going away makes the data pipe DISCONNECT the link
+        start = time.monotonic()
+        control.data_pipe.close_channel()
+        service_until(lambda: control.data_pipe.disconnecting, timeout=10)
+        pipe_result = run_clients(
+            opener(lambda n: tcp(pipe_port)), args.size, args.messages, 1
+        )
+        pipe_done = time.monotonic() - start
+        service_until(lambda: control.connected is None, timeout=args.wait + 10)
+        elapsed = time.monotonic() - start
+    finally:
+        if station is not None and station.io is not None:
+            station.close(station.io)
+        control.close()
+        service_until(lambda: control.io is None, timeout=10)
+        modem.shutdown()
+
+    pipe_result["scenario"] = "pipe during {} disconnect".format(case)
+    print_results([pipe_result])
+    sent = [c.split()[0] for c in modem.commands if c.split()[0] in ("DISCONNECT", "ABORT")]
+    print(
+        "{}: link down after {:.2f}s (commands: {}), other session finished "
+        "{} messages in {:.2f}s meanwhile".format(
+            case, elapsed, " ".join(sent), args.messages, pipe_done
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cases", default="ack,abort,expire")
+    parser.add_argument(
+        "--wait",
+        type=float,
+        default=4,
+        help="WAIT_FOR_DISCONNECT for the run (ABORT is sent at 90%%)",
+    )
+    parser.add_argument("--delay", type=float, default=1, help="DISCONNECTED delay, ack case")
+    parser.add_argument("--size", type=int, default=64)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--port", type=int, default=19300, help="first port to use")
+    args = parser.parse_args()
+
+    vara.WAIT_FOR_DISCONNECT = args.wait
+    echo = start_listener(EchoListener(), tcp(args.port))
+    pipe = start_listener(PipeListener(tcp(args.port)), tcp(args.port + 1))
+    port = args.port + 10
+    try:
+        for case in args.cases.split(","):
+            run_case(case, port, args.port, args.port + 1, args)
+            port += 10
+    finally:
+        pipe.shutdown()
+        echo.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Time to the CMS banner with one gateway versus a raced list of gateways.
+
+The station connects over AX.25 (through a simulated KISS TNC) or VARA (a
+simulated modem's station port) to a gateway that logs in to a fake CMS.
+The "single" case uses only the primary CMS, which waits `--slow` seconds
+before its prompt, like an overloaded server. The "failover" case lists a
+dead endpoint (nothing listening), the slow CMS and a healthy one, in that
+order: sessions race them `--stagger` seconds apart and the dead endpoint
+is skipped once it has failed.
+
+    python -m benchmarks.failover --scenario ax25 --sessions 10 --slow 5
+    python -m benchmarks.failover --scenario vara --stagger 0.5
+"""
+import argparse
+import time
+
+from gensio_modems import failover
+from gensio_modems.ax25 import AX25ListenerEvent
+from gensio_modems.gutils import IOEvent
+from gensio_modems.vara import VaraControlEvent
+
+from .fakes import FakeCMS, FakeVara, KissHub
+from .harness import percentile, service_until, start_listener
+from .loopback import opener, tcp
+
+GATEWAY = "BENCH-1"
+MYCALL = "BENCH-2"
+
+
+class BannerClient(IOEvent):
+    """Connect and record how long the CMS banner takes to arrive."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        if self.elapsed is None and b"CMS>" in self.bufA.tobytes():
+            self.elapsed = time.perf_counter() - self.started
+        return count
+
+
+def setup_ax25(ports, gateway):
+    hub = start_listener(KissHub(), tcp(ports))
+    listener = AX25ListenerEvent.from_gensio_str(
+        gensio_str="ax25(laddr={},extended=0),kiss,conacc,{}".format(
+            GATEWAY, tcp(ports)
+        ),
+        spawn_gensio_str="rms," + gateway,
+    )
+    connect = opener(
+        lambda n: 'ax25(laddr={0},addr="0,{1},{0}"),kiss,{2}'.format(
+            MYCALL, GATEWAY, tcp(ports)
+        )
+    )
+
+    def teardown():
+        listener.shutdown()
+        hub.shutdown()
+
+    return connect, listener.gateways, teardown
+
+
+def setup_vara(ports, gateway):
+    modem = FakeVara(ports, remote=MYCALL)
+    control = VaraControlEvent.from_gensio_str(
+        gensio_str=tcp(ports),
+        laddr=GATEWAY,
+        data_port=tcp(ports + 1),
+        spawn=gateway,
+        rms=True,
+        gateways=failover.gateway_set(gateway, rms=True),
+    )
+    service_until(lambda: modem.mycall and modem.data is not None, timeout=10)
+
+    def teardown():
+        control.close()
+        modem.shutdown()
+
+    return opener(lambda n: tcp(ports + 2)), control.gateways, teardown
+
+
+SCENARIOS = {"ax25": setup_ax25, "vara": setup_vara}
+
+
+def run(connect, args):
+    times = []
+    failed = 0
+    for _ in range(args.sessions):
+        client = BannerClient()
+        connect(client)
+        try:
+            service_until(
+                lambda: client.elapsed is not None or client.io is None,
+                timeout=args.timeout,
+            )
+        except TimeoutError:
+            pass
+        if client.elapsed is None:
+            failed += 1
+        else:
+            times.append(client.elapsed)
+        if client.io is not None:
+            client.close(client.io)
+            service_until(lambda: client.io is None, timeout=30)
+        deadline = time.monotonic() + args.gap
+        service_until(lambda: time.monotonic() >= deadline, timeout=args.gap + 10)
+    return sorted(times), failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="ax25")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--slow", type=float, default=5, help="slow CMS prompt delay")
+    parser.add_argument("--stagger", type=float, default=failover.DEFAULT_STAGGER)
+    parser.add_argument("--gap", type=float, default=0.5, help="seconds between sessions")
+    parser.add_argument("--timeout", type=float, default=60, help="per session")
+    parser.add_argument("--port", type=int, default=19900, help="first port to use")
+    args = parser.parse_args()
+
+    dead = tcp(args.port)  # nothing listens here
+    slow = start_listener(FakeCMS(prompt_delay=args.slow), tcp(args.port + 1))
+    fast = start_listener(FakeCMS(), tcp(args.port + 2))
+    cases = [
+        ("single", tcp(args.port + 1)),
+        ("failover", ";".join([dead, tcp(args.port + 1), tcp(args.port + 2)])),
+    ]
+    try:
+        for ports, (name, gateway) in zip(
+            range(args.port + 10, args.port + 100, 10), cases
+        ):
+            connect, gateways, teardown = SCENARIOS[args.scenario](ports, gateway)
+            if gateways is not None:
+                gateways.stagger = args.stagger
+            try:
+                times, failed = run(connect, args)
+            finally:
+                teardown()
+            print(
+                "{:>8}: banner p50 {:.1f}ms p99 {:.1f}ms, {} of {} failed".format(
+                    name,
+                    percentile(times, 50) * 1e3 if times else float("nan"),
+                    percentile(times, 99) * 1e3 if times else float("nan"),
+                    failed,
+                    args.sessions,
+                )
+            )
+            for endpoint in gateways.endpoints if gateways is not None else ():
+                print(
+                    "          {}: {} attempts, {} wins, {} failures".format(
+                        endpoint.gensio_str,
+                        endpoint.attempts,
+                        endpoint.wins,
+                        endpoint.failed,
+                    )
+                )
+    finally:
+        slow.shutdown()
+        fast.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Local stand-ins for the radio side (gensio_modems.sim with benchmark
+defaults) and for the Winlink CMS.
+"""
+from gensio_modems import sim
+from gensio_modems.gutils import IOEvent, ListenerEvent, TIMERS
+from gensio_modems.varaproto import LineFramer
+
+
+class KissHub(sim.KissTNC):
+    """
+    KISS-over-TCP "TNC" that delivers every frame to every other client,
+    `delay` seconds after it was sent, or over `channel` when given.
+
+    hub = start_listener(KissHub(), "tcp,localhost,8001")
+    """
+
+    def __init__(self, delay=0, channel=None):
+        super().__init__(channel or sim.Channel(latency=delay))
+
+
+class FakeVara(sim.VaraSim):
+    """
+    VaraSim with control port `port`, data port `port + 1` and station port
+    `port + 2`. `disconnect_delay` / `abort_delay` default to an immediate
+    disconnect, and the channel to a perfect one.
+    """
+
+    def __init__(
+        self, port, remote="N0CALL", disconnect_delay=0, abort_delay=0, channel=None
+    ):
+        self.port = port
+        super().__init__(
+            "tcp,localhost,{}".format(port),
+            "tcp,localhost,{}".format(port + 1),
+            station="tcp,localhost,{}".format(port + 2),
+            ether=sim.VaraEther(channel),
+            remote=remote,
+            disconnect_delay=disconnect_delay,
+            abort_delay=abort_delay,
+        )
+
+
+class FakeCMSSession(IOEvent):
+    """One telnet session: Callsign / Password prompts, then echo."""
+
+    def __init__(self, cms):
+        super().__init__()
+        self.cms = cms
+        self.framer = LineFramer()
+        self.state = "connecting"
+        self.callsign = None
+
+    def get_read_buffer(self, io):
+        return self.framer if self.state != "echo" else self.bufA
+
+    def prompt(self):
+        if self.io is None:
+            return
+        self.state = "callsign"
+        self.send(b"Callsign :\r\n")
+
+    def send(self, data):
+        self.bufB.extend(data)
+        self.io.write_cb_enable(True)
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        if self.state == "echo":
+            if self.bufA:
+                self.send(self.bufA.tobytes())
+                self.bufA.clear()
+            return count
+        for line in self.framer.lines():
+            if self.state == "callsign":
+                self.callsign = line.strip()
+                self.state = "password"
+                self.send(b"Password :\r\n")
+            elif self.state == "password":
+                self.state = "echo"
+                self.cms.logins += 1
+                self.send(self.cms.banner)
+        return count
+
+
+class FakeCMS(ListenerEvent):
+    """
+    Stand-in for the Winlink CMS telnet port: `Callsign :` and `Password :`
+    prompts (the first one after `prompt_delay` seconds, like a slow
+    uplink), then a banner, then everything is echoed.
+
+    cms = start_listener(FakeCMS(prompt_delay=0.5), "tcp,localhost,8772")
+    """
+
+    banner = b"[WL2K-5.0-B2FWIHJM$]\r\nCMS>\r\n"
+
+    def __init__(self, prompt_delay=0):
+        super().__init__()
+        self.prompt_delay = prompt_delay
+        self.logins = 0
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        session = FakeCMSSession(self)
+        session.io = io
+        self.track(session)
+        io.read_cb_enable(True)
+        if self.prompt_delay:
+            TIMERS.call_later(self.prompt_delay, session.prompt)
+        else:
+            session.prompt()
+        return io
@@ -0,0 +1,195 @@
+"""
+Shared pieces for the loopback benchmarks: echo endpoint, ping-pong clients
+and result collection.
+"""
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+
+import gensio
+
+from gensio_modems.gutils import IOEvent, ListenerEvent, TIMERS, osfuncs
+
+
+class EchoEvent(IOEvent):
+    """Write back everything that is read."""
+
+    def get_write_buffer(self, io):
+        return self.get_read_buffer(io)
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        if self.bufA and self.io is not None:
+            self.io.write_cb_enable(True)
+        return count
+
+
+class EchoListener(ListenerEvent):
+    """Stand-in for the gateway (CMS): echoes every connection."""
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        ioev = EchoEvent()
+        ioev.io = io
+        self.track(ioev)
+        io.read_cb_enable(True)
+        return io
+
+
+def start_listener(listener, gensio_str):
+    listener.acc = gensio.gensio_accepter(osfuncs(), gensio_str, listener)
+    listener.acc.startup()
+    return listener
+
+
+class PingPongClient(IOEvent):
+    """
+    Send `messages` payloads of `size` bytes one at a time, waiting for each
+    to be echoed back in full, recording the round trip time.
+    """
+
+    def __init__(self, size, messages):
+        super().__init__()
+        self.size = size
+        self.messages = messages
+        self.payload = os.urandom(size)
+        self.rtts = []
+        self.received = 0
+        self.sent_at = None
+        self.failed = False
+
+    @property
+    def done(self):
+        return self.failed or len(self.rtts) >= self.messages
+
+    def send_next(self):
+        self.received = 0
+        self.sent_at = time.perf_counter()
+        self.bufB.extend(self.payload)
+        self.io.write_cb_enable(True)
+
+    def open_done(self, io, err):
+        super().open_done(io, err)
+        if err:
+            self.failed = True
+            return
+        self.send_next()
+
+    def read_callback(self, io, err, data, auxdata):
+        if err:
+            self.failed = not self.done
+            return super().read_callback(io, err, data, auxdata)
+        # the payload is random, so only the byte count is checked
+        self.received += len(data)
+        if self.received >= self.size and self.sent_at is not None:
+            self.rtts.append(time.perf_counter() - self.sent_at)
+            self.sent_at = None
+            if not self.done:
+                self.send_next()
+        return len(data)
+
+
+def service_until(predicate, timeout=60, waiter=None):
+    waiter = waiter or gensio.waiter(osfuncs())
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("benchmark stalled")
+        waiter.service(10)
+        TIMERS.run_due()
+
+
+def run_clients(
+    connect, size, messages, concurrency, timeout=300, client_class=PingPongClient
+):
+    """
+    Run `concurrency` PingPongClients; `connect(client)` must create and open
+    the client's gensio. Returns a result dict.
+    """
+    clients = [client_class(size, messages) for _ in range(concurrency)]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for client in clients:
+        connect(client)
+    service_until(lambda: all(c.done for c in clients), timeout=timeout)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    for client in clients:
+        if client.io is not None:
+            client.close(client.io)
+    service_until(lambda: all(c.io is None for c in clients), timeout=10)
+
+    rtts = sorted(r for c in clients for r in c.rtts)
+    # each message crosses the pipe twice (there and back)
+    megabytes = 2 * size * len(rtts) / 1e6
+    return {
+        "size": size,
+        "concurrency": concurrency,
+        "messages": len(rtts),
+        "failed_clients": sum(c.failed for c in clients),
+        "seconds": elapsed,
+        "mb_per_s": megabytes / elapsed if elapsed else 0,
+        "rtt_p50_ms": percentile(rtts, 50) * 1e3,
+        "rtt_p99_ms": percentile(rtts, 99) * 1e3,
+        "cpu_s_per_mb": cpu / megabytes if megabytes else 0,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method="inclusive")[
+        min(max(pct - 1, 0), 98)
+    ]
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=False,
+        ).stdout.strip()
+    except OSError:
+        revision = ""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "gensio": str(getattr(gensio, "version", "")),
+        "revision": revision,
+        "timestamp": time.time(),
+    }
+
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+def print_results(results):
+    header = "{:<8} {:>7} {:>5} {:>9} {:>10} {:>10} {:>10} {:>10}".format(
+        "scenario", "size", "conc", "MB/s", "p50 ms", "p99 ms", "cpu s/MB", "rss KB"
+    )
+    print(header)
+    for r in results:
+        print(
+            "{:<8} {:>7} {:>5} {:>9.3f} {:>10.2f} {:>10.2f} {:>10.3f} {:>10}".format(
+                r["scenario"],
+                r["size"],
+                r["concurrency"],
+                r["mb_per_s"],
+                r["rtt_p50_ms"],
+                r["rtt_p99_ms"],
+                r["cpu_s_per_mb"],
+                r["peak_rss_kb"],
+            )
+        )
@@ -0,0 +1,123 @@
+"""
+Cold import time of gensio_modems modules, checked against a budget.
+
+Each module is imported in a fresh `python -X importtime` process; the
+median cumulative time over `--runs` imports is compared with BUDGETS_MS.
+Importing must also be free of side effects: no gensio selector allocated,
+no logging handlers installed, the parser-only modules must not pull in
+gensio at all, and the LEAN tools must leave the LAZY modules to their
+main(). Exits non-zero when a budget or check fails, so it can gate CI or a
+release.
+
+    python -m benchmarks.importtime --runs 5
+    python -m benchmarks.importtime --scale 2  # slow machine
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# module -> cumulative import budget in milliseconds (stdlib imports included)
+BUDGETS_MS = {
+    "gensio_modems.varaproto": 40,
+    "gensio_modems.expect": 40,
+    "gensio_modems.profiles": 40,
+    "gensio_modems.gutils": 50,
+    "gensio_modems.ax25": 70,
+    "gensio_modems.vara": 80,
+    "gensio_modems.proxy": 70,
+    "gensio_modems.sim": 70,
+}
+# modules with no gensio dependency
+PURE = ("gensio_modems.varaproto", "gensio_modems.expect", "gensio_modems.profiles")
+# modules only loaded when their feature is used, never by importing LEAN ones
+LAZY = (
+    "gensio_modems.aio",
+    "gensio_modems.metrics",
+    "gensio_modems.capture",
+    "gensio_modems.sim",
+    "gensio_modems.workers",
+    "gensio_modems.sockio",
+)
+LEAN = ("gensio_modems.ax25", "gensio_modems.proxy", "gensio_modems.vara")
+
+SIDE_EFFECTS = """
+import logging, sys
+import {module}
+gutils = sys.modules.get("gensio_modems.gutils")
+if gutils is not None and gutils._osfuncs is not None:
+    print("allocated a gensio selector")
+if logging.getLogger().handlers:
+    print("installed logging handlers")
+if {pure} and "gensio" in sys.modules:
+    print("imported gensio")
+for name in {lazy}:
+    if name in sys.modules:
+        print("imported " + name)
+"""
+
+
+def import_times(module):
+    """
+    Import `module` in a fresh interpreter: {imported module: cumulative
+    import time in ms}, for every module it imported.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    # import time: self [us] | cumulative | imported package
+    for line in proc.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1]) / 1e3
+    return times
+
+
+def import_ms(module):
+    """Cumulative import time of `module` in a fresh interpreter."""
+    times = import_times(module)
+    if module not in times:
+        raise RuntimeError("no importtime line for {}".format(module))
+    return times[module]
+
+
+def side_effects(module):
+    code = SIDE_EFFECTS.format(
+        module=module, pure=module in PURE, lazy=LAZY if module in LEAN else ()
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return proc.stdout.splitlines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply every budget by this"
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget in BUDGETS_MS.items():
+        budget *= args.scale
+        ms = statistics.median(import_ms(module) for _ in range(args.runs))
+        problems = side_effects(module)
+        if ms > budget:
+            problems.append("over budget")
+        failed = failed or bool(problems)
+        print(
+            "{:<26} {:6.1f}ms (budget {:.0f}ms) {}".format(
+                module, ms, budget, ", ".join(problems) or "ok"
+            )
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Offline evaluation of adaptive AX.25 link profiles against the KISS simulator.
+
+For each `--loss` rate, a station makes `--sessions` connections in a row
+through a simulated KISS TNC (gensio_modems.sim) to an AX25ListenerEvent
+gateway in front of an echo server, ping-ponging `--messages` payloads of
+`--size` bytes. The "static" case always uses the default profile, the
+"adaptive" case the one a ProfileStore learned from the sessions before,
+like the proxy with `--profiles`. Reported: failed sessions, session time,
+and bytes on air per payload byte (retransmissions and framing overhead).
+
+    python -m benchmarks.linkprofiles --loss 0,0.05,0.2 --bitrate 9600 --sessions 10
+"""
+import argparse
+import statistics
+import time
+
+from gensio_modems import sim
+from gensio_modems.ax25 import AX25ListenerEvent
+from gensio_modems.profiles import DEFAULT_LEVEL, LADDER, ProfileStore, tune_endpoint
+
+from .fakes import KissHub
+from .harness import EchoListener, PingPongClient, service_until, start_listener
+from .loopback import opener, tcp
+
+GATEWAY = "BENCH-1"
+MYCALL = "BENCH-2"
+
+
+def float_list(value):
+    return [float(v) for v in value.split(",") if v]
+
+
+def run_session(endpoint, args):
+    """One session; returns (failed, connect time, session time)."""
+    client = PingPongClient(args.size, args.messages)
+    started = time.monotonic()
+    opener(lambda n: endpoint)(client)
+    try:
+        service_until(lambda: client.done or client.io is None, timeout=args.timeout)
+    except TimeoutError:
+        client.failed = True
+    failed = client.failed or not client.done
+    if client.io is not None:
+        client.close(client.io)
+        try:
+            service_until(lambda: client.io is None, timeout=30)
+        except TimeoutError:
+            pass
+    rtt = None if client.opened_at is None else client.opened_at - started
+    return failed, rtt, time.monotonic() - started
+
+
+def run_case(name, loss, profiles, echo_port, hub_port, args):
+    channel = sim.Channel(
+        bitrate=args.bitrate,
+        latency=args.latency,
+        loss=loss,
+        turnaround=args.turnaround,
+        seed=args.seed,
+    )
+    hub = start_listener(KissHub(channel=channel), tcp(hub_port))
+    gateway = AX25ListenerEvent.from_gensio_str(
+        gensio_str="ax25(laddr={},extended=1),kiss,conacc,{}".format(
+            GATEWAY, tcp(hub_port)
+        ),
+        spawn_gensio_str=tcp(echo_port),
+    )
+    endpoint = 'ax25(laddr={0},addr="0,{1},{0}"),kiss,{2}'.format(
+        MYCALL, GATEWAY, tcp(hub_port)
+    )
+    failures = 0
+    times = []
+    try:
+        for _ in range(args.sessions):
+            if profiles is None:
+                profile = LADDER[DEFAULT_LEVEL]
+            else:
+                profile = profiles.profile_for(GATEWAY)
+            failed, rtt, duration = run_session(tune_endpoint(endpoint, profile), args)
+            failures += failed
+            if not failed:
+                times.append(duration)
+            if profiles is not None:
+                profiles.observe(
+                    GATEWAY,
+                    failed=failed,
+                    rtt=rtt,
+                    size=2 * args.size * args.messages,
+                    duration=duration,
+                )
+    finally:
+        gateway.shutdown()
+        hub.shutdown()
+    payload = 2 * args.size * args.messages * (args.sessions - failures)
+    print(
+        "loss {:<5g} {:>8}: {} of {} failed, session p50 {:.2f}s, "
+        "{:.2f} bytes on air per payload byte{}".format(
+            loss,
+            name,
+            failures,
+            args.sessions,
+            statistics.median(times) if times else float("nan"),
+            channel.bytes / payload if payload else float("nan"),
+            "" if profiles is None else ", ended at {}".format(profile),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--loss", type=float_list, default=[0.0, 0.05, 0.2])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=4)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--bitrate", type=float, default=9600)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--turnaround", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=300, help="per session")
+    parser.add_argument("--port", type=int, default=19800, help="first port to use")
+    args = parser.parse_args()
+
+    echo = start_listener(EchoListener(), tcp(args.port))
+    # a hub port per case, the previous one may still be shutting down
+    hub_port = args.port
+    try:
+        for loss in args.loss:
+            for name, profiles in (("static", None), ("adaptive", ProfileStore())):
+                hub_port += 1
+                run_case(name, loss, profiles, args.port, hub_port, args)
+    finally:
+        echo.shutdown()
+
+
+if __name__ == "__main__":
+    main()
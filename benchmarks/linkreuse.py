@@ -0,0 +1,121 @@
+"""
+Telnet proxy session setup with and without AX.25 link reuse.
+
+A telnet client logs in to the proxy (sending the gateway callsign as the
+password), sends one message and waits for the echo, then hangs up, like a
+`pat` poll. The proxy reaches an AX25ListenerEvent "gateway" through a local
+KISS hub that delays every frame by `--frame-delay` seconds, standing in for
+the RF round trip of the SABM/UA exchange.
+
+    python -m benchmarks.linkreuse --sessions 10 --frame-delay 0.2
+"""
+import argparse
+import time
+
+from gensio_modems.ax25 import AX25ListenerEvent
+from gensio_modems.gutils import IOEvent
+from gensio_modems.proxy import LinkCache, ProxyListener
+
+from .fakes import KissHub
+from .harness import EchoListener, percentile, service_until, start_listener
+from .loopback import opener, tcp
+
+GATEWAY = "BENCH-1"
+MYCALL = "BENCH-2"
+
+
+class PollClient(IOEvent):
+    """Answer the password prompt with the gateway, then one ping-pong."""
+
+    def __init__(self, size):
+        super().__init__()
+        self.payload = b"x" * (size - 1) + b"\r"
+        self.started = time.perf_counter()
+        self.logged_in = False
+        self.elapsed = None
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        if err:
+            return count
+        if not self.logged_in and b"Password :" in self.bufA.tobytes():
+            self.logged_in = True
+            self.bufA.clear()
+            self.bufB.extend(GATEWAY.encode("ascii") + b"\r" + self.payload)
+            io.write_cb_enable(True)
+        elif self.logged_in and len(self.bufA) >= len(self.payload):
+            self.elapsed = time.perf_counter() - self.started
+        return count
+
+
+def run(port, args):
+    connect = opener(lambda n: tcp(port))
+    times = []
+    for _ in range(args.sessions):
+        client = PollClient(args.size)
+        connect(client)
+        service_until(lambda: client.elapsed is not None or client.io is None, timeout=60)
+        if client.elapsed is None:
+            raise RuntimeError("session failed")
+        times.append(client.elapsed)
+        client.close(client.io)
+        service_until(lambda: client.io is None, timeout=10)
+        deadline = time.monotonic() + args.gap
+        service_until(lambda: time.monotonic() >= deadline, timeout=args.gap + 10)
+    return sorted(times)
+
+
+def start_proxy(port, hub_port, links):
+    endpoint = 'ax25(laddr={0},addr="0,%0,{0}",extended=0),kiss,{1}'.format(
+        MYCALL, tcp(hub_port)
+    )
+    return start_listener(
+        ProxyListener(endpoint, require_creds=1, links=links), tcp(port)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--frame-delay", type=float, default=0.2)
+    parser.add_argument("--idle", type=float, default=30, help="link reuse idle window")
+    parser.add_argument("--size", type=int, default=64)
+    parser.add_argument("--gap", type=float, default=0.5, help="seconds between sessions")
+    parser.add_argument("--port", type=int, default=19500, help="first port to use")
+    args = parser.parse_args()
+
+    echo = start_listener(EchoListener(), tcp(args.port))
+    hub = start_listener(KissHub(delay=args.frame_delay), tcp(args.port + 1))
+    gateway = AX25ListenerEvent.from_gensio_str(
+        gensio_str="ax25(laddr={},extended=0),kiss,conacc,{}".format(
+            GATEWAY, tcp(args.port + 1)
+        ),
+        spawn_gensio_str=tcp(args.port),
+    )
+    links = LinkCache(args.idle)
+    cases = [
+        ("fresh", start_proxy(args.port + 2, args.port + 1, None)),
+        ("reused", start_proxy(args.port + 3, args.port + 1, links)),
+    ]
+    try:
+        for port, (name, proxy) in enumerate(cases, args.port + 2):
+            times = run(port, args)
+            print(
+                "{:>6}: login to echo p50 {:.1f}ms p99 {:.1f}ms over {} sessions".format(
+                    name,
+                    percentile(times, 50) * 1e3,
+                    percentile(times, 99) * 1e3,
+                    len(times),
+                )
+            )
+        print("links: {} parked, {} reused".format(links.parked, links.reused))
+    finally:
+        for name, proxy in cases:
+            proxy.shutdown()
+        gateway.shutdown()
+        hub.shutdown()
+        echo.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Loopback throughput / latency benchmarks.
+
+Scenarios (all on localhost, no radio or internet needed):
+
+    pipe - tcp client -> ListenerEvent + PipeEvent -> echo server
+    ax25 - ax25 client -> KISS hub -> AX25ListenerEvent -> echo server
+    vara - "station" -> fake VARA modem -> VaraControlEvent -> echo server
+    proxy - telnet client -> ProxyListener (password = echo port) -> echo server
+    rms  - ax25 client -> KISS hub -> AX25ListenerEvent -> RMS login -> fake
+           CMS (which echoes once logged in)
+
+    python -m benchmarks.loopback --sizes 64,1024,16384 --concurrency 1,8 \\
+        --output results.json
+    python -m benchmarks.compare old.json results.json
+
+`--capture FILE` records the gateway side pipes (not the benchmark's own
+clients and echo server) to a capture journal, to measure its overhead.
+"""
+import argparse
+import functools
+
+import gensio
+
+from gensio_modems.ax25 import AX25ListenerEvent
+from gensio_modems.capture import Journal
+from gensio_modems.gutils import IOEvent, ListenerEvent, PipeEvent, osfuncs
+from gensio_modems.proxy import CRED_PROMPTS, ProxyListener
+from gensio_modems.vara import VaraControlEvent
+
+from .fakes import FakeCMS, FakeVara, KissHub
+from .harness import (
+    EchoListener,
+    PingPongClient,
+    print_results,
+    run_clients,
+    save_results,
+    service_until,
+    start_listener,
+)
+
+
+class PipeListener(ListenerEvent):
+    def __init__(self, spawn):
+        super().__init__()
+        self.spawn = spawn
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        ioev = PipeEvent()
+        ioev.io = io
+        self.track(ioev)
+        ioev.io2 = gensio.gensio(osfuncs(), self.spawn, ioev)
+        ioev.io2.open(ioev)
+        io.write_cb_enable(True)
+        io.read_cb_enable(True)
+        return io
+
+
+class PromptClient(PingPongClient):
+    """
+    Wait for `prompt` from the gateway, answering it with `answer` (if any),
+    before starting the ping-pong.
+    """
+
+    def __init__(self, size, messages, prompt, answer=None):
+        super().__init__(size, messages)
+        self.prompt = prompt
+        self.answer = answer
+        self.preamble = bytearray()
+
+    def open_done(self, io, err):
+        if err:
+            return super().open_done(io, err)
+        # the first send_next waits for the prompt
+        IOEvent.open_done(self, io, err)
+
+    def read_callback(self, io, err, data, auxdata):
+        if self.preamble is None or err:
+            return super().read_callback(io, err, data, auxdata)
+        self.preamble += data
+        if self.prompt in self.preamble:
+            self.preamble = None
+            if self.answer is not None:
+                self.bufB.extend(self.answer + b"\r")
+            self.send_next()
+        return len(data)
+
+
+def tcp(port):
+    return "tcp,localhost,{}".format(port)
+
+
+def opener(gensio_str_for):
+    """Return a `connect(client)` callback for run_clients."""
+    count = [0]
+
+    def connect(client):
+        count[0] += 1
+        client.io = gensio.gensio(osfuncs(), gensio_str_for(count[0]), client)
+        client.io.open(client)
+
+    return connect
+
+
+def setup_pipe(ports, echo):
+    front = start_listener(PipeListener(tcp(echo)), tcp(ports))
+    return opener(lambda n: tcp(ports)), front.shutdown
+
+
+def setup_ax25(ports, echo, spawn=None):
+    hub = start_listener(KissHub(), tcp(ports))
+    gateway = AX25ListenerEvent.from_gensio_str(
+        gensio_str="ax25(laddr=BENCH-1,extended=0),kiss,conacc,{}".format(tcp(ports)),
+        spawn_gensio_str=spawn or tcp(echo),
+    )
+
+    def client_str(n):
+        call = "BN{:04d}".format(n)
+        return 'ax25(laddr={0},addr="0,BENCH-1,{0}"),kiss,{1}'.format(call, tcp(ports))
+
+    def teardown():
+        gateway.shutdown()
+        hub.shutdown()
+
+    return opener(client_str), teardown
+
+
+def setup_vara(ports, echo):
+    modem = FakeVara(ports)
+    control = VaraControlEvent.from_gensio_str(
+        gensio_str=tcp(ports),
+        laddr="BENCH-1",
+        data_port=tcp(ports + 1),
+        spawn=tcp(echo),
+    )
+    service_until(lambda: modem.mycall and modem.data is not None, timeout=10)
+
+    def teardown():
+        control.close()
+        modem.shutdown()
+
+    return opener(lambda n: tcp(ports + 2)), teardown
+
+
+def setup_proxy(ports, echo):
+    front = start_listener(ProxyListener(tcp("%0")), tcp(ports))
+    return opener(lambda n: tcp(ports)), front.shutdown
+
+
+def setup_rms(ports, echo):
+    cms = start_listener(FakeCMS(), tcp(ports + 1))
+    connect, teardown = setup_ax25(ports, echo, spawn="rms," + tcp(ports + 1))
+
+    def teardown_all():
+        teardown()
+        cms.shutdown()
+
+    return connect, teardown_all
+
+
+SCENARIOS = {
+    "pipe": setup_pipe,
+    "ax25": setup_ax25,
+    "vara": setup_vara,
+    "proxy": setup_proxy,
+    "rms": setup_rms,
+}
+# VARA carries a single session at a time
+MAX_CONCURRENCY = {"vara": 1}
+
+
+def client_class(name, echo):
+    """The client for scenario `name`, called with (size, messages)."""
+    if name == "proxy":
+        # the proxy's endpoint is %0, so the password picks the echo server
+        return functools.partial(
+            PromptClient, prompt=CRED_PROMPTS[1], answer=str(echo).encode("ascii")
+        )
+    if name == "rms":
+        # the gateway answers the CMS prompts, the station only sees the banner
+        return functools.partial(PromptClient, prompt=FakeCMS.banner)
+    return PingPongClient
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", default="pipe,ax25,vara,proxy,rms")
+    parser.add_argument("--sizes", type=int_list, default=[64, 1024, 16384])
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--port", type=int, default=19000, help="first port to use")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--capture", help="capture the gateway pipes to this journal")
+    args = parser.parse_args()
+    if args.capture:
+        PipeEvent.capture = Journal(args.capture)
+
+    echo = start_listener(EchoListener(), tcp(args.port))
+    results = []
+    port = args.port + 1
+    for name in args.scenarios.split(","):
+        connect, teardown = SCENARIOS[name](port, args.port)
+        port += 10
+        try:
+            for concurrency in args.concurrency:
+                concurrency = min(concurrency, MAX_CONCURRENCY.get(name, concurrency))
+                for size in args.sizes:
+                    result = run_clients(
+                        connect,
+                        size,
+                        args.messages,
+                        concurrency,
+                        client_class=client_class(name, args.port),
+                    )
+                    result["scenario"] = name
+                    results.append(result)
+                    print_results([result])
+        finally:
+            teardown()
+    echo.shutdown()
+
+    print()
+    print_results(results)
+    if args.output:
+        save_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Time to the CMS banner with and without a pre-connected upstream pool.
+
+Sessions arrive over tcp (standing in for AX.25/VARA) at a listener that
+pipes them to a fake CMS, logging in on the user's behalf. The fake CMS
+waits `--prompt-delay` seconds before its `Callsign :` prompt, like a slow
+uplink; with `--pool-size` the prompt has usually arrived before the session
+does.
+
+    python -m benchmarks.pool --sessions 20 --prompt-delay 0.3 --pool-size 2
+"""
+import argparse
+import time
+
+import gensio
+
+from gensio_modems.gutils import IOEvent, ListenerEvent, PipeEvent, osfuncs
+from gensio_modems.pool import UpstreamPool
+from gensio_modems.rmsgw import RMSGatewayLogin
+
+from .fakes import FakeCMS
+from .harness import percentile, service_until, start_listener
+from .loopback import opener, tcp
+
+
+class TcpRMSPipeEvent(RMSGatewayLogin, PipeEvent):
+    pass
+
+
+class RMSListener(ListenerEvent):
+    def __init__(self, gateway, pool=None):
+        super().__init__()
+        self.gateway = gateway
+        self.pool = pool
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        ioev = TcpRMSPipeEvent()
+        ioev.io = io
+        self.track(ioev)
+        if self.pool is None or not self.pool.attach(ioev):
+            ioev.io2 = gensio.gensio(osfuncs(), self.gateway, ioev)
+            ioev.io2.open(ioev)
+        io.write_cb_enable(True)
+        io.read_cb_enable(True)
+        return io
+
+
+class BannerClient(IOEvent):
+    """Connect and record how long the CMS banner takes to arrive."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        if self.elapsed is None and b"CMS>" in self.bufA.tobytes():
+            self.elapsed = time.perf_counter() - self.started
+        return count
+
+
+def run(listen_port, args):
+    connect = opener(lambda n: tcp(listen_port))
+    times = []
+    for _ in range(args.sessions):
+        client = BannerClient()
+        connect(client)
+        service_until(lambda: client.elapsed is not None, timeout=30)
+        times.append(client.elapsed)
+        client.close(client.io)
+        service_until(lambda: client.io is None, timeout=10)
+        # think time between sessions, also lets the pool refill
+        deadline = time.monotonic() + args.gap
+        service_until(lambda: time.monotonic() >= deadline, timeout=args.gap + 10)
+    return sorted(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--prompt-delay", type=float, default=0.3)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--gap", type=float, default=0.5, help="seconds between sessions")
+    parser.add_argument("--port", type=int, default=19400, help="first port to use")
+    args = parser.parse_args()
+
+    cms = start_listener(FakeCMS(prompt_delay=args.prompt_delay), tcp(args.port))
+    gateway = tcp(args.port)
+    pool = UpstreamPool(gateway, size=args.pool_size, ready_prompt=b"callsign").start()
+    service_until(lambda: pool.ready_count >= args.pool_size, timeout=30)
+    cases = [
+        ("fresh", start_listener(RMSListener(gateway), tcp(args.port + 1))),
+        ("pooled", start_listener(RMSListener(gateway, pool), tcp(args.port + 2))),
+    ]
+    try:
+        for port, (name, listener) in enumerate(cases, args.port + 1):
+            times = run(port, args)
+            print(
+                "{:>6}: banner p50 {:.1f}ms p99 {:.1f}ms over {} sessions".format(
+                    name,
+                    percentile(times, 50) * 1e3,
+                    percentile(times, 99) * 1e3,
+                    len(times),
+                )
+            )
+        print(
+            "pool: {} checkouts, {} misses, {} logins at the fake CMS".format(
+                pool.checkouts, pool.misses, cms.logins
+            )
+        )
+    finally:
+        pool.shutdown()
+        for name, listener in cases:
+            listener.shutdown()
+        cms.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,631 @@
+"""
+Replay recorded Winlink sessions through a gateway, for load testing.
+
+Each synthetic station plays the station side of a transcript through the
+gateway under test while a local fake CMS plays the CMS side, so both ends
+wait for what the other sent before it (by byte count) and then for the
+recorded think time, divided by `--speed` (1 is real time, 10 ten times
+faster, 0 as fast as possible). Received bytes are checked against the
+transcript.
+
+Transcripts come from a capture journal (`--capture` on the gateway, see
+gensio_modems.capture) or, without `--journal`, from a synthetic B2F
+exchange of `--messages` messages of `--size` bytes.
+
+    ax25  - stations -> KISS hub -> AX25ListenerEvent -> RMS login -> CMS
+    vara  - station -> fake VARA modem -> VaraControlEvent -> RMS login -> CMS
+    proxy - telnet stations -> ProxyListener -> KISS hub -> AX25ListenerEvent
+            -> RMS login -> CMS
+
+The KISS hub and VARA modem are gensio_modems.sim emulators, so
+`--bitrate`, `--latency`, `--loss` and `--turnaround` set the radio channel.
+
+    python -m benchmarks.replay --scenario ax25 --sessions 200 --concurrency 20 --speed 10
+    python -m benchmarks.replay --journal capture.bin --speed 1 --output replay.json
+    python -m benchmarks.replay --scenario vara --bitrate 2400 --latency 0.5 --loss 0.05
+"""
+import argparse
+import collections
+import random
+import re
+import time
+from typing import NamedTuple
+
+from gensio_modems import capture, sim
+from gensio_modems.ax25 import AX25ListenerEvent
+from gensio_modems.gutils import IOEvent, ListenerEvent, TIMERS
+from gensio_modems.proxy import CRED_PROMPTS, ProxyListener
+from gensio_modems.vara import VaraControlEvent
+
+from .fakes import FakeVara, KissHub
+from .harness import percentile, save_results, service_until, start_listener
+from .loopback import opener, tcp
+
+STATION = "station"
+CMS = "cms"
+GATEWAY = "BENCH-1"
+
+# the fake CMS's login, answered by the gateway's RMSGatewayLogin
+LOGIN_LINE = re.compile(rb"([^\r\n]*)\r?\n")
+
+
+class Event(NamedTuple):
+    t: float  # seconds from the start of the session
+    side: str  # STATION or CMS, whoever sent `data`
+    data: bytes
+
+
+class Transcript:
+    """The bytes each side of one session sent, and when."""
+
+    def __init__(self, events, name="synthetic"):
+        self.events = list(events)
+        self.name = name
+
+    @property
+    def duration(self):
+        return self.events[-1].t if self.events else 0.0
+
+    @classmethod
+    def from_records(cls, records, name):
+        """
+        Build a transcript from one gateway session's capture records: reads
+        from `io` were sent by the station, reads from `io2` by the CMS.
+        """
+        events = []
+        start = None
+        for rec in records:
+            if rec.kind != "read" or not rec.data:
+                continue
+            if start is None:
+                start = rec.timestamp
+            side = STATION if rec.side == "io" else CMS
+            events.append(Event(rec.timestamp - start, side, bytes(rec.data)))
+        return cls(events, name=name)
+
+    @classmethod
+    def from_journal(cls, path, sessions=None):
+        """Every session in the journal with data both ways (or just `sessions`)."""
+        by_session = collections.defaultdict(list)
+        for rec in capture.read_journal(path):
+            if sessions is None or rec.session in sessions:
+                by_session[rec.session].append(rec)
+        transcripts = []
+        for session, records in sorted(by_session.items()):
+            transcript = cls.from_records(records, name="{}#{}".format(path, session))
+            if {e.side for e in transcript.events} == {STATION, CMS}:
+                transcripts.append(transcript)
+        return transcripts
+
+    @classmethod
+    def synthetic_b2f(cls, messages=1, size=2048, think=0.5):
+        """A B2F-shaped exchange: the station sends `messages` messages."""
+        events = []
+        t = 0.0
+
+        def add(side, data, gap):
+            nonlocal t
+            t += gap
+            events.append(Event(t, side, data))
+
+        add(CMS, b"[WL2K-5.0-B2FWIHJM$]\r\n;PQ: 23753528\r\nCMS>\r\n", 0)
+        add(STATION, b"[RMS Express-1.7.0.0-B2FHM$]\r\n;PR: 72768415\r\n", think)
+        for n in range(messages):
+            proposal = "FC EM {:012d} {} {} 0\r".format(n, size, size).encode("ascii")
+            checksum = -sum(proposal) & 0xFF
+            add(STATION, proposal + b"F> %02X\r" % checksum, think / 10)
+            add(CMS, b"FS Y\r", think)
+            add(STATION, random.Random(n).randbytes(size), think / 10)
+        add(STATION, b"FF\r", think / 10)
+        add(CMS, b"FQ\r", think)
+        return cls(events)
+
+
+class ScriptStep(NamedTuple):
+    expect: int  # bytes from the other side to receive before sending
+    gap: float  # recorded seconds since the previous event
+    data: bytes
+
+
+def script_for(transcript, side):
+    """Return (steps, expected bytes from the other side) for `side`."""
+    steps = []
+    received = []
+    count = 0
+    last_t = transcript.events[0].t if transcript.events else 0.0
+    for event in transcript.events:
+        if event.side == side:
+            steps.append(ScriptStep(count, event.t - last_t, event.data))
+        else:
+            received.append(event.data)
+            count += len(event.data)
+        last_t = event.t
+    return steps, b"".join(received)
+
+
+class Player(IOEvent):
+    """
+    Plays one side of a transcript over `io`.
+
+    Bytes read before `play` is called go to `preamble` (logins); after,
+    they are checked against the transcript and release the next step.
+    """
+
+    def __init__(self, speed):
+        super().__init__()
+        self.speed = speed
+        self.steps = []
+        self.expected = b""
+        self.index = 0
+        self.received = 0
+        self.step_timer = None
+        self.started_at = None
+        self.finished_at = None
+        self.first_read_at = None
+        self.wait_started = None
+        # seconds from finishing a turn to receiving the other side's reply
+        self.responses = []
+        self.error = None
+
+    @property
+    def done(self):
+        return self.index >= len(self.steps) and self.received >= len(self.expected)
+
+    def play(self, transcript, side):
+        self.steps, self.expected = script_for(transcript, side)
+        self.started_at = time.monotonic()
+        self.advance()
+
+    def waiting_for(self):
+        """Bytes from the other side needed before the next step."""
+        if self.index < len(self.steps):
+            return self.steps[self.index].expect
+        return len(self.expected)
+
+    def advance(self):
+        while self.step_timer is None and self.index < len(self.steps):
+            step = self.steps[self.index]
+            if self.received < step.expect:
+                break
+            delay = step.gap / self.speed if self.speed else 0
+            if delay > 0:
+                self.step_timer = TIMERS.call_later(delay, self.send_due)
+                return
+            self.send_step()
+        if self.received < self.waiting_for() and self.wait_started is None:
+            self.wait_started = time.monotonic()
+        if self.done and self.finished_at is None:
+            self.finished_at = time.monotonic()
+            self.finished()
+
+    def send_step(self):
+        if self.io is None:
+            return
+        self.bufB.extend(self.steps[self.index].data)
+        self.io.write_cb_enable(True)
+        self.index += 1
+
+    def send_due(self):
+        self.step_timer = None
+        self.send_step()
+        self.advance()
+
+    def fail(self, reason):
+        if self.error is None:
+            self.error = reason
+        if self.step_timer is not None:
+            self.step_timer.cancel()
+            self.step_timer = None
+        if self.io is not None:
+            self.close(self.io)
+
+    def finished(self):
+        """Called once everything was sent and received."""
+
+    def preamble(self, data):
+        """Handle `data` read before `play`; returns the bytes consumed."""
+        return len(data)
+
+    def play_read(self, data):
+        end = self.received + len(data)
+        if self.expected[self.received : end] != data:
+            self.fail("mismatch: at byte {}".format(self.received))
+            return
+        now = time.monotonic()
+        if self.first_read_at is None:
+            self.first_read_at = now
+        self.received = end
+        if self.wait_started is not None and self.received >= self.waiting_for():
+            self.responses.append(now - self.wait_started)
+            self.wait_started = None
+        self.advance()
+
+    def read_callback(self, io, err, data, auxdata):
+        if err or not data:
+            if err and not self.done:
+                self.error = self.error or "closed early: {}".format(err)
+            return super().read_callback(io, err, data, auxdata)
+        if self.started_at is None:
+            return self.preamble(data)
+        if self.error is None:
+            self.play_read(bytes(data))
+        return len(data)
+
+
+class Station(Player):
+    """A synthetic station: optional login prompts, then its transcript."""
+
+    def __init__(self, replay, callsign, transcript, login=()):
+        super().__init__(replay.speed)
+        self.replay = replay
+        self.callsign = callsign
+        self.transcript = transcript
+        self.login = list(login)  # (prompt, answer) pairs
+        self.prompt = bytearray()
+        self.deadline = None
+
+    def open_done(self, io, err):
+        super().open_done(io, err)
+        if err:
+            self.error = "open failed: {}".format(err)
+            self.notify_closed()
+        elif not self.login:
+            self.play(self.transcript, STATION)
+
+    def preamble(self, data):
+        self.prompt += data
+        while self.login and self.login[0][0] in self.prompt:
+            prompt, answer = self.login.pop(0)
+            del self.prompt[: self.prompt.index(prompt) + len(prompt)]
+            self.bufB.extend(answer + b"\r")
+            self.io.write_cb_enable(True)
+        if not self.login:
+            rest = bytes(self.prompt)
+            self.prompt.clear()
+            self.play(self.transcript, STATION)
+            if rest:
+                self.play_read(rest)
+        return len(data)
+
+    def finished(self):
+        # hang up once the last bytes are written
+        self.close()
+
+    def expire(self):
+        self.deadline = None
+        self.fail("timeout")
+
+    def notify_closed(self):
+        if self.deadline is not None:
+            self.deadline.cancel()
+            self.deadline = None
+        super().notify_closed()
+        if self.replay is not None:
+            self.replay.station_closed(self)
+            self.replay = None
+
+
+class CMSSession(Player):
+    """The fake CMS end of one session: login, then the CMS transcript."""
+
+    def __init__(self, cms):
+        super().__init__(cms.speed)
+        self.cms = cms
+        self.login = bytearray()
+        self.callsign = None
+        self.logged_in = False
+
+    def start(self):
+        self.send_line(b"Callsign :")
+
+    def send_line(self, line):
+        self.bufB.extend(line + b"\r\n")
+        self.io.write_cb_enable(True)
+
+    def preamble(self, data):
+        self.login += data
+        while self.started_at is None:
+            match = LOGIN_LINE.search(self.login)
+            if match is None:
+                break
+            del self.login[: match.end()]
+            if self.callsign is None:
+                self.callsign = match.group(1).decode("ascii", "replace").strip()
+                self.send_line(b"Password :")
+                continue
+            transcript = self.cms.claim(self.callsign)
+            if transcript is None:
+                self.fail("unexpected: session from {}".format(self.callsign))
+                return len(data)
+            rest = bytes(self.login)
+            self.login.clear()
+            self.play(transcript, CMS)
+            if rest:
+                self.play_read(rest)
+        return len(data)
+
+    def notify_closed(self):
+        self.cms.session_closed(self)
+        super().notify_closed()
+
+
+class ReplayCMS(ListenerEvent):
+    """
+    Fake CMS telnet port playing the CMS side of expected sessions.
+
+    Sessions are matched by the callsign the gateway logs in with; gateways
+    that log in with their own callsign (VARA) get the oldest expected one.
+    """
+
+    def __init__(self, speed):
+        super().__init__()
+        self.speed = speed
+        self.expected = collections.OrderedDict()  # callsign -> Transcript
+        self.errors = {}  # callsign -> error, or None for a complete session
+
+    def expect(self, callsign, transcript):
+        self.expected[callsign] = transcript
+
+    def claim(self, callsign):
+        if callsign in self.expected:
+            return self.expected.pop(callsign)
+        if self.expected:
+            callsign, transcript = self.expected.popitem(last=False)
+            return transcript
+        return None
+
+    def session_closed(self, session):
+        if session.started_at is None:
+            return
+        error = session.error
+        if error is None and not session.done:
+            error = "incomplete"
+        self.errors[session.callsign] = None if error is None else "cms " + error
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        session = CMSSession(self)
+        session.io = io
+        self.track(session)
+        io.read_cb_enable(True)
+        session.start()
+        return io
+
+
+class Replay:
+    """Run `sessions` stations, at most `concurrency` at a time."""
+
+    def __init__(self, connect, cms, transcripts, sessions, concurrency, speed, timeout):
+        self.connect = connect
+        self.cms = cms
+        self.transcripts = transcripts
+        self.sessions = sessions
+        self.concurrency = concurrency
+        self.speed = speed
+        self.timeout = timeout
+        self.launched = 0
+        self.finished = []
+
+    def launch(self):
+        n = self.launched
+        self.launched += 1
+        callsign = "RP{:04d}".format(n % 10000)
+        transcript = self.transcripts[n % len(self.transcripts)]
+        self.cms.expect(callsign, transcript)
+        station = Station(self, callsign, transcript)
+        station.deadline = TIMERS.call_later(self.timeout, station.expire)
+        self.connect(station)
+
+    def station_closed(self, station):
+        self.finished.append(station)
+        if self.launched < self.sessions:
+            self.launch()
+
+    def run(self):
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for _ in range(min(self.concurrency, self.sessions)):
+            self.launch()
+        service_until(
+            lambda: len(self.finished) >= self.sessions,
+            timeout=self.timeout * self.sessions,
+        )
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        # let the gateway hang up the CMS side too
+        service_until(lambda: not len(self.cms.connections), timeout=30)
+        return self.result(elapsed, cpu)
+
+    def result(self, elapsed, cpu):
+        errors = collections.Counter()
+        connect, responses, durations = [], [], []
+        nbytes = 0
+        for station in self.finished:
+            error = station.error
+            if error is None and not station.done:
+                error = "incomplete"
+            error = error or self.cms.errors.get(station.callsign, "cms never connected")
+            if error is not None:
+                errors[error.partition(":")[0]] += 1
+                continue
+            nbytes += station.received + sum(len(s.data) for s in station.steps)
+            if station.opened_at is not None and station.first_read_at is not None:
+                connect.append(station.first_read_at - station.opened_at)
+            responses.extend(station.responses)
+            durations.append(station.finished_at - station.started_at)
+        connect.sort()
+        responses.sort()
+        durations.sort()
+        return {
+            "sessions": len(self.finished),
+            "concurrency": self.concurrency,
+            "speed": self.speed,
+            "failed": sum(errors.values()),
+            "failure_rate": sum(errors.values()) / len(self.finished),
+            "errors": dict(errors),
+            "seconds": elapsed,
+            "kb_per_s": nbytes / elapsed / 1e3 if elapsed else 0,
+            "sessions_per_s": len(self.finished) / elapsed if elapsed else 0,
+            "connect_p50_ms": percentile(connect, 50) * 1e3,
+            "connect_p99_ms": percentile(connect, 99) * 1e3,
+            "response_p50_ms": percentile(responses, 50) * 1e3,
+            "response_p99_ms": percentile(responses, 99) * 1e3,
+            "duration_p50_s": percentile(durations, 50),
+            "duration_p99_s": percentile(durations, 99),
+            "cpu_s": cpu,
+        }
+
+
+def ax25_station(hub_port):
+    def gensio_str(station):
+        return 'ax25(laddr={0},addr="0,{1},{0}"),kiss,{2}'.format(
+            station.callsign, GATEWAY, tcp(hub_port)
+        )
+
+    return gensio_str
+
+
+def start_ax25_gateway(hub_port, cms_port):
+    return AX25ListenerEvent.from_gensio_str(
+        gensio_str="ax25(laddr={},extended=0),kiss,conacc,{}".format(
+            GATEWAY, tcp(hub_port)
+        ),
+        spawn_gensio_str="rms," + tcp(cms_port),
+    )
+
+
+def setup_ax25(ports, cms_port, args):
+    hub = start_listener(KissHub(channel=sim.channel_from_args(args)), tcp(ports))
+    gateway = start_ax25_gateway(ports, cms_port)
+    gensio_str = ax25_station(ports)
+
+    def connect(station):
+        opener(lambda n: gensio_str(station))(station)
+
+    def teardown():
+        gateway.shutdown()
+        hub.shutdown()
+
+    return connect, teardown
+
+
+def setup_vara(ports, cms_port, args):
+    modem = FakeVara(ports, channel=sim.channel_from_args(args))
+    control = VaraControlEvent.from_gensio_str(
+        gensio_str=tcp(ports),
+        laddr=GATEWAY,
+        data_port=tcp(ports + 1),
+        spawn=tcp(cms_port),
+        rms=True,
+    )
+    service_until(lambda: modem.mycall and modem.data is not None, timeout=10)
+
+    def connect(station):
+        modem.remote = station.callsign
+        opener(lambda n: tcp(ports + 2))(station)
+
+    def teardown():
+        control.close()
+        modem.shutdown()
+
+    return connect, teardown
+
+
+def setup_proxy(ports, cms_port, args):
+    hub = start_listener(KissHub(channel=sim.channel_from_args(args)), tcp(ports))
+    gateway = start_ax25_gateway(ports, cms_port)
+    endpoint = 'ax25(laddr=%0,addr="0,%1,%0",extended=0),kiss,' + tcp(ports)
+    proxy = start_listener(ProxyListener(endpoint, require_creds=2), tcp(ports + 1))
+
+    def connect(station):
+        station.login = [
+            (CRED_PROMPTS[0], station.callsign.encode("ascii")),
+            (CRED_PROMPTS[1], GATEWAY.encode("ascii")),
+        ]
+        opener(lambda n: tcp(ports + 1))(station)
+
+    def teardown():
+        proxy.shutdown()
+        gateway.shutdown()
+        hub.shutdown()
+
+    return connect, teardown
+
+
+SCENARIOS = {
+    "ax25": setup_ax25,
+    "vara": setup_vara,
+    "proxy": setup_proxy,
+}
+# VARA carries a single session at a time
+MAX_CONCURRENCY = {"vara": 1}
+
+
+def int_set(value):
+    return {int(v) for v in value.split(",") if v}
+
+
+def print_result(r):
+    print(
+        "{scenario:<6} {sessions} sessions x{concurrency} at speed {speed:g}: "
+        "{failed} failed ({failure_rate:.1%}), {sessions_per_s:.2f} sessions/s, "
+        "{kb_per_s:.1f} kB/s".format(**r)
+    )
+    print(
+        "       connect p50 {connect_p50_ms:.1f}ms p99 {connect_p99_ms:.1f}ms, "
+        "response p50 {response_p50_ms:.1f}ms p99 {response_p99_ms:.1f}ms, "
+        "session p50 {duration_p50_s:.2f}s p99 {duration_p99_s:.2f}s".format(**r)
+    )
+    if r["errors"]:
+        print("       errors: {}".format(r["errors"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="ax25")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--speed", type=float, default=1, help="1 real time, N for Nx, 0 as fast as possible"
+    )
+    parser.add_argument("--journal", help="replay the sessions of this capture journal")
+    parser.add_argument(
+        "--journal-sessions", type=int_set, help="only these journal sessions"
+    )
+    parser.add_argument("--messages", type=int, default=2, help="synthetic messages")
+    parser.add_argument("--size", type=int, default=2048, help="synthetic message size")
+    parser.add_argument("--think", type=float, default=0.5, help="synthetic think time")
+    parser.add_argument("--timeout", type=float, default=300, help="per session")
+    parser.add_argument("--port", type=int, default=19600, help="first port to use")
+    parser.add_argument("--output", help="write JSON results to this file")
+    sim.add_channel_arguments(parser)
+    args = parser.parse_args()
+
+    if args.journal:
+        transcripts = Transcript.from_journal(args.journal, args.journal_sessions)
+        if not transcripts:
+            parser.error("no sessions with data both ways in {}".format(args.journal))
+    else:
+        transcripts = [Transcript.synthetic_b2f(args.messages, args.size, args.think)]
+    concurrency = min(args.concurrency, MAX_CONCURRENCY.get(args.scenario, args.concurrency))
+
+    cms = start_listener(ReplayCMS(args.speed), tcp(args.port))
+    connect, teardown = SCENARIOS[args.scenario](args.port + 1, args.port, args)
+    try:
+        replay = Replay(
+            connect, cms, transcripts, args.sessions, concurrency, args.speed, args.timeout
+        )
+        result = replay.run()
+    finally:
+        teardown()
+        cms.shutdown()
+    result["scenario"] = args.scenario
+    result["transcripts"] = [t.name for t in transcripts]
+    print_result(result)
+    if args.output:
+        save_results(args.output, [result])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import gensio
 
-from gensio_modems.gutils import ListenerEvent, OSFUNCS, PipeEvent
+from gensio_modems.gutils import ListenerEvent, PipeEvent, osfuncs
 
 
 class StdioPipeListener(ListenerEvent):
@@ -9,11 +9,11 @@ class StdioPipeListener(ListenerEvent):
         pev.io = super().new_connection(acc, io)
         pev.io.write_cb_enable(True)
         pev.io.read_cb_enable(True)
-        pev.io2 = gensio.gensio(OSFUNCS, "stdio(self)", pev)
+        pev.io2 = gensio.gensio(osfuncs(), "stdio(self)", pev)
         pev.io2.open(pev)
 
 
 listener = StdioPipeListener()
-listener.acc = gensio.gensio_accepter(OSFUNCS, "tcp,3334", listener)
+listener.acc = gensio.gensio_accepter(osfuncs(), "tcp,3334", listener)
 listener.acc.startup()
 listener.wait()
@@ -0,0 +1,19 @@
+import asyncio
+
+from gensio_modems.aio import start_server
+
+
+async def echo(reader, writer):
+    while data := await reader.read(1024):
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def main():
+    async with await start_server(echo, "tcp,3335"):
+        await asyncio.Event().wait()
+
+
+asyncio.run(main())
@@ -1,11 +1,11 @@
 import gensio
 
-from gensio_modems.gutils import PipeEvent, OSFUNCS
+from gensio_modems.gutils import PipeEvent, osfuncs
 
 
 p = PipeEvent()
-p.io = gensio.gensio(OSFUNCS, "tcp,localhost,3333", p)
+p.io = gensio.gensio(osfuncs(), "tcp,localhost,3333", p)
 p.io.open(p)
-p.io2 = gensio.gensio(OSFUNCS, "stdio(self)", p)
+p.io2 = gensio.gensio(osfuncs(), "stdio(self)", p)
 p.io2.open(p)
 p.wait()
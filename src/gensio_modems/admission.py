@@ -0,0 +1,346 @@
+"""
+Admission control for accepted connections.
+
+A burst of connects, or one station reconnecting in a loop, would otherwise
+get a session (and a gateway connection) each. An Admission set on a
+ListenerEvent decides, as each connection is accepted, whether to start its
+session now, queue it until a slot frees up, or turn it away with a "busy"
+banner:
+
+- rate limits: token buckets for the whole listener (`rate` / `burst`) and
+  for each callsign (`callsign_rate` / `callsign_burst`); a connection over
+  either is turned away at once, whatever the queue.
+- caps: at most `max_sessions` sessions, and `max_per_callsign` for each
+  callsign; a connection over a cap waits in the queue (up to `queue_size`
+  connections, `queue_timeout` seconds each) or is turned away.
+
+When a session closes, the queued connection from the callsign with the
+fewest sessions goes next, oldest first, so one busy station can't starve
+the others. Connections without a callsign (telnet) are only subject to the
+listener-wide limits.
+
+admission = Admission(max_sessions=20, max_per_callsign=2, callsign_rate=0.1)
+listener = AX25ListenerEvent.from_gensio_str(..., admission=admission)
+"""
+
+import time
+
+from .gutils import IOEvent, TIMERS
+from .logs import category_logger
+
+
+logger = category_logger("control", "admission")
+
+DEFAULT_QUEUE_TIMEOUT = 60  # seconds a connection may wait for a slot
+DEFAULT_BUSY_BANNER = "Busy, please retry later."
+# idle callsign buckets are dropped once there are more than this many
+MAX_BUCKETS = 1024
+
+REASONS = ("rate", "callsign_rate", "sessions", "callsign", "timeout", "shutdown")
+
+
+class TokenBucket:
+    """`rate` tokens a second, at most `burst` saved up; a connection takes one."""
+
+    def __init__(self, rate, burst=None, now=None):
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Held(IOEvent):
+    """An accepted connection waiting in the queue or being turned away."""
+
+    # the session records what was read while waiting, when it's replayed
+    capture = None
+
+    def __init__(self, admission, callsign, start=None):
+        super().__init__()
+        self.admission = admission
+        self.callsign = callsign
+        self.start = start
+        self.queued_at = time.monotonic()
+        self.timer = None
+
+    def notify_closed(self):
+        self.admission.released(self)
+
+
+class Admission:
+    """
+    Admission policy and queue for one ListenerEvent; see the module
+    docstring. 0 or None disables a limit.
+    """
+
+    def __init__(
+        self,
+        max_sessions=None,
+        max_per_callsign=None,
+        rate=None,
+        burst=None,
+        callsign_rate=None,
+        callsign_burst=None,
+        queue_size=0,
+        queue_timeout=DEFAULT_QUEUE_TIMEOUT,
+        busy_banner=DEFAULT_BUSY_BANNER,
+    ):
+        self.max_sessions = max_sessions
+        self.max_per_callsign = max_per_callsign
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.callsign_rate = callsign_rate
+        self.callsign_burst = callsign_burst
+        self.buckets = {}  # callsign -> TokenBucket
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.busy_banner = busy_banner
+        self.queue = []  # Held, oldest first
+        self.held = set()  # every Held, until its gensio is closed or handed over
+        # counters for metrics
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = dict.fromkeys(REASONS, 0)
+
+    def admit(self, listener, io, callsign, start):
+        """
+        Decide on the connection `io` just accepted by `listener`: call
+        `start()` to begin its session now or once dequeued (it returns the
+        session's IOEvent, which is given any bytes read while queued), or
+        send the busy banner and close it.
+        """
+        if listener.in_shutdown:
+            self.turn_away(Held(self, callsign), io, "shutdown")
+            return
+        now = time.monotonic()
+        reason = self.over_rate(callsign, now)
+        if reason is None:
+            reason = self.over_cap(listener, callsign)
+            if reason is None:
+                self.admitted += 1
+                start()
+                return
+            if self.queue_size and len(self.queue) < self.queue_size:
+                self.enqueue(Held(self, callsign, start), io)
+                return
+        self.turn_away(Held(self, callsign), io, reason)
+
+    def over_rate(self, callsign, now):
+        if self.bucket is not None and not self.bucket.take(now):
+            return "rate"
+        if callsign and self.callsign_rate:
+            bucket = self.buckets.get(callsign)
+            if bucket is None:
+                if len(self.buckets) >= MAX_BUCKETS:
+                    self.prune_buckets(now)
+                bucket = self.buckets[callsign] = TokenBucket(
+                    self.callsign_rate, self.callsign_burst, now
+                )
+            if not bucket.take(now):
+                return "callsign_rate"
+        return None
+
+    def prune_buckets(self, now):
+        """Forget the callsigns whose buckets have filled up again."""
+        for callsign, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[callsign]
+
+    def over_cap(self, listener, callsign):
+        if self.max_sessions and len(listener.connections) >= self.max_sessions:
+            return "sessions"
+        if (
+            callsign
+            and self.max_per_callsign
+            and len(listener.connections.by_callsign(callsign)) >= self.max_per_callsign
+        ):
+            return "callsign"
+        return None
+
+    def enqueue(self, held, io):
+        held.io = io
+        self.held.add(held)
+        self.queue.append(held)
+        self.queued += 1
+        held.timer = TIMERS.call_later(self.queue_timeout, self.expired, held)
+        logger.info("queued %s, %s waiting", held.callsign or io, len(self.queue))
+        # buffer what the station sends meanwhile, and notice it hanging up
+        io.read_cb_enable(True)
+
+    def expired(self, held):
+        held.timer = None
+        if held in self.queue:
+            self.queue.remove(held)
+            self.turn_away(held, held.io, "timeout")
+
+    def turn_away(self, held, io, reason):
+        self.rejected[reason] += 1
+        logger.warning("turning away %s: %s", held.callsign or io, reason)
+        if held.io is None:
+            held.io = io
+        self.held.add(held)
+        io.read_cb_enable(False)
+        if self.busy_banner:
+            held.bufB.extend(f"{self.busy_banner}\r\n".encode("utf-8"))
+        # writes the banner, then closes
+        held.close()
+
+    def released(self, held):
+        """`held`'s gensio is closed."""
+        if held.timer is not None:
+            held.timer.cancel()
+            held.timer = None
+        if held in self.queue:
+            self.queue.remove(held)
+        self.held.discard(held)
+
+    def next_waiting(self, listener):
+        """
+        The queued connection to start next, if a slot is free: of those
+        not over their callsign's cap, the one whose callsign has the fewest
+        sessions, oldest first.
+        """
+        if self.max_sessions and len(listener.connections) >= self.max_sessions:
+            return None
+        best = None
+        best_count = None
+        for held in self.queue:
+            if held.in_close:
+                continue  # hung up, released once closed
+            count = 0
+            if held.callsign:
+                count = len(listener.connections.by_callsign(held.callsign))
+                if self.max_per_callsign and count >= self.max_per_callsign:
+                    continue
+            if best is None or count < best_count:
+                best, best_count = held, count
+        return best
+
+    def session_closed(self, listener):
+        """A session of `listener` closed, start queued ones in its place."""
+        if listener.in_shutdown:
+            return
+        while self.queue:
+            held = self.next_waiting(listener)
+            if held is None:
+                return
+            self.start(held)
+
+    def start(self, held):
+        self.queue.remove(held)
+        self.held.discard(held)
+        if held.timer is not None:
+            held.timer.cancel()
+            held.timer = None
+        io = held.io
+        pending = held.bufA.tobytes()
+        held.io = None  # the session takes over io's callbacks
+        self.admitted += 1
+        logger.info(
+            "starting %s after %.1fs in the queue",
+            held.callsign or io,
+            time.monotonic() - held.queued_at,
+        )
+        session = held.start()
+        if pending and session is not None:
+            session.read_callback(io, None, pending, None)
+
+    def shutdown(self):
+        """Turn away everything still queued."""
+        queue, self.queue = self.queue, []
+        for held in queue:
+            if held.timer is not None:
+                held.timer.cancel()
+                held.timer = None
+            if held.io is not None:
+                self.turn_away(held, held.io, "shutdown")
+
+
+def add_admission_arguments(parser):
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=0,
+        help="Most concurrent sessions (0: no limit)",
+    )
+    parser.add_argument(
+        "--max-per-callsign",
+        type=int,
+        default=0,
+        help="Most concurrent sessions from one callsign (0: no limit)",
+    )
+    parser.add_argument(
+        "--accept-rate",
+        type=float,
+        default=0,
+        help="Connections accepted per second, averaged (0: no limit)",
+    )
+    parser.add_argument(
+        "--accept-burst",
+        type=float,
+        default=None,
+        help="Connections accepted at once before --accept-rate applies",
+    )
+    parser.add_argument(
+        "--callsign-rate",
+        type=float,
+        default=0,
+        help="Connections accepted per second from one callsign (0: no limit)",
+    )
+    parser.add_argument(
+        "--callsign-burst",
+        type=float,
+        default=None,
+        help="Connections from one callsign at once before --callsign-rate applies",
+    )
+    parser.add_argument(
+        "--queue",
+        type=int,
+        default=0,
+        help="Connections over --max-sessions / --max-per-callsign to hold "
+        "until a session ends (0: turn them away)",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=DEFAULT_QUEUE_TIMEOUT,
+        help="Turn away queued connections after this many seconds",
+    )
+    parser.add_argument(
+        "--busy-banner",
+        default=DEFAULT_BUSY_BANNER,
+        help="Text sent to connections that are turned away",
+    )
+
+
+def start_admission(args):
+    """An Admission for the limits given on the command line, or None."""
+    if not (
+        args.max_sessions
+        or args.max_per_callsign
+        or args.accept_rate
+        or args.callsign_rate
+    ):
+        return None
+    return Admission(
+        max_sessions=args.max_sessions,
+        max_per_callsign=args.max_per_callsign,
+        rate=args.accept_rate,
+        burst=args.accept_burst,
+        callsign_rate=args.callsign_rate,
+        callsign_burst=args.callsign_burst,
+        queue_size=args.queue,
+        queue_timeout=args.queue_timeout,
+        busy_banner=args.busy_banner,
+    )
@@ -0,0 +1,360 @@
+"""
+asyncio integration for gensio.
+
+The gensio selector is serviced from the running asyncio loop (no waiter
+thread), and gensios are exposed as asyncio StreamReader / StreamWriter
+style pairs.
+
+async def handle(reader, writer):
+    data = await reader.read(100)
+    writer.write(data)
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+server = await start_server(handle, "tcp,3333")
+reader, writer = await open_connection("tcp,localhost,3333")
+"""
+
+import asyncio
+
+import gensio
+
+from . import gutils
+from .buffer import ChunkBuffer
+from .logs import category_logger
+
+
+logger = category_logger("control", "aio")
+
+# how often the selector is polled once activity stops; the interval doubles
+# while nothing happens, up to MAX_IDLE_INTERVAL
+IDLE_INTERVAL = 0.01
+MAX_IDLE_INTERVAL = 0.2
+# StreamReader pauses gensio reads above 2 * limit buffered bytes
+DEFAULT_LIMIT = 64 * 1024
+# drain() returns once fewer bytes than this are waiting to be written
+DEFAULT_WRITE_LOW_WATER = 16 * 1024
+
+_drivers = {}
+
+
+class GensioLoopDriver:
+    """
+    Service the gensio selector from an asyncio event loop.
+
+    Each tick runs `waiter.service(0)` to dispatch ready gensio callbacks on
+    the loop thread; ticks are scheduled back to back while there is
+    activity and every `idle_interval` seconds once it stops, backing off
+    to `max_idle_interval` (or the next gutils timer, if sooner) while idle.
+    """
+
+    def __init__(
+        self,
+        loop,
+        osfuncs=None,
+        idle_interval=IDLE_INTERVAL,
+        max_idle_interval=MAX_IDLE_INTERVAL,
+    ):
+        self.loop = loop
+        self.osfuncs = osfuncs or gutils.osfuncs()
+        self.waiter = gensio.waiter(self.osfuncs)
+        self.idle_interval = idle_interval
+        self.max_idle_interval = max_idle_interval
+        self.interval = idle_interval  # until the next idle tick
+        self.handle = None
+        self.activity = False
+        self.users = 0  # open gensios / accepters relying on this driver
+
+    def start(self):
+        self.users += 1
+        if self.handle is None:
+            self.handle = self.loop.call_soon(self._tick)
+
+    def stop(self):
+        self.users -= 1
+        if self.users <= 0 and self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def kick(self):
+        """Note activity so the next tick comes immediately."""
+        self.activity = True
+        self.interval = self.idle_interval
+        if isinstance(self.handle, asyncio.TimerHandle):
+            self.handle.cancel()
+            self.handle = self.loop.call_soon(self._tick)
+
+    def _tick(self):
+        self.handle = None
+        self.activity = False
+        self.waiter.service(0)
+        gutils.TIMERS.run_due()
+        if self.users <= 0 or self.handle is not None:
+            return
+        if self.activity:
+            self.handle = self.loop.call_soon(self._tick)
+            return
+        delay = self.interval
+        self.interval = min(self.interval * 2, self.max_idle_interval)
+        timeout = gutils.TIMERS.next_timeout()
+        if timeout is not None:
+            delay = min(delay, timeout)
+        self.handle = self.loop.call_later(delay, self._tick)
+
+
+def get_driver(loop=None):
+    """Return the (shared) selector driver for `loop`."""
+    loop = loop or asyncio.get_running_loop()
+    driver = _drivers.get(loop)
+    if driver is None:
+        driver = _drivers[loop] = GensioLoopDriver(loop)
+    return driver
+
+
+class _ReadTransport:
+    """Lets asyncio.StreamReader apply backpressure to the gensio."""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def pause_reading(self):
+        if self.handler.io is not None:
+            self.handler.io.read_cb_enable(False)
+
+    def resume_reading(self):
+        if self.handler.io is not None:
+            self.handler.io.read_cb_enable(True)
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+class AsyncIOEvent:
+    """gensio callbacks feeding an asyncio StreamReader and GensioWriter."""
+
+    def __init__(self, driver, limit=DEFAULT_LIMIT):
+        self.driver = driver
+        self.io = None
+        self.reader = asyncio.StreamReader(limit=limit)
+        self.reader.set_transport(_ReadTransport(self))
+        self.writer = GensioWriter(self)
+        self.buf = ChunkBuffer()
+        self.opened = driver.loop.create_future()
+        self.closed = driver.loop.create_future()
+        self.drain_waiters = []
+        self.in_close = False
+        self.error = None
+
+    def attach(self, io):
+        self.io = io
+        io.set_cbs(self)
+
+    def read_callback(self, io, err, data, auxdata):
+        self.driver.kick()
+        if err:
+            if "remote end closed connection" not in str(err).lower():
+                self.error = ConnectionError(str(err))
+            self.reader.feed_eof()
+            self.io.read_cb_enable(False)
+            return 0
+        if data:
+            self.reader.feed_data(bytes(data))
+        return len(data)
+
+    def write_callback(self, io):
+        self.driver.kick()
+        if self.buf and self.error is None:
+            view = self.buf.peek()
+            try:
+                count = io.write(bytes(view), None)
+            except Exception as exc:
+                self.error = ConnectionError(str(exc))
+            else:
+                self.buf.consume(count)
+                if len(self.buf) < DEFAULT_WRITE_LOW_WATER:
+                    self._wake_drainers()
+        if self.error is not None:
+            # the connection is broken: drop what was never sent, fail the
+            # drainers and close rather than keep write callbacks coming
+            self.buf.clear()
+            self._wake_drainers()
+            self.in_close = True
+        if not self.buf:
+            io.write_cb_enable(False)
+            if self.in_close:
+                io.close(self)
+
+    def _wake_drainers(self):
+        waiters, self.drain_waiters = self.drain_waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    def open_done(self, io, err):
+        self.driver.kick()
+        if err:
+            self.opened.set_exception(ConnectionError(str(err)))
+            self.io = None
+            self.closed.set_result(None)
+            return
+        io.read_cb_enable(True)
+        self.opened.set_result(None)
+
+    def close(self):
+        if self.in_close or self.io is None:
+            return
+        self.in_close = True
+        # write_callback closes the gensio once the buffer is drained
+        self.io.write_cb_enable(True)
+        self.driver.kick()
+
+    def close_done(self, io):
+        self.io = None
+        self.reader.feed_eof()
+        self._wake_drainers()
+        if not self.closed.done():
+            self.closed.set_result(None)
+        self.driver.stop()
+
+
+class GensioWriter:
+    """The subset of asyncio.StreamWriter that makes sense for a gensio."""
+
+    def __init__(self, handler):
+        self._handler = handler
+
+    @property
+    def io(self):
+        return self._handler.io
+
+    def write(self, data):
+        if self._handler.in_close or self._handler.io is None:
+            raise ConnectionError("gensio is closed")
+        self._handler.buf.extend(data)
+        self._handler.io.write_cb_enable(True)
+        self._handler.driver.kick()
+
+    def writelines(self, data):
+        for chunk in data:
+            self.write(chunk)
+
+    async def drain(self):
+        handler = self._handler
+        if handler.error is not None:
+            raise handler.error
+        if len(handler.buf) >= DEFAULT_WRITE_LOW_WATER and handler.io is not None:
+            fut = handler.driver.loop.create_future()
+            handler.drain_waiters.append(fut)
+            await fut
+            if handler.error is not None:
+                raise handler.error
+
+    def can_write_eof(self):
+        return False
+
+    def is_closing(self):
+        return self._handler.in_close or self._handler.io is None
+
+    def close(self):
+        self._handler.close()
+
+    async def wait_closed(self):
+        await self._handler.closed
+
+    def get_extra_info(self, name, default=None):
+        if name == "gensio":
+            return self._handler.io
+        if name == "peername" and self._handler.io is not None:
+            return self._handler.io.control(
+                0, True, gensio.GENSIO_CONTROL_RADDR, b""
+            )
+        return default
+
+
+async def open_connection(gensio_str, *, limit=DEFAULT_LIMIT, driver=None):
+    """Open `gensio_str` and return a (StreamReader, GensioWriter) pair."""
+    driver = driver or get_driver()
+    handler = AsyncIOEvent(driver, limit=limit)
+    driver.start()
+    try:
+        handler.attach(gensio.gensio(driver.osfuncs, gensio_str, handler))
+        handler.io.open(handler)
+        driver.kick()
+        await handler.opened
+    except BaseException:
+        if handler.io is not None:
+            handler.io.close(handler)
+        else:
+            driver.stop()
+        raise
+    return handler.reader, handler.writer
+
+
+class Server:
+    """Returned by `start_server`; also the gensio accepter handler."""
+
+    def __init__(self, client_connected_cb, driver, limit=DEFAULT_LIMIT):
+        self.client_connected_cb = client_connected_cb
+        self.driver = driver
+        self.limit = limit
+        self.acc = None
+        self.shut_down = driver.loop.create_future()
+        self.tasks = set()
+
+    def log(self, acc, level, logval):
+        logger.error("gensio acc %s err: %s", level, logval)
+
+    def new_connection(self, acc, io):
+        if self.acc is None:
+            return None
+        handler = AsyncIOEvent(self.driver, limit=self.limit)
+        handler.attach(io)
+        self.driver.start()
+        io.read_cb_enable(True)
+        handler.opened.set_result(None)
+        task = self.driver.loop.create_task(
+            self.client_connected_cb(handler.reader, handler.writer)
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return io
+
+    def shutdown_done(self, acc):
+        if not self.shut_down.done():
+            self.shut_down.set_result(None)
+        self.driver.stop()
+
+    def is_serving(self):
+        return self.acc is not None
+
+    def close(self):
+        """Stop accepting; established connections are left alone."""
+        if self.acc is not None:
+            acc, self.acc = self.acc, None
+            acc.shutdown(self)
+            self.driver.kick()
+
+    async def wait_closed(self):
+        await self.shut_down
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+        await self.wait_closed()
+
+
+async def start_server(client_connected_cb, gensio_str, *, limit=DEFAULT_LIMIT, driver=None):
+    """
+    Accept connections on `gensio_str`, calling the coroutine
+    `client_connected_cb(reader, writer)` for each one.
+    """
+    driver = driver or get_driver()
+    server = Server(client_connected_cb, driver, limit=limit)
+    driver.start()
+    server.acc = gensio.gensio_accepter(driver.osfuncs, gensio_str, server)
+    server.acc.startup()
+    driver.kick()
+    return server
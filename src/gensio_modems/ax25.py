@@ -1,21 +1,43 @@
 """AX.25 / KISS modem implementation."""
-import argparse
-import logging
+import re
+import sys
+from typing import NamedTuple, Tuple
 
 import gensio
 
-from gensio_modems.gutils import ListenerEvent, PipeEvent, OSFUNCS
+from gensio_modems.admission import add_admission_arguments, start_admission
+from gensio_modems.failover import gateway_set
+from gensio_modems.gutils import (
+    DEFAULT_COALESCE_DELAY,
+    DEFAULT_HIGH_WATER,
+    DEFAULT_LOW_WATER,
+    ListenerEvent,
+    PipeEvent,
+    osfuncs,
+)
+from gensio_modems.logs import add_logging_arguments, category_logger, setup_logging
+from gensio_modems.pool import add_pool_arguments, start_pool
+from gensio_modems.profiles import add_profile_arguments, observe_session, start_profiles
 from gensio_modems.rmsgw import RMSGatewayLogin
 
 
-logger = logging.getLogger("ax25")
+logger = category_logger("control", "ax25")
 
 
-def ax25_addr(io, control):
-    addr = io.control(0, True, control, b"")
+def parse_ax25_addr(addr):
+    """
+    Split a gensio ax25 address string, "ax25:<tnc port>,<dest>,<src>[,<digi>...]",
+    into (dest, src, digipeaters).
+    """
     gensio_name, _, addr_str = addr.partition(":")
     addrs = addr_str.split(",")
-    return addrs[1] if len(addrs) > 1 else addrs[0]
+    if len(addrs) > 1:
+        return addrs[1], addrs[2] if len(addrs) > 2 else "", tuple(addrs[3:])
+    return addrs[0], "", ()
+
+
+def ax25_addr(io, control):
+    return parse_ax25_addr(io.control(0, True, control, b""))[0]
 
 
 def ax25_remote_addr(io):
@@ -26,77 +48,215 @@ def ax25_local_addr(io):
     return ax25_addr(io, control=gensio.GENSIO_CONTROL_LADDR)
 
 
-def ax25_command_substitution(io, command):
-    remote_addr = ax25_remote_addr(io)
-    remote_callsign = remote_addr.partition("-")[0]
-    # from https://manpages.ubuntu.com/manpages/jammy/man5/ax25d.conf.5.html
-    replmap = {
-        "%d": "gax25",
-        "%U": remote_callsign.upper(),
-        "%u": remote_callsign.lower(),
-        "%S": remote_addr.upper(),
-        "%s": remote_addr.lower(),
-        "%P": "%%",
-        "%p": "%%",
-        "%R": "%%",
-        "%r": "%%",
-        "%%": "%%",
+class AX25Address(NamedTuple):
+    """The parsed addresses of one AX.25 connection."""
+
+    remote: str  # CALLSIGN-SSID, as received
+    callsign: str  # uppercased, without SSID
+    ssid: int
+    digipeaters: Tuple[str, ...]
+    local: str  # the address the station connected to
+
+    @classmethod
+    def from_io(cls, io):
+        """Query `io` once for its remote and local addresses."""
+        # the remote address lists our end as the source, no LADDR needed
+        remote, local, digipeaters = parse_ax25_addr(
+            io.control(0, True, gensio.GENSIO_CONTROL_RADDR, b"")
+        )
+        callsign, _, ssid = remote.partition("-")
+        return cls(
+            remote=remote,
+            callsign=callsign.upper(),
+            ssid=int(ssid) if ssid.isdigit() else 0,
+            digipeaters=digipeaters,
+            local=local,
+        )
+
+
+class CommandTemplate:
+    """
+    A gateway string with ax25d style substitutions, parsed once.
+
+    from https://manpages.ubuntu.com/manpages/jammy/man5/ax25d.conf.5.html
+    (%P / %R and friends are left as "%%").
+
+    template = CommandTemplate("stdio,/usr/bin/rmsgw %U")
+    template.render(AX25Address.from_io(io))
+    """
+
+    FIELDS = {
+        "%d": lambda addr: "gax25",
+        "%U": lambda addr: addr.callsign.upper(),
+        "%u": lambda addr: addr.callsign.lower(),
+        "%S": lambda addr: addr.remote.upper(),
+        "%s": lambda addr: addr.remote.lower(),
+        "%P": lambda addr: "%%",
+        "%p": lambda addr: "%%",
+        "%R": lambda addr: "%%",
+        "%r": lambda addr: "%%",
+        "%%": lambda addr: "%%",
     }
-    for find, repl in replmap.items():
-        if find in command:
-            command = command.replace(find, repl)
-    return command
+    _TOKEN = re.compile("|".join(re.escape(f) for f in FIELDS))
+
+    def __init__(self, command):
+        self.command = command
+        # alternating literal text and field functions
+        self.parts = []
+        pos = 0
+        for match in self._TOKEN.finditer(command):
+            self.parts.append(command[pos : match.start()])
+            self.parts.append(self.FIELDS[match.group()])
+            pos = match.end()
+        self.parts.append(command[pos:])
+        self.static = len(self.parts) == 1
 
+    def render(self, addr):
+        if self.static:
+            return self.command
+        return "".join(
+            part if isinstance(part, str) else part(addr) for part in self.parts
+        )
+
+
+def ax25_command_substitution(io, command):
+    return CommandTemplate(command).render(AX25Address.from_io(io))
 
-def spawn_for(ioev, gensio_str):
-    sh_cmd = ax25_command_substitution(ioev.io, gensio_str)
+
+def spawn_for(ioev, template):
+    """Open the gateway for `ioev`; `template` is a CommandTemplate or string."""
+    if not isinstance(template, CommandTemplate):
+        template = CommandTemplate(template)
+    addr = getattr(ioev, "ax25_addr", None)
+    if addr is None and not template.static:
+        addr = AX25Address.from_io(ioev.io)
+    sh_cmd = template.render(addr)
     logger.info("spawn: {}".format(sh_cmd))
-    return gensio.gensio(OSFUNCS, sh_cmd, ioev)
+    return gensio.gensio(osfuncs(), sh_cmd, ioev)
 
 
 class RMSPipeEvent(RMSGatewayLogin, PipeEvent):
+    ax25_addr = None  # AX25Address, set by AX25ListenerEvent
+
     @property
     def callsign(self):
-        return ax25_remote_addr(self.io).partition("-")[0].encode("utf-8")
+        if self.ax25_addr is None:
+            self.ax25_addr = AX25Address.from_io(self.io)
+        return self.ax25_addr.callsign.encode("utf-8")
 
 
 class AX25ListenerEvent(ListenerEvent):
-    def __init__(self, spawn_gensio_str, banner=None):
+    """
+    Accept AX.25 connections and pipe each one to the gateway.
+
+    With `profiles` (a profiles.ProfileStore), every session is recorded
+    against the station's callsign. The link options of an accepted
+    connection are those of the accepter, so of the learned profile only
+    the paclen is applied, to the write coalescing (if enabled), and only
+    where it is below the configured one.
+
+    A `spawn_gensio_str` listing several gateways separated by ";" races
+    them for each session, see failover.py.
+
+    With `admission` (an admission.Admission), the gateway is only spawned
+    for connections it lets through, keyed by the station's callsign.
+    """
+
+    def __init__(
+        self,
+        spawn_gensio_str,
+        banner=None,
+        pipe_kwargs=None,
+        pool=None,
+        profiles=None,
+        admission=None,
+    ):
         gw1, rms, gw2 = spawn_gensio_str.partition("rms,")
         self.spawn_gensio_str = gw1 + gw2
+        self.spawn_template = CommandTemplate(self.spawn_gensio_str)
+        self.gateways = gateway_set(self.spawn_gensio_str, rms=bool(rms))
+        if self.gateways is not None:
+            self.gateway_templates = {
+                endpoint.gensio_str: CommandTemplate(endpoint.gensio_str)
+                for endpoint in self.gateways.endpoints
+            }
         self.banner = banner
         self.pipe = RMSPipeEvent if rms else PipeEvent
+        self.pipe_kwargs = pipe_kwargs or {}
+        # optional pool.UpstreamPool of pre-connected gateway gensios
+        self.pool = pool
+        self.profiles = profiles
         super().__init__()
+        self.admission = admission
 
     @classmethod
     def from_gensio_str(cls, gensio_str, **kwargs):
         accev = cls(**kwargs)
-        accev.acc = gensio.gensio_accepter(OSFUNCS, gensio_str, accev)
+        accev.acc = gensio.gensio_accepter(osfuncs(), gensio_str, accev)
         accev.acc.startup()
         return accev
 
     def new_connection(self, acc, io):
-        opened_io = super().new_connection(acc, io)
-        if opened_io is None:
+        if self.in_shutdown:
+            # it will free automatically
             return None
-        ioev = self.pipe()
+        # the only address lookup for this connection
+        addr = AX25Address.from_io(io)
+        return self.admit(
+            io, lambda: self.start_session(io, addr), callsign=addr.callsign
+        )
+
+    def start_session(self, io, addr):
+        ioev = self.pipe(**self.pipe_kwargs)
         ioev.io = io
+        ioev.ax25_addr = addr
+        self.track(ioev, callsign=addr.callsign)
+        if self.profiles is not None and ioev.paclen:
+            # never above the accepter's max_write_size
+            profile = self.profiles.profile_for(ioev.ax25_addr.callsign)
+            ioev.paclen = min(ioev.paclen, profile.paclen)
         if self.banner is not None:
             ioev.get_write_buffer(ioev.io).extend(f"{self.banner}\r\n".encode("utf-8"))
-        ioev.io2 = spawn_for(ioev, self.spawn_gensio_str)
-        ioev.io2.open(ioev)
+        if self.pool is None or not self.pool.attach(ioev):
+            self.spawn_gateway(ioev)
         io.write_cb_enable(True)
         io.read_cb_enable(True)
-        return io
+        return ioev
+
+    def spawn_gateway(self, ioev):
+        if self.gateways is None:
+            ioev.io2 = spawn_for(ioev, self.spawn_template)
+            ioev.io2.open(ioev)
+            return
+        addr = ioev.ax25_addr
+        # cancelled by ioev.close() if the station goes away first
+        ioev.race = self.gateways.connect(
+            ioev,
+            render=lambda gensio_str: self.gateway_templates[gensio_str].render(addr),
+        )
+
+    def io_closed(self, conn_id):
+        if self.profiles is not None:
+            callsign = self.connections.callsign_of(conn_id)
+            ioev = self.connections.get(conn_id)
+            if callsign and ioev is not None:
+                observe_session(self.profiles, ioev, callsign, "io")
+        super().io_closed(conn_id)
 
 
 def main():
+    import argparse
+
+    # only the tools need these, not importers of this module
+    from gensio_modems.capture import add_capture_arguments, start_capture
+    from gensio_modems.metrics import add_metrics_arguments, start_metrics, watch_listener
+
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-l",
         "--listen",
         required=True,
-        help="Callsign-SSID to listen for AX25 connections.",
+        help="Callsign-SSID to listen for AX25 connections (comma separated for several).",
     )
     parser.add_argument(
         "-k",
@@ -108,21 +268,88 @@ def main():
         "-g",
         "--gateway",
         default="rms,tcp,cms.winlink.org,8772",
-        help="Gensio connection string for gateway endpoint.",
+        help="Gensio connection string for gateway endpoint; several separated "
+        "by ';' are raced, in order, for each session.",
     )
     parser.add_argument(
         "--banner",
         default=None,
         help="Text displayed when user connects",
     )
+    parser.add_argument(
+        "--high-water",
+        type=int,
+        default=DEFAULT_HIGH_WATER,
+        help="Pause reads from a side once this many bytes are waiting to be sent",
+    )
+    parser.add_argument(
+        "--low-water",
+        type=int,
+        default=DEFAULT_LOW_WATER,
+        help="Resume paused reads once the backlog drains to this many bytes",
+    )
+    parser.add_argument(
+        "--paclen",
+        type=int,
+        default=None,
+        help="AX.25 I-frame size (ax25 max_write_size); coalesce gateway output "
+        "into frames of this size",
+    )
+    parser.add_argument(
+        "--coalesce-delay",
+        type=float,
+        default=DEFAULT_COALESCE_DELAY,
+        help="With --paclen, send a partial frame after waiting this many seconds",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Shard the listen callsigns across this many worker processes",
+    )
+    add_logging_arguments(parser)
+    add_metrics_arguments(parser)
+    add_capture_arguments(parser)
+    add_pool_arguments(parser)
+    add_profile_arguments(parser)
+    add_admission_arguments(parser)
 
     args = parser.parse_args()
+    setup_logging(args)
+
+    callsigns = [c.strip() for c in args.listen.split(",") if c.strip()]
+    if args.workers > 1:
+        from gensio_modems.workers import run_ax25_workers
 
-    AX25ListenerEvent.from_gensio_str(
-        gensio_str=f"ax25(laddr={args.listen},extended=0),kiss,conacc,{args.kiss}",
+        try:
+            run_ax25_workers(callsigns, args.kiss, sys.argv[1:], args.workers)
+        except ValueError as exc:
+            parser.error(str(exc))
+        return
+
+    start_metrics(args)
+    start_capture(args)
+    gw1, rms, gw2 = args.gateway.partition("rms,")
+    laddrs = ",".join(f"laddr={c}" for c in callsigns)
+    if args.paclen:
+        laddrs += f",max_write_size={args.paclen}"
+    listener = AX25ListenerEvent.from_gensio_str(
+        gensio_str=f"ax25({laddrs},extended=0),kiss,conacc,{args.kiss}",
         spawn_gensio_str=args.gateway,
         banner=args.banner,
-    ).wait()
+        pipe_kwargs=dict(
+            high_water=args.high_water,
+            low_water=args.low_water,
+            paclen=args.paclen,
+            coalesce_delay=args.coalesce_delay,
+        ),
+        pool=start_pool(args, gw1 + gw2, rms=bool(rms)),
+        profiles=start_profiles(args),
+        admission=start_admission(args),
+    )
+    watch_listener(listener)
+    listener.wait()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+"""Transfer buffers for shuttling bytes between gensios."""
+
+import collections
+import itertools
+
+
+# upper bound on a single `peek`, keeps per-write copies small
+DEFAULT_WRITE_CHUNK = 4096
+
+
+class ChunkBuffer:
+    """
+    FIFO byte queue made of the chunks handed to `extend`.
+
+    Consuming bytes from the front is O(1): fully written chunks are popped
+    off the deque and a partially written head chunk is tracked by offset.
+
+    buf = ChunkBuffer()
+    buf.extend(data)
+    count = io.write(bytes(buf.peek()), None)
+    buf.consume(count)
+    """
+
+    def __init__(self, data=None, capacity=None):
+        self._chunks = collections.deque()
+        self._offset = 0  # bytes already consumed from self._chunks[0]
+        self._len = 0
+        # when set, `extend` accepts at most `capacity - len(self)` bytes
+        self.capacity = capacity
+        # running totals, for metrics
+        self.total_in = 0
+        self.total_out = 0
+        self.peak = 0  # largest len(self) seen
+        if data:
+            self.extend(data)
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __repr__(self):
+        return "<{} len={} chunks={}>".format(
+            type(self).__name__, self._len, len(self._chunks)
+        )
+
+    @property
+    def free(self):
+        """Number of bytes `extend` will accept, or None if unbounded."""
+        if self.capacity is None:
+            return None
+        return max(self.capacity - self._len, 0)
+
+    def extend(self, data):
+        """
+        Append `data` to the end of the buffer.
+
+        Returns the number of bytes accepted, which is less than `len(data)`
+        only when `capacity` is set and the buffer is full.
+        """
+        free = self.free
+        if free is not None and len(data) > free:
+            data = data[:free]
+        if not data:
+            return 0
+        self._chunks.append(bytes(data))
+        self._len += len(data)
+        self.total_in += len(data)
+        if self._len > self.peak:
+            self.peak = self._len
+        return len(data)
+
+    def peek(self, limit=DEFAULT_WRITE_CHUNK):
+        """
+        Return a memoryview of (up to `limit`) bytes at the front of the buffer.
+
+        Small chunks at the head are coalesced so a trickle of tiny reads
+        doesn't turn into a trickle of tiny writes.
+        """
+        if not self._chunks:
+            return memoryview(b"")
+        head = self._chunks[0]
+        if len(head) - self._offset < limit and len(self._chunks) > 1:
+            self._coalesce(limit)
+            head = self._chunks[0]
+        return memoryview(head)[self._offset : self._offset + limit]
+
+    def _coalesce(self, limit):
+        parts = [memoryview(self._chunks.popleft())[self._offset :]]
+        size = len(parts[0])
+        self._offset = 0
+        while self._chunks and size < limit:
+            chunk = self._chunks.popleft()
+            size += len(chunk)
+            parts.append(chunk)
+        self._chunks.appendleft(b"".join(parts))
+
+    def consume(self, count):
+        """Drop `count` bytes from the front of the buffer."""
+        count = min(count, self._len)
+        self._len -= count
+        self.total_out += count
+        while count:
+            head_left = len(self._chunks[0]) - self._offset
+            if count < head_left:
+                self._offset += count
+                return
+            count -= head_left
+            self._chunks.popleft()
+            self._offset = 0
+
+    def clear(self):
+        self._chunks.clear()
+        self._offset = 0
+        self._len = 0
+
+    def tobytes(self):
+        """Return the entire buffer contents as bytes (without consuming)."""
+        if not self._chunks:
+            return b""
+        head = memoryview(self._chunks[0])[self._offset :]
+        return b"".join([head, *itertools.islice(self._chunks, 1, None)])
@@ -0,0 +1,309 @@
+"""
+Session capture to a memory-mapped journal.
+
+Every read and write of every IOEvent is appended, timestamped and tagged
+with its session, side and direction, to a preallocated file of fixed size
+used as a ring: once full, the oldest records are overwritten. Appending is
+a `struct.pack_into` and a slice copy into the mapping, with no syscalls or
+string formatting, so capture can stay on in production. Like varaproto,
+this module has no gensio dependency; the reader below runs anywhere.
+
+journal = Journal("/var/lib/gensio-modems/capture.bin", size=64 * 1024 * 1024)
+gutils.IOEvent.capture = journal  # or start_capture(args) from a tool's main
+
+python -m gensio_modems.capture list capture.bin
+python -m gensio_modems.capture dump capture.bin 12
+python -m gensio_modems.capture raw capture.bin 12 --side io2 > gateway.bin
+"""
+
+import mmap
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"GMJ1"
+# magic, data end, head, tail, lap end, next session id, empty
+HEADER = struct.Struct("<4s4xQQQQIB3x")
+DATA_START = 64
+# payload length, session id, wall clock time, flags
+RECORD = struct.Struct("<IIdB3x")
+RECORD_LENGTH = struct.Struct("<I")
+
+DEFAULT_SIZE = 16 * 1024 * 1024
+
+# record flags: bit 0 is the side, bits 1-2 the kind of record
+SIDES = {"io": 0, "io2": 1}
+SIDE_NAMES = ("io", "io2")
+READ = 0 << 1
+WRITE = 1 << 1
+OPEN = 2 << 1  # payload is the session label
+CLOSE = 3 << 1
+KIND_MASK = 3 << 1
+KIND_NAMES = {READ: "read", WRITE: "write", OPEN: "open", CLOSE: "close"}
+TRUNCATED = 1 << 3  # payload was cut to `max_payload` bytes
+
+
+class Record:
+    __slots__ = ("session", "timestamp", "flags", "data")
+
+    def __init__(self, session, timestamp, flags, data):
+        self.session = session
+        self.timestamp = timestamp
+        self.flags = flags
+        self.data = data
+
+    @property
+    def side(self):
+        return SIDE_NAMES[self.flags & 1]
+
+    @property
+    def kind(self):
+        return KIND_NAMES[self.flags & KIND_MASK]
+
+    @property
+    def truncated(self):
+        return bool(self.flags & TRUNCATED)
+
+
+class Journal:
+    """
+    A fixed-size ring of records in a memory-mapped file.
+
+    An existing journal of the same size is appended to, otherwise the file
+    is (re)created. The header is rewritten after every record, so the file
+    is readable at any time, including after a crash.
+    """
+
+    def __init__(self, path, size=DEFAULT_SIZE, max_payload=None):
+        if size < DATA_START + RECORD.size * 16:
+            raise ValueError("journal size {} is too small".format(size))
+        self.path = path
+        self.end = size
+        self.max_payload = max_payload or (size - DATA_START) // 8
+        self.records = 0
+        self.wraps = 0
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o640)
+        try:
+            fresh = os.fstat(fd).st_size != size
+            if fresh:
+                os.ftruncate(fd, size)
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        header = HEADER.unpack_from(self.mm, 0)
+        if fresh or header[0] != MAGIC or header[1] != size:
+            self.head = self.tail = self.lap_end = DATA_START
+            self.next_session = 1
+            self.empty = True
+            self._sync_header()
+        else:
+            _, _, self.head, self.tail, self.lap_end, self.next_session, empty = header
+            self.empty = bool(empty)
+
+    def _sync_header(self):
+        HEADER.pack_into(
+            self.mm,
+            0,
+            MAGIC,
+            self.end,
+            self.head,
+            self.tail,
+            self.lap_end,
+            self.next_session,
+            self.empty,
+        )
+
+    def _evict(self):
+        """Drop the oldest record."""
+        (length,) = RECORD_LENGTH.unpack_from(self.mm, self.tail)
+        self.tail += RECORD.size + length
+        if self.tail >= self.lap_end:
+            self.tail = DATA_START
+            if self.head == DATA_START:
+                self.empty = True
+
+    def _make_room(self, size):
+        """Return the offset for a record of `size` bytes, evicting as needed."""
+        if self.head + size > self.end:
+            if not self.empty and self.tail >= self.head:
+                # the rest of the previous lap is dropped
+                self.tail = DATA_START
+            self.lap_end = self.head
+            self.head = DATA_START
+            self.wraps += 1
+        while not self.empty and self.head <= self.tail < self.head + size:
+            self._evict()
+        if self.empty:
+            self.tail = self.head
+            self.empty = False
+        return self.head
+
+    def append(self, session, flags, data, count):
+        """Append the first `count` bytes of `data`."""
+        if count > self.max_payload:
+            count = self.max_payload
+            flags |= TRUNCATED
+        offset = self._make_room(RECORD.size + count)
+        RECORD.pack_into(self.mm, offset, count, session, time.time(), flags)
+        offset += RECORD.size
+        self.mm[offset : offset + count] = data if count == len(data) else data[:count]
+        self.head = offset + count
+        self.records += 1
+        self._sync_header()
+
+    def open_session(self, ioev):
+        """Give `ioev` a session id, recording a label to find it by."""
+        session = ioev.capture_id = self.next_session
+        self.next_session = (self.next_session + 1) & 0xFFFFFFFF or 1
+        label = "{} conn={}".format(type(ioev).__name__, ioev.conn_id).encode()
+        self.append(session, OPEN, label, len(label))
+        return session
+
+    def record(self, ioev, side, kind, data, count=None):
+        """Record `data` read from / written to `ioev`'s `side` ("io" or "io2")."""
+        session = ioev.capture_id or self.open_session(ioev)
+        if count is None:
+            count = len(data)
+        self.append(session, SIDES[side] | kind, data, count)
+
+    def read(self, ioev, side, data, count=None):
+        self.record(ioev, side, READ, data, count)
+
+    def write(self, ioev, side, data, count=None):
+        self.record(ioev, side, WRITE, data, count)
+
+    def close_session(self, ioev, side):
+        if ioev.capture_id:
+            self.append(ioev.capture_id, SIDES[side] | CLOSE, b"", 0)
+
+    def close(self):
+        self.mm.close()
+
+
+def read_journal(path):
+    """Yield the Records in the journal at `path`, oldest first."""
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, end, head, tail, lap_end, _, empty = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("{} is not a capture journal".format(path))
+    if empty:
+        return
+    if tail >= head:
+        # wrapped: the rest of the previous lap, then the current one
+        spans = [(tail, lap_end), (DATA_START, head)]
+    else:
+        spans = [(tail, head)]
+    for offset, stop in spans:
+        while offset < stop:
+            length, session, timestamp, flags = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            yield Record(session, timestamp, flags, data[offset : offset + length])
+            offset += length
+
+
+def sessions(records):
+    """Summaries of the sessions in `records`: {id: dict}."""
+    summary = {}
+    for rec in records:
+        info = summary.get(rec.session)
+        if info is None:
+            info = summary[rec.session] = {
+                "label": "(label overwritten)",
+                "start": rec.timestamp,
+                "end": rec.timestamp,
+                "bytes": {"io": 0, "io2": 0},
+            }
+        info["end"] = rec.timestamp
+        if rec.flags & KIND_MASK == OPEN:
+            info["label"] = rec.data.decode("utf-8", "replace")
+        elif rec.flags & KIND_MASK == READ:
+            info["bytes"][rec.side] += len(rec.data)
+    return summary
+
+
+def format_time(timestamp):
+    return "{}.{:03d}".format(
+        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+        int(timestamp % 1 * 1000),
+    )
+
+
+def add_capture_arguments(parser):
+    parser.add_argument(
+        "--capture",
+        default=None,
+        help="Record every session's bytes to this journal file",
+    )
+    parser.add_argument(
+        "--capture-size",
+        type=int,
+        default=DEFAULT_SIZE // (1024 * 1024),
+        help="Journal size in MiB; the oldest records are overwritten when full",
+    )
+
+
+def start_capture(args):
+    if not args.capture:
+        return None
+    from .gutils import IOEvent
+
+    journal = Journal(args.capture, size=args.capture_size * 1024 * 1024)
+    IOEvent.capture = journal
+    return journal
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Read a session capture journal")
+    parser.add_argument("command", choices=["list", "dump", "raw"])
+    parser.add_argument("journal")
+    parser.add_argument("session", type=int, nargs="?")
+    parser.add_argument("--side", choices=SIDE_NAMES, default="io")
+    parser.add_argument(
+        "--kind", choices=["read", "write"], default="read", help="for raw"
+    )
+    args = parser.parse_args()
+
+    records = read_journal(args.journal)
+    if args.command == "list":
+        for session, info in sessions(records).items():
+            print(
+                "{:>6} {} {:8.1f}s io={} io2={} {}".format(
+                    session,
+                    format_time(info["start"]),
+                    info["end"] - info["start"],
+                    info["bytes"]["io"],
+                    info["bytes"]["io2"],
+                    info["label"],
+                )
+            )
+        return
+    if args.session is None:
+        parser.error("{} needs a session".format(args.command))
+    records = (rec for rec in records if rec.session == args.session)
+    if args.command == "dump":
+        for rec in records:
+            print(
+                "{} {:<3} {:<5} {!r}{}".format(
+                    format_time(rec.timestamp),
+                    rec.side,
+                    rec.kind,
+                    rec.data,
+                    " (truncated)" if rec.truncated else "",
+                )
+            )
+    else:
+        out = sys.stdout.buffer
+        for rec in records:
+            if rec.side == args.side and rec.kind == args.kind:
+                out.write(rec.data)
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
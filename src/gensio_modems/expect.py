@@ -0,0 +1,133 @@
+"""
+Incremental expect-style prompt matching.
+
+Bytes are fed in as they arrive, so a prompt split across reads, or sharing
+a read with a banner, still matches. Like varaproto, this module has no
+gensio dependency; callers run the per-step deadline on their own timers.
+
+login = Expect([Step(rb"callsign\\s*:"), Step(rb"password\\s*:")])
+for hit in login.feed(b"Welcome!\\r\\nCallsi"):
+    ...
+for hit in login.feed(b"gn :\\r\\n"):
+    hit.step   # the Step for `callsign`
+    hit.before  # b"Welcome!\\r\\n"
+"""
+
+import re
+import time
+from typing import NamedTuple, Optional
+
+
+class Step:
+    """One expected prompt: a regex (compiled once, case-insensitive)."""
+
+    __slots__ = ("name", "pattern")
+
+    def __init__(self, pattern, name=None, flags=re.IGNORECASE):
+        if isinstance(pattern, bytes):
+            pattern = re.compile(pattern, flags)
+        self.pattern = pattern
+        self.name = name or pattern.pattern.decode("ascii", "replace")
+
+    def __repr__(self):
+        return "Step({!r})".format(self.name)
+
+
+class Hit(NamedTuple):
+    step: Step
+    match: "re.Match"
+    before: bytes  # bytes received between the previous match and this one
+
+
+class Expect:
+    """
+    Match `steps` in order against a byte stream.
+
+    Only the last `window` bytes before new data are searched again, so
+    matching stays linear in the bytes fed; a prompt must fit in the window.
+    Bytes that can no longer be part of a match are returned by `drain`.
+    """
+
+    def __init__(self, steps, window=256):
+        self.steps = list(steps)
+        self.window = window
+        self.index = 0
+        self._buf = bytearray()
+        self._scan = 0  # offset in _buf from which to search again
+        self.started_at = time.monotonic()
+        self.step_started_at = self.started_at
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.index >= len(self.steps)
+
+    @property
+    def current(self) -> Optional[Step]:
+        return None if self.done else self.steps[self.index]
+
+    @property
+    def elapsed(self):
+        """Seconds from start to the last step matching (or until now)."""
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def feed(self, data):
+        """Add `data`, returning a Hit for each step it completes."""
+        hits = []
+        if self.done:
+            self._buf.extend(data)
+            return hits
+        self._scan = max(len(self._buf) - self.window, 0)
+        self._buf.extend(data)
+        while not self.done:
+            # search a copy, the buffer is resized below
+            text = bytes(self._buf)
+            match = self.steps[self.index].pattern.search(text, self._scan)
+            if match is None:
+                break
+            hits.append(Hit(self.steps[self.index], match, text[: match.start()]))
+            del self._buf[: match.end()]
+            self._scan = 0
+            self.index += 1
+            self.step_started_at = time.monotonic()
+        if self.done and self.finished_at is None:
+            self.finished_at = self.step_started_at
+        return hits
+
+    def drain(self):
+        """
+        Remove and return buffered bytes that can't be part of a match any
+        more: everything once all steps matched, otherwise all but the last
+        `window` bytes.
+        """
+        keep = 0 if self.done else self.window
+        if len(self._buf) <= keep:
+            return b""
+        count = len(self._buf) - keep
+        data = bytes(self._buf[:count])
+        del self._buf[:count]
+        return data
+
+
+class LoginStats:
+    """Counters for one kind of login, read by the metrics collector."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.timeouts = 0
+
+    def add(self, expect):
+        self.count += 1
+        self.seconds += expect.elapsed
+
+
+# login kind ("rms", "proxy") -> LoginStats
+LOGINS = {}
+
+
+def login_stats(kind):
+    stats = LOGINS.get(kind)
+    if stats is None:
+        stats = LOGINS[kind] = LoginStats()
+    return stats
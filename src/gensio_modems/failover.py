@@ -0,0 +1,280 @@
+"""
+Gateway failover: race connections to an ordered list of endpoints.
+
+`--gateway` may list several gensio strings separated by ";", e.g.
+"rms,tcp,cms-a.example.org,8772;tcp,cms-b.example.org,8772". A session
+connects to the first healthy endpoint and, happy eyeballs style, starts
+the next one whenever an attempt fails or `stagger` seconds pass without
+the current ones getting ready; the first to show `ready_prompt` (or to
+open, without one) wins and the others are closed. Endpoints that fail
+are skipped for an exponentially growing back-off, then tried again.
+
+gateways = GatewaySet(split_gateways(gensio_str), ready_prompt=b"callsign")
+gateways.connect(pipe)  # pipe is a gutils.PipeEvent; its io2 is set by the winner
+"""
+
+import time
+import weakref
+
+import gensio
+
+from .gutils import IOEvent, TIMERS, osfuncs, register_collector
+from .logs import category_logger
+
+
+logger = category_logger("control", "failover")
+
+DEFAULT_STAGGER = 0.25  # seconds before racing the next endpoint (RFC 8305)
+CONNECT_TIMEOUT = 30  # seconds for a session to get a ready gateway
+MIN_BACKOFF = 5  # seconds an endpoint is skipped after its first failure
+MAX_BACKOFF = 300
+
+
+_gateway_sets = weakref.WeakSet()
+
+
+def split_gateways(gensio_str):
+    """The ";" separated endpoints of a --gateway value."""
+    return [part.strip() for part in gensio_str.split(";") if part.strip()]
+
+
+class Endpoint:
+    """Health of one gateway endpoint."""
+
+    def __init__(self, gensio_str):
+        self.gensio_str = gensio_str
+        self.failures = 0  # in a row
+        self.down_until = 0.0  # time.monotonic
+        # counters for metrics
+        self.attempts = 0
+        self.wins = 0
+        self.failed = 0
+        self.ready_seconds = None  # of the last win
+
+    def up(self, now):
+        return now >= self.down_until
+
+    def succeeded(self, elapsed):
+        self.wins += 1
+        self.failures = 0
+        self.down_until = 0.0
+        self.ready_seconds = elapsed
+
+    def failed_attempt(self, now):
+        self.failed += 1
+        self.failures += 1
+        backoff = min(MIN_BACKOFF * 2 ** (self.failures - 1), MAX_BACKOFF)
+        self.down_until = now + backoff
+        logger.warning(
+            "gateway %s failed %s time(s) in a row, skipping it for %ss",
+            self.gensio_str,
+            self.failures,
+            backoff,
+        )
+
+
+class Attempt(IOEvent):
+    """One connection of a Race, buffering what the gateway sends."""
+
+    def __init__(self, race, endpoint):
+        super().__init__()
+        self.race = race
+        self.endpoint = endpoint
+        self.started = time.monotonic()
+
+    def open_done(self, io, err):
+        super().open_done(io, err)
+        if err:
+            # close_done never comes for a gensio that failed to open
+            self.race.attempt_failed(self, err)
+            return
+        if self.race.gateways.ready_prompt is None:
+            self.race.attempt_ready(self)
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        prompt = self.race.gateways.ready_prompt
+        if err:
+            self.race.attempt_failed(self, err)
+        elif prompt is not None and prompt in self.bufA.tobytes().lower():
+            self.race.attempt_ready(self)
+        return count
+
+
+class Race:
+    """Connect `pipe`'s io2 to the first of `gateways` to get ready."""
+
+    def __init__(self, gateways, pipe, render=None):
+        self.gateways = gateways
+        self.pipe = pipe
+        self.render = render
+        self.pending = gateways.ordered()
+        self.attempts = []  # in progress
+        self.done = False
+        self.stagger_timer = None
+        self.deadline = TIMERS.call_later(gateways.connect_timeout, self.expired)
+
+    def start_next(self):
+        """Start an attempt on the next endpoint; False when none are left."""
+        self.stagger_timer = None
+        while self.pending and not self.done:
+            endpoint = self.pending.pop(0)
+            gensio_str = endpoint.gensio_str
+            if self.render is not None:
+                gensio_str = self.render(gensio_str)
+            attempt = Attempt(self, endpoint)
+            endpoint.attempts += 1
+            try:
+                attempt.io = gensio.gensio(osfuncs(), gensio_str, attempt)
+                attempt.io.open(attempt)
+            except Exception as exc:
+                logger.error("gateway %s: cannot open: %s", gensio_str, exc)
+                endpoint.failed_attempt(time.monotonic())
+                continue
+            self.attempts.append(attempt)
+            if self.pending:
+                self.stagger_timer = TIMERS.call_later(
+                    self.gateways.stagger, self.start_next
+                )
+            return True
+        if not self.attempts:
+            self.lost()
+        return False
+
+    def attempt_failed(self, attempt, err):
+        if attempt not in self.attempts:
+            return
+        self.attempts.remove(attempt)
+        logger.info("gateway %s: %s", attempt.endpoint.gensio_str, err)
+        attempt.endpoint.failed_attempt(time.monotonic())
+        if attempt.io is not None and not attempt.in_close:
+            attempt.close(attempt.io)
+        if self.done:
+            return
+        # don't wait out the stagger, the next endpoint goes now
+        if self.stagger_timer is not None:
+            self.stagger_timer.cancel()
+            self.stagger_timer = None
+        self.start_next()
+
+    def attempt_ready(self, attempt):
+        if self.done or attempt not in self.attempts:
+            return
+        self.attempts.remove(attempt)
+        elapsed = time.monotonic() - attempt.started
+        attempt.endpoint.succeeded(elapsed)
+        self.finish()
+        pipe = self.pipe
+        if pipe.io is None or pipe.in_close:
+            # the session ended while we were connecting
+            attempt.close(attempt.io)
+            return
+        logger.info(
+            "gateway %s ready in %.3fs", attempt.endpoint.gensio_str, elapsed
+        )
+        io = attempt.io
+        pending = attempt.bufA.tobytes()
+        attempt.io = None
+        pipe.io2 = io  # takes over the gensio callbacks
+        if pipe.opened_at is None:
+            pipe.opened_at = time.monotonic()
+        io.write_cb_enable(True)
+        io.read_cb_enable(True)
+        if pending:
+            pipe.read_callback(io, None, pending, None)
+
+    def expired(self):
+        self.deadline = None
+        if self.done:
+            return
+        now = time.monotonic()
+        for attempt in self.attempts:
+            attempt.endpoint.failed_attempt(now)
+        self.lost()
+
+    def lost(self):
+        logger.error("no gateway of %s is reachable", self.gateways)
+        self.finish()
+        if self.pipe.io is not None:
+            self.pipe.close(self.pipe.io)
+
+    def finish(self):
+        """Stop racing, closing the attempts still in progress."""
+        self.done = True
+        for timer in (self.stagger_timer, self.deadline):
+            if timer is not None:
+                timer.cancel()
+        self.stagger_timer = self.deadline = None
+        attempts, self.attempts = self.attempts, []
+        for attempt in attempts:
+            if attempt.io is not None:
+                attempt.close(attempt.io)
+
+    def cancel(self):
+        """The session no longer needs a gateway."""
+        if not self.done:
+            self.finish()
+
+
+class GatewaySet:
+    """
+    Ordered gateway endpoints and their health, shared by the sessions of
+    a listener or modem. `ready_prompt` is compared lowercased.
+    """
+
+    def __init__(
+        self,
+        endpoints,
+        ready_prompt=None,
+        stagger=DEFAULT_STAGGER,
+        connect_timeout=CONNECT_TIMEOUT,
+    ):
+        self.endpoints = [Endpoint(gensio_str) for gensio_str in endpoints]
+        self.ready_prompt = ready_prompt.lower() if ready_prompt else None
+        self.stagger = stagger
+        self.connect_timeout = connect_timeout
+        _gateway_sets.add(self)
+
+    def __str__(self):
+        return ";".join(endpoint.gensio_str for endpoint in self.endpoints)
+
+    def ordered(self):
+        """
+        The endpoints to try, in order: those that are up, or when every
+        one is backing off, all of them, soonest to recover first.
+        """
+        now = time.monotonic()
+        up = [endpoint for endpoint in self.endpoints if endpoint.up(now)]
+        return up or sorted(self.endpoints, key=lambda e: e.down_until)
+
+    def connect(self, pipe, render=None):
+        """
+        Race the endpoints for `pipe` (a gutils.PipeEvent); `render(gensio_str)`
+        fills in per-session substitutions. Returns the Race, which can be
+        cancelled.
+        """
+        race = Race(self, pipe, render)
+        race.start_next()
+        return race
+
+
+def gateway_set(gensio_str, rms=False):
+    """A GatewaySet for a --gateway value listing several endpoints, else None."""
+    endpoints = split_gateways(gensio_str)
+    if len(endpoints) < 2:
+        return None
+    return GatewaySet(endpoints, ready_prompt=b"callsign" if rms else None)
+
+
+def collect_gateways():
+    now = time.monotonic()
+    for gateways in list(_gateway_sets):
+        for endpoint in gateways.endpoints:
+            labels = {"gateway": endpoint.gensio_str}
+            yield "gateway_up", labels, int(endpoint.up(now))
+            yield "gateway_attempts_total", labels, endpoint.attempts
+            yield "gateway_wins_total", labels, endpoint.wins
+            yield "gateway_failures_total", labels, endpoint.failed
+
+
+register_collector(collect_gateways)
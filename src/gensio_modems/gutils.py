@@ -1,25 +1,118 @@
 """Utilities for working with gensio python binding."""
 
-import array
+import heapq
+import itertools
 import logging
+import time
 
 import gensio
 
+from .buffer import DEFAULT_WRITE_CHUNK, ChunkBuffer
+from .logs import GensioLogger, category_logger, format_payload
+from .registry import ConnectionRegistry
 
-# python-native logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger("gutils")
 
+logger = category_logger("control", "gutils")
+# see init() / osfuncs()
+_osfuncs = None
 
-class GensioLogger:
-    """gensio internal log callback"""
+# PipeEvent pauses reads from a gensio once this many bytes are waiting to be
+# written to the other side, and resumes them when it drains below low water
+DEFAULT_HIGH_WATER = 64 * 1024
+DEFAULT_LOW_WATER = 16 * 1024
 
-    def gensio_log(self, level, log):
-        logger.debug("***%s log: %s", level, log)
+# with a paclen set, PipeEvent holds back a short tail of data (less than one
+# frame) for at most this many seconds, waiting for more to fill the frame
+DEFAULT_COALESCE_DELAY = 0.05
 
+# longest single wait on the selector, so newly scheduled timers are noticed
+MAX_WAIT_MSEC = 1000
 
-gensio.gensio_set_log_mask(gensio.GENSIO_LOG_MASK_ALL)
-OSFUNCS = None
+# functions yielding (family, labels dict, value) samples for metrics.render;
+# kept here so modules can register theirs without importing metrics
+COLLECTORS = []
+
+
+def register_collector(collector):
+    """
+    Add `collector()`, which yields (family, labels dict, value) samples;
+    the family must be in metrics.FAMILIES.
+    """
+    COLLECTORS.append(collector)
+
+
+class Timer:
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerQueue:
+    """
+    Timers run from the process's wait loop.
+
+    The python binding doesn't expose gensio timers, so every `wait` in this
+    module goes through `TIMERS.wait`, which services the selector with a
+    timeout and fires due timers in between.
+
+    timer = TIMERS.call_later(5, callback, arg)
+    timer.cancel()
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(time.monotonic() + delay, callback, args)
+        heapq.heappush(self._heap, (timer.when, next(self._seq), timer))
+        return timer
+
+    def next_timeout(self):
+        """Seconds until the next timer is due, or None if there are none."""
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - time.monotonic(), 0)
+
+    def run_due(self):
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logger.exception("Unhandled Exception in timer %r", timer.callback)
+
+    def wait(self, waiter, count=1, done=None):
+        """
+        Like `waiter.wait(count)`, but fires timers while waiting; also
+        returns once `done()` is true, in case a wake lands on a timeout.
+        """
+        while True:
+            timeout = self.next_timeout()
+            if timeout is None:
+                msec = MAX_WAIT_MSEC
+            else:
+                msec = min(int(timeout * 1000) + 1, MAX_WAIT_MSEC)
+            # returns the time left, so 0 means we timed out
+            woken = waiter.wait_timeout(count, msec) > 0
+            self.run_due()
+            if woken or (done is not None and done()):
+                return
+
+
+TIMERS = TimerQueue()
 
 
 class IOEvent:
@@ -27,21 +120,34 @@ class IOEvent:
     Buffered gensio wrapper.
 
     i = IOEvent()
-    i.io = gensio.gensio(OSFUNCS, "tcp,localhost,3333", i)
+    i.io = gensio.gensio(osfuncs(), "tcp,localhost,3333", i)
     i.io.open(i)
     i.wait()
     """
 
+    # a capture.Journal recording every read and write, see capture.py
+    capture = None
+
     def __init__(self):
-        self.logger = logging.getLogger(type(self).__name__)
+        self.logger = category_logger("control", type(self).__name__)
+        self.payload_logger = category_logger("payload", type(self).__name__)
         self._io = None
         # io reads into bufA
-        self.bufA = array.array("B")
+        self.bufA = ChunkBuffer()
         # io writes from bufB
-        self.bufB = array.array("B")
+        self.bufB = ChunkBuffer()
         self.in_close = False  # true if either gensio is down or going down
         self.in_error = False  # true if self._io had an error
-        self.waiter = gensio.waiter(OSFUNCS)
+        self.waiter = gensio.waiter(osfuncs())
+        # set by the ListenerEvent that accepted this connection
+        self.listener = None
+        self.conn_id = None
+        self.capture_id = None  # session id in the capture journal
+        self.errors = {}  # name of the gensio -> its last read/write error
+        # session timing, for metrics (time.monotonic)
+        self.opened_at = None
+        self.first_byte_at = None
+        self.last_read_at = None
 
     @property
     def io(self):
@@ -62,10 +168,22 @@ class IOEvent:
         """
         Log a message in the context of the given `io`.
         """
+        if not self.logger.isEnabledFor(level):
+            return
         self.logger.log(
             level, "{} {}".format(self.name_for(io), message), *args, **kwargs
         )
 
+    def log_payload(self, io, event, data):
+        """
+        Trace `data` passing through `io`; free when payload tracing is off.
+        """
+        if not self.payload_logger.isEnabledFor(logging.DEBUG):
+            return
+        self.payload_logger.debug(
+            "%s %s: %s", self.name_for(io), event, format_payload(data)
+        )
+
     def close(self, io=None):
         self.in_close = True
         if self.io is not None and not self.in_error:
@@ -87,37 +205,60 @@ class IOEvent:
             self.log_for(io, "read: %s", err)
             if "remote end closed connection" not in str(err).lower():
                 self.log_for(io, "read error: %s", err)
+            self.errors[self.name_for(io)] = str(err)
             self.in_error = True
             self.close(io)
         if self.in_error:
             return 0
+        count = 0
         if data:
-            self.log_for(io, "read_callback: data=%r", data)
-            self.get_read_buffer(io).extend(data)
+            self.last_read_at = time.monotonic()
+            if self.first_byte_at is None:
+                self.first_byte_at = self.last_read_at
+            self.log_payload(io, "read", data)
+            count = self.get_read_buffer(io).extend(data)
+            if self.capture is not None:
+                self.capture.read(self, self.name_for(io), data, count)
         if self.bufB:
             self.io.write_cb_enable(True)
-        return len(data)
+        return count
 
     def get_write_buffer(self, io):
         if io.same_as(self.io):
             return self.bufB
         raise ValueError("Unknown io: {!r}".format(io))
 
+    def write_limit(self, io, buf):
+        """
+        Most bytes of `buf` to write to `io` now; 0 holds them back until
+        write callbacks are enabled again.
+        """
+        return DEFAULT_WRITE_CHUNK
+
     def write_callback(self, io):
         buf = self.get_write_buffer(io)
         if buf and not self.in_error:
+            limit = self.write_limit(io, buf)
+            if not limit:
+                io.write_cb_enable(False)
+                return
             try:
-                count = io.write(buf.tobytes(), None)
+                # the binding only takes bytes, so copy (at most) one write chunk
+                view = buf.peek(limit)
+                count = io.write(bytes(view), None)
             except Exception as e:
                 self.log_for(io, "write: %s (in_error=%s, in_close=%s, buf=%s)", e, self.in_error, self.in_close, buf)
-                if "remote end closed connection" not in str(err).lower():
+                if "remote end closed connection" not in str(e).lower():
                     self.log_for(io, "write error: %s", e)
+                self.errors[self.name_for(io)] = str(e)
                 self.in_error = True
-                buf[:] = []  # reset the buffer here to avoid infinite loop on connection drop
+                buf.clear()  # reset the buffer here to avoid infinite loop on connection drop
                 self.close(io)
                 return
-            self.log_for(io, "write_callback: data=%s", buf[:count].tobytes())
-            buf[:] = buf[count:]
+            self.log_payload(io, "write", view[:count])
+            if self.capture is not None:
+                self.capture.write(self, self.name_for(io), view, count)
+            buf.consume(count)
         else:
             io.write_cb_enable(False)
             if self.in_close:
@@ -126,25 +267,38 @@ class IOEvent:
     def open_done(self, io, err):
         if err:
             self.log_for(io, "open error: %s", err)
-            if self.io is not None:
-                self.close(io)
-                # normally io would be reset in close_done, but that wont
-                # get called if the gensio failed to open
-                self.io = None
+            name = self.name_for(io)
+            self.errors[name] = str(err)
+            self.close(io)
+            # normally io would be reset in close_done, but that wont
+            # get called if the gensio failed to open
+            setattr(self, name, None)
             return
         self.log_for(io, "Opened gensio: %s", io)
+        if self.opened_at is None:
+            self.opened_at = time.monotonic()
         io.write_cb_enable(True)
         io.read_cb_enable(True)
 
     def close_done(self, io, wake_when_closed=True):
         self.log_for(io, "closed gensio: %s", io)
+        if self.capture is not None:
+            self.capture.close_session(self, self.name_for(io))
         setattr(self, self.name_for(io), None)
         if self.io is None and wake_when_closed:
             self.waiter.wake()
+            self.notify_closed()
+
+    def notify_closed(self):
+        """Tell the accepting listener (if any) that this connection is done."""
+        if self.listener is not None:
+            self.listener.io_closed(self.conn_id)
+            # Break reference loops
+            self.listener = None
 
     def wait(self):
         if self.io is not None:
-            self.waiter.wait(1)
+            TIMERS.wait(self.waiter, done=lambda: self.io is None)
 
 
 class PipeEvent(IOEvent):
@@ -152,16 +306,47 @@ class PipeEvent(IOEvent):
     Connect two gensios and pass data between them.
 
     p = PipeEvent()
-    p.io = gensio.gensio(OSFUNCS, "tcp,localhost,3333", p)
+    p.io = gensio.gensio(osfuncs(), "tcp,localhost,3333", p)
     p.io.open(p)
-    p.io2 = gensio.gensio(OSFUNCS, "stdio(self)", p)
+    p.io2 = gensio.gensio(osfuncs(), "stdio(self)", p)
     p.io2.open(p)
     p.wait()
+
+    Backpressure: when more than `high_water` bytes read from `io` are waiting
+    to be written to `io2`, reads from `io` are disabled until the backlog
+    drains to `low_water`. `high_water2` / `low_water2` do the same for data
+    read from `io2` (and default to the `io` values). `None` disables the limit.
+
+    Coalescing: with `paclen` set, `io` (an AX.25 link) is written whole
+    frames of `paclen` bytes; a shorter tail is held back until more data
+    fills the frame or `coalesce_delay` seconds pass, so a peer dribbling
+    small TCP segments doesn't put as many short I-frames on air. `paclen2`
+    does the same for `io2`. Both default to None, writing data as it comes.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        high_water=DEFAULT_HIGH_WATER,
+        low_water=DEFAULT_LOW_WATER,
+        high_water2=None,
+        low_water2=None,
+        paclen=None,
+        paclen2=None,
+        coalesce_delay=DEFAULT_COALESCE_DELAY,
+    ):
         super().__init__()
         self._io2 = None
+        self.high_water = high_water
+        self.low_water = low_water
+        self.high_water2 = high_water if high_water2 is None else high_water2
+        self.low_water2 = low_water if low_water2 is None else low_water2
+        self.read_paused = set()  # names of gensios with reads disabled
+        self.paclen = paclen
+        self.paclen2 = paclen2
+        self.coalesce_delay = coalesce_delay
+        self.flush_timers = {}  # name -> Timer for a held back tail
+        self.flush_due = set()  # names whose held back tail must go out
+        self.race = None  # failover.Race connecting io2, if any
 
     @property
     def io2(self):
@@ -170,6 +355,7 @@ class PipeEvent(IOEvent):
     @io2.setter
     def io2(self, value):
         self._io2 = value
+        self.read_paused.discard("io2")
         if self._io2 is not None:
             self._io2.set_cbs(self)
 
@@ -179,6 +365,10 @@ class PipeEvent(IOEvent):
         return super().name_for(io)
 
     def close(self, io=None):
+        if self.race is not None:
+            # closes the gateway attempts still in progress
+            self.race.cancel()
+            self.race = None
         super().close(io)
         if self.io2 is not None and not self.in_error:
             self.io2.write_cb_enable(True)
@@ -188,12 +378,91 @@ class PipeEvent(IOEvent):
             return self.bufB
         return super().get_read_buffer(io)
 
+    def watermarks_for(self, io):
+        """Return (high, low) water marks for data read from `io`."""
+        if io.same_as(self.io2):
+            return self.high_water2, self.low_water2
+        return self.high_water, self.low_water
+
+    def peer_of(self, io):
+        if io.same_as(self.io2):
+            return self.io
+        return self.io2
+
     def read_callback(self, io, err, data, auxdata):
         len_data = super().read_callback(io, err, data, auxdata)
-        if self.bufA:
+        if self.bufA and self.io2 is not None:
             self.io2.write_cb_enable(True)
+        high, _ = self.watermarks_for(io)
+        if (
+            high is not None
+            and not self.in_error
+            and len(self.get_read_buffer(io)) >= high
+        ):
+            self.log_for(io, "read paused: backlog=%s", len(self.get_read_buffer(io)))
+            io.read_cb_enable(False)
+            self.read_paused.add(self.name_for(io))
         return len_data
 
+    def resume_reads(self, io):
+        """Re-enable reads from `io` if it was paused and its backlog drained."""
+        if io is None or self.in_error:
+            return
+        name = self.name_for(io)
+        if name not in self.read_paused:
+            return
+        _, low = self.watermarks_for(io)
+        if len(self.get_read_buffer(io)) <= (low or 0):
+            self.read_paused.discard(name)
+            if self.reads_allowed(io):
+                self.log_for(io, "read resumed")
+                io.read_cb_enable(True)
+
+    def reads_allowed(self, io):
+        """
+        Subclasses with their own flow control return False to keep reads
+        from `io` paused after the backlog has drained.
+        """
+        return True
+
+    def write_callback(self, io):
+        super().write_callback(io)
+        # writing to `io` drains the data read from its peer
+        self.resume_reads(self.peer_of(io))
+
+    def write_limit(self, io, buf):
+        paclen = self.paclen2 if io.same_as(self.io2) else self.paclen
+        if not paclen or self.in_close:
+            return DEFAULT_WRITE_CHUNK
+        name = self.name_for(io)
+        if name in self.flush_due:
+            limit = DEFAULT_WRITE_CHUNK
+        else:
+            # whole frames only, the tail waits for more data or the deadline
+            frames = min(len(buf), max(DEFAULT_WRITE_CHUNK, paclen)) // paclen
+            limit = frames * paclen
+        if limit >= len(buf):
+            self.cancel_flush(name)
+        elif name not in self.flush_due and name not in self.flush_timers:
+            self.flush_timers[name] = TIMERS.call_later(
+                self.coalesce_delay, self.flush, name
+            )
+        return limit
+
+    def flush(self, name):
+        """The coalescing deadline passed: write out the held back tail."""
+        self.flush_timers.pop(name, None)
+        self.flush_due.add(name)
+        io = getattr(self, name)
+        if io is not None and not self.in_error:
+            io.write_cb_enable(True)
+
+    def cancel_flush(self, name):
+        timer = self.flush_timers.pop(name, None)
+        if timer is not None:
+            timer.cancel()
+        self.flush_due.discard(name)
+
     def get_write_buffer(self, io):
         if io.same_as(self.io2):
             return self.bufA
@@ -207,13 +476,50 @@ class PipeEvent(IOEvent):
             return
 
     def close_done(self, io):
+        self.cancel_flush(self.name_for(io))
         super().close_done(io, wake_when_closed=False)
         if self.io is None and self.io2 is None:
             self.waiter.wake()
+            self.notify_closed()
 
     def wait(self):
         if self.io is not None or self.io2 is not None:
-            self.waiter.wait(1)
+            TIMERS.wait(
+                self.waiter, done=lambda: self.io is None and self.io2 is None
+            )
+
+
+class SessionTotals:
+    """Accumulated statistics of closed IOEvent sessions."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.first_byte_count = 0
+        self.first_byte_delay = 0.0
+        self.bytes = {"io": 0, "io2": 0}  # bytes read from each side
+
+    def add(self, ioev):
+        now = time.monotonic()
+        self.count += 1
+        if ioev.opened_at is not None:
+            self.duration += now - ioev.opened_at
+            if ioev.first_byte_at is not None:
+                self.first_byte_count += 1
+                self.first_byte_delay += ioev.first_byte_at - ioev.opened_at
+        self.bytes["io"] += ioev.bufA.total_in
+        self.bytes["io2"] += ioev.bufB.total_in if isinstance(ioev, PipeEvent) else 0
+
+
+class _ConnectionCloser:
+    """close_done handler for a bare gensio tracked by a ListenerEvent."""
+
+    def __init__(self, listener, conn_id):
+        self.listener = listener
+        self.conn_id = conn_id
+
+    def close_done(self, io):
+        self.listener.io_closed(self.conn_id)
 
 
 class ListenerEvent:
@@ -221,17 +527,27 @@ class ListenerEvent:
     Listen and accept incoming connections.
 
     listener = ListenerEvent()
-    listener.acc = gensio.gensio_accepter(OSFUNCS, "tcp,3333", listener)
+    listener.acc = gensio.gensio_accepter(osfuncs(), "tcp,3333", listener)
     listener.acc.startup()
     listener.wait()
+
+    Accepted connections are kept in `self.connections`, either as the bare
+    gensio or, for subclasses, as the IOEvent handling it (see `track`).
+
+    Subclasses that set `self.admission` (an admission.Admission) start
+    their sessions through `admit`, which may queue or turn them away.
     """
 
     def __init__(self):
-        self.logger = logging.getLogger(type(self).__name__)
+        self.logger = category_logger("control", type(self).__name__)
         self.acc = None
-        self.ios = []
-        self.waiter = gensio.waiter(OSFUNCS)
+        self.connections = ConnectionRegistry()
+        self.waiter = gensio.waiter(osfuncs())
         self.in_shutdown = False
+        self.accepted = 0
+        # totals for connections that have already closed
+        self.closed = SessionTotals()
+        self.admission = None
 
     def log(self, acc, level, logval):
         self.logger.error("gensio acc %s err: %s", level, logval)
@@ -240,55 +556,116 @@ class ListenerEvent:
         if self.in_shutdown:
             # it will free automatically
             return None
-        self.ios.append(io)
+        self.connections.add(io)
+        return io
+
+    def admit(self, io, start, callsign=None):
+        """
+        Start the session for the accepted `io` by calling `start()`, which
+        returns its IOEvent, now or once `self.admission` lets it through.
+        """
+        if self.admission is None:
+            start()
+        else:
+            self.admission.admit(self, io, callsign, start)
         return io
 
+    def track(self, ioev, callsign=None):
+        """
+        Track an IOEvent handling an accepted connection; it will report
+        back through `io_closed` once all of its gensios are closed.
+        """
+        ioev.listener = self
+        ioev.conn_id = self.connections.add(ioev, callsign=callsign)
+        if ioev.opened_at is None:
+            # accepted gensios are already open, open_done won't be called
+            ioev.opened_at = time.monotonic()
+        self.accepted += 1
+        return ioev.conn_id
+
     def check_finish(self):
-        if len(self.ios) == 0 and self.acc is None:
+        if len(self.connections) == 0 and self.acc is None:
             self.waiter.wake()
 
-    def io_closed(self, io):
+    def io_closed(self, conn_id):
         """
         Called from gensio `close_done` callback to signal to listener
         that the connection is closed and no longer needs to be tracked.
         """
-        for idx, saved_io in enumerate(self.ios):
-            if saved_io.same_as(io):
-                break
-        else:
-            self.logger.warning("untracked connection closed: %r", io)
-            idx = None
-        if idx is not None:
-            del self.ios[idx]
+        conn = self.connections.remove(conn_id)
+        if conn is None:
+            self.logger.warning("untracked connection closed: %r", conn_id)
+        elif isinstance(conn, IOEvent):
+            self.closed.add(conn)
+        if self.admission is not None:
+            self.admission.session_closed(self)
         self.check_finish()
 
     def shutdown_done(self, acc):
         self.acc = None
         self.check_finish()
 
+    def close_connection(self, conn_id, conn):
+        """Start closing a tracked connection without blocking."""
+        if isinstance(conn, IOEvent):
+            if conn.io is not None:
+                conn.close(conn.io)
+            else:
+                conn.close()
+        else:
+            conn.close(_ConnectionCloser(self, conn_id))
+
     def shutdown(self):
         if self.in_shutdown:
             return
         self.in_shutdown = True
         self.acc.shutdown(self)
-        for i in self.ios:
-            i.close_s()
+        if self.admission is not None:
+            self.admission.shutdown()
+        for conn_id, conn in self.connections:
+            try:
+                self.close_connection(conn_id, conn)
+            except Exception:
+                self.logger.exception("error closing connection %r", conn_id)
 
     def wait(self):
-        if self.acc is not None:
-            self.waiter.wait(1)
-
+        if self.acc is not None or len(self.connections):
+            TIMERS.wait(
+                self.waiter,
+                done=lambda: self.acc is None and not len(self.connections),
+            )
 
-INIT_DONE = False
-
-
-def init():
-    global INIT_DONE
-    if INIT_DONE:
-        return
-    global OSFUNCS
-    OSFUNCS = gensio.alloc_gensio_selector(GensioLogger())
-    INIT_DONE = True
 
+def init(osfuncs=None, log_handler=None):
+    """
+    Set up the process's gensio selector and return it.
 
-init()
+    Nothing is allocated at import time; the first gensio, waiter or
+    accepter created through this module calls `init()` with the defaults.
+    Call it explicitly beforehand to use a selector allocated elsewhere
+    (the python binding allows only one per process) or a different
+    handler for gensio's internal log messages (default GensioLogger).
+    """
+    global _osfuncs
+    if _osfuncs is not None:
+        if osfuncs is not None and osfuncs is not _osfuncs:
+            raise RuntimeError("gensio selector is already initialized")
+        return _osfuncs
+    if osfuncs is None:
+        osfuncs = gensio.alloc_gensio_selector(log_handler or GensioLogger())
+    _osfuncs = osfuncs
+    return _osfuncs
+
+
+def osfuncs():
+    """The process's gensio selector, allocated on first use."""
+    if _osfuncs is None:
+        return init()
+    return _osfuncs
+
+
+def __getattr__(name):
+    # OSFUNCS used to be allocated at import time, keep it working lazily
+    if name == "OSFUNCS":
+        return osfuncs()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,148 @@
+"""
+Logging categories for gensio_modems.
+
+Messages are split into categories, each rooted at its own logger so they
+can be switched independently at runtime:
+
+    control - connection lifecycle, modem commands, errors
+    payload - bytes passing through read/write callbacks
+    gensio  - gensio library internal log messages
+
+set_category_level("payload", logging.DEBUG)
+set_payload_trace("hex", limit=32)
+
+Callers on the hot path must check `isEnabledFor` before doing any
+formatting work; `format_payload` is only meant to be called after that.
+"""
+
+import logging
+
+import gensio
+
+
+CATEGORIES = ("control", "payload", "gensio")
+
+# payload trace modes
+TRACE_FULL = "full"  # repr of the whole payload
+TRACE_TRUNCATE = "truncate"  # repr of the first `limit` bytes
+TRACE_HEX = "hex"  # hex dump of the first `limit` bytes
+TRACE_MODES = (TRACE_FULL, TRACE_TRUNCATE, TRACE_HEX)
+
+_payload_trace_mode = TRACE_TRUNCATE
+_payload_trace_limit = 64
+
+# python logging level -> gensio log mask
+_GENSIO_LEVELS = (
+    (logging.CRITICAL, gensio.GENSIO_LOG_FATAL),
+    (logging.ERROR, gensio.GENSIO_LOG_ERR),
+    (logging.WARNING, gensio.GENSIO_LOG_WARNING),
+    (logging.INFO, gensio.GENSIO_LOG_INFO),
+    (logging.DEBUG, gensio.GENSIO_LOG_DEBUG),
+)
+# gensio log level, as passed to gensio_log (by name or number) -> python level
+_PYTHON_LEVELS = {
+    "fatal": logging.CRITICAL,
+    "err": logging.ERROR,
+    "warning": logging.WARNING,
+    "info": logging.INFO,
+    "debug": logging.DEBUG,
+}
+_PYTHON_LEVELS.update(
+    (gensio_level, py_level) for py_level, gensio_level in _GENSIO_LEVELS
+)
+
+
+def category_logger(category, name=None):
+    """Return the logger for `category`, optionally scoped to `name`."""
+    if category not in CATEGORIES:
+        raise ValueError("Unknown log category: {!r}".format(category))
+    if name is None:
+        return logging.getLogger("gensio_modems.{}".format(category))
+    return logging.getLogger("gensio_modems.{}.{}".format(category, name))
+
+
+def set_category_level(category, level):
+    """Set the level for a whole category; may be called at any time."""
+    category_logger(category).setLevel(level)
+    if category == "gensio":
+        mask = 0
+        for py_level, gensio_level in _GENSIO_LEVELS:
+            if level <= py_level:
+                mask |= 1 << gensio_level
+        gensio.gensio_set_log_mask(mask)
+
+
+def set_payload_trace(mode=TRACE_TRUNCATE, limit=64):
+    """Choose how payloads are rendered when the payload category is enabled."""
+    global _payload_trace_mode, _payload_trace_limit
+    if mode not in TRACE_MODES:
+        raise ValueError("Unknown payload trace mode: {!r}".format(mode))
+    _payload_trace_mode = mode
+    _payload_trace_limit = limit
+
+
+def format_payload(data):
+    """Render `data` (bytes-like) according to the payload trace settings."""
+    size = len(data)
+    if _payload_trace_mode == TRACE_FULL or size <= _payload_trace_limit:
+        sample = bytes(data)
+    else:
+        sample = bytes(data[:_payload_trace_limit])
+    if _payload_trace_mode == TRACE_HEX:
+        rendered = sample.hex(" ")
+    else:
+        rendered = repr(sample)
+    if len(sample) < size:
+        rendered += " ...(+{} bytes)".format(size - len(sample))
+    return "[{}] {}".format(size, rendered)
+
+
+class GensioLogger:
+    """gensio internal log callback"""
+
+    logger = category_logger("gensio")
+
+    def gensio_log(self, level, log):
+        py_level = _PYTHON_LEVELS.get(
+            level.lower() if isinstance(level, str) else level, logging.DEBUG
+        )
+        self.logger.log(py_level, "%s: %s", level, log)
+
+
+def add_logging_arguments(parser):
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Level for connection/control messages",
+    )
+    parser.add_argument(
+        "--trace-payload",
+        default="off",
+        choices=["off", *TRACE_MODES],
+        help="Log bytes passing through each connection",
+    )
+    parser.add_argument(
+        "--trace-limit",
+        type=int,
+        default=64,
+        help="Bytes of each payload shown by truncate/hex trace modes",
+    )
+    parser.add_argument(
+        "--gensio-log-level",
+        default="WARNING",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Level for gensio library internal messages",
+    )
+
+
+def setup_logging(args):
+    """Configure python logging from `add_logging_arguments` options."""
+    logging.basicConfig(level=getattr(logging, args.log_level))
+    set_category_level("control", getattr(logging, args.log_level))
+    set_category_level("gensio", getattr(logging, args.gensio_log_level))
+    if args.trace_payload == "off":
+        set_category_level("payload", logging.WARNING)
+    else:
+        set_payload_trace(args.trace_payload, limit=args.trace_limit)
+        set_category_level("payload", logging.DEBUG)
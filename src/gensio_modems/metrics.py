@@ -0,0 +1,288 @@
+"""
+Prometheus text-format metrics.
+
+Nothing is computed on the data path: IOEvent, ChunkBuffer and ListenerEvent
+keep plain counters and timestamps, and the collectors registered with
+`register_collector` read them only when the metrics endpoint is scraped.
+
+watch_listener(listener)
+watch_vara(vara_control)
+serve("tcp,localhost,9100")
+"""
+
+import time
+import weakref
+
+import gensio
+
+from . import expect, gutils
+from .gutils import register_collector
+from .logs import category_logger
+
+
+logger = category_logger("control", "metrics")
+
+PREFIX = "gensio_modems_"
+# a request with no end of headers after this many bytes gets a 400
+MAX_REQUEST = 8 * 1024
+
+# family name -> (type, help)
+FAMILIES = {
+    "sessions_active": ("gauge", "Connections currently open"),
+    "sessions_accepted_total": ("counter", "Connections accepted"),
+    "sessions_closed_total": ("counter", "Connections closed"),
+    "session_duration_seconds_sum": ("counter", "Total duration of closed connections"),
+    "first_byte_seconds_sum": (
+        "counter",
+        "Total time from open to first byte read, closed connections",
+    ),
+    "first_byte_seconds_count": (
+        "counter",
+        "Closed connections that read at least one byte",
+    ),
+    "bytes_read_total": ("counter", "Bytes read, by side of the pipe"),
+    "buffer_bytes": ("gauge", "Bytes waiting to be written, all open connections"),
+    "buffer_peak_bytes": (
+        "gauge",
+        "Most bytes ever waiting to be written, largest open connection",
+    ),
+    "session_age_max_seconds": ("gauge", "Time since the oldest open connection opened"),
+    "session_idle_max_seconds": (
+        "gauge",
+        "Longest time an open connection has gone without reading data",
+    ),
+    "session_bytes_read": ("gauge", "Bytes read by an open connection"),
+    "session_buffer_bytes": ("gauge", "Bytes waiting to be written"),
+    "session_buffer_peak_bytes": ("gauge", "Most bytes ever waiting to be written"),
+    "session_age_seconds": ("gauge", "Time since the connection opened"),
+    "session_idle_seconds": ("gauge", "Time since the connection last read data"),
+    "session_first_byte_seconds": ("gauge", "Time from open to first byte read"),
+    "vara_connected": ("gauge", "1 while VARA reports a connected link"),
+    "vara_ptt": ("gauge", "1 while VARA has PTT on"),
+    "vara_busy": ("gauge", "1 while VARA reports a busy channel"),
+    "vara_tx_buffer_bytes": ("gauge", "Last BUFFER report from VARA"),
+    "upstream_pool_connections": ("gauge", "Pooled gateway connections, ready or connecting"),
+    "upstream_pool_ready": ("gauge", "Pooled gateway connections ready for a session"),
+    "upstream_pool_checkouts_total": ("counter", "Sessions given a pooled gateway connection"),
+    "upstream_pool_misses_total": ("counter", "Sessions that found the pool empty"),
+    "upstream_pool_expired_total": ("counter", "Pooled connections replaced after the idle ttl"),
+    "upstream_pool_failures_total": ("counter", "Pooled connections that failed to open"),
+    "admission_admitted_total": ("counter", "Connections given a session, at once or queued"),
+    "admission_queued_total": ("counter", "Connections queued waiting for a session slot"),
+    "admission_queue_length": ("gauge", "Connections waiting for a session slot"),
+    "admission_rejected_total": ("counter", "Connections turned away busy, by reason"),
+    "gateway_up": ("gauge", "0 while a gateway endpoint is skipped after failures"),
+    "gateway_attempts_total": ("counter", "Connection attempts to a gateway endpoint"),
+    "gateway_wins_total": ("counter", "Sessions a gateway endpoint was first ready for"),
+    "gateway_failures_total": ("counter", "Failed connection attempts to a gateway endpoint"),
+    "login_seconds_sum": ("counter", "Total time to complete automated logins"),
+    "login_seconds_count": ("counter", "Completed automated logins"),
+    "login_timeouts_total": ("counter", "Logins abandoned waiting for a prompt or reply"),
+    "vara_reconnects_total": ("counter", "Times the modem connection was re-established"),
+}
+
+_listeners = weakref.WeakSet()
+_varas = weakref.WeakSet()
+
+
+def watch_listener(listener):
+    """Report sessions of `listener` (a gutils.ListenerEvent)."""
+    _listeners.add(listener)
+
+
+def watch_vara(vara_control):
+    """Report link state and session of `vara_control` (a VaraControlEvent)."""
+    _varas.add(vara_control)
+
+
+def unwatch_vara(vara_control):
+    _varas.discard(vara_control)
+
+
+def _sides(ioev):
+    """(side, read buffer, write buffer) for each end of `ioev`."""
+    sides = [("io", ioev.bufA, ioev.bufB)]
+    if isinstance(ioev, gutils.PipeEvent):
+        # io2 reads into bufB and writes from bufA
+        sides.append(("io2", ioev.bufB, ioev.bufA))
+    return sides
+
+
+def _session_samples(ioev, labels, now):
+    for side, read_buf, write_buf in _sides(ioev):
+        side_labels = dict(labels, side=side)
+        yield "session_bytes_read", side_labels, read_buf.total_in
+        yield "session_buffer_bytes", side_labels, len(write_buf)
+        yield "session_buffer_peak_bytes", side_labels, write_buf.peak
+    if ioev.opened_at is not None:
+        yield "session_age_seconds", labels, now - ioev.opened_at
+        if ioev.first_byte_at is not None:
+            yield "session_first_byte_seconds", labels, ioev.first_byte_at - ioev.opened_at
+    last = ioev.last_read_at or ioev.opened_at
+    if last is not None:
+        yield "session_idle_seconds", labels, now - last
+
+
+def collect_listeners():
+    now = time.monotonic()
+    for listener in list(_listeners):
+        name = {"listener": getattr(listener, "name", type(listener).__name__)}
+        closed = listener.closed
+        yield "sessions_active", name, len(listener.connections)
+        yield "sessions_accepted_total", name, listener.accepted
+        yield "sessions_closed_total", name, closed.count
+        yield "session_duration_seconds_sum", name, closed.duration
+        yield "first_byte_seconds_sum", name, closed.first_byte_delay
+        yield "first_byte_seconds_count", name, closed.first_byte_count
+        admission = listener.admission
+        if admission is not None:
+            yield "admission_admitted_total", name, admission.admitted
+            yield "admission_queued_total", name, admission.queued
+            yield "admission_queue_length", name, len(admission.queue)
+            for reason, count in admission.rejected.items():
+                yield "admission_rejected_total", dict(name, reason=reason), count
+        # open sessions are summed up, not reported one by one: a label per
+        # connection would make a new series for every session ever seen
+        live_bytes = {"io": 0, "io2": 0}
+        buffered = {"io": 0, "io2": 0}
+        peak = {"io": 0, "io2": 0}
+        oldest = idlest = 0
+        for _, conn in listener.connections:
+            if not isinstance(conn, gutils.IOEvent):
+                continue
+            for side, read_buf, write_buf in _sides(conn):
+                live_bytes[side] += read_buf.total_in
+                buffered[side] += len(write_buf)
+                peak[side] = max(peak[side], write_buf.peak)
+            if conn.opened_at is not None:
+                oldest = max(oldest, now - conn.opened_at)
+            last = conn.last_read_at or conn.opened_at
+            if last is not None:
+                idlest = max(idlest, now - last)
+        for side in ("io", "io2"):
+            side_labels = dict(name, side=side)
+            yield "bytes_read_total", side_labels, closed.bytes[side] + live_bytes[side]
+            yield "buffer_bytes", side_labels, buffered[side]
+            yield "buffer_peak_bytes", side_labels, peak[side]
+        yield "session_age_max_seconds", name, oldest
+        yield "session_idle_max_seconds", name, idlest
+
+
+def collect_varas():
+    now = time.monotonic()
+    for vara in list(_varas):
+        labels = {"laddr": vara.laddr, "modem": vara.name}
+        yield "vara_connected", labels, int(vara.connected is not None)
+        yield "vara_ptt", labels, int(bool(vara.ptt))
+        yield "vara_busy", labels, int(bool(vara.busy))
+        yield "vara_tx_buffer_bytes", labels, vara.tx_buffer or 0
+        yield "vara_reconnects_total", labels, vara.reconnects
+        if vara.connected is not None and vara.data_pipe is not None:
+            # one session per modem at most, so its own series stay few
+            yield from _session_samples(vara.data_pipe, labels, now)
+
+
+def collect_logins():
+    for kind, stats in list(expect.LOGINS.items()):
+        labels = {"login": kind}
+        yield "login_seconds_sum", labels, stats.seconds
+        yield "login_seconds_count", labels, stats.count
+        yield "login_timeouts_total", labels, stats.timeouts
+
+
+register_collector(collect_listeners)
+register_collector(collect_varas)
+register_collector(collect_logins)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render():
+    """Return all current metrics in Prometheus text exposition format."""
+    samples = {}
+    for collector in gutils.COLLECTORS:
+        try:
+            for family, labels, value in collector():
+                samples.setdefault(family, []).append((labels, value))
+        except Exception:
+            logger.exception("metrics collector failed: %r", collector)
+    lines = []
+    for family, family_samples in samples.items():
+        kind, help_text = FAMILIES[family]
+        name = PREFIX + family
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for labels, value in family_samples:
+            label_str = ",".join(
+                '{}="{}"'.format(k, _escape(v)) for k, v in sorted(labels.items())
+            )
+            lines.append("{}{{{}}} {}".format(name, label_str, value))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequest(gutils.IOEvent):
+    """Answer one HTTP request with the current metrics, then close."""
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        if self.in_close or err:
+            return count
+        request = self.bufA.tobytes()
+        if b"\r\n\r\n" in request or b"\n\n" in request:
+            body = render().encode("utf-8")
+            self.respond(b"200 OK", b"text/plain; version=0.0.4", body)
+        elif len(request) > MAX_REQUEST:
+            self.respond(b"400 Bad Request", b"text/plain", b"Request too large\n")
+        return count
+
+    def respond(self, status, content_type, body):
+        self.bufB.extend(
+            b"HTTP/1.0 %s\r\n"
+            b"Content-Type: %s\r\n"
+            b"Content-Length: %d\r\n\r\n" % (status, content_type, len(body))
+        )
+        self.bufB.extend(body)
+        self.bufA.clear()
+        self.io.read_cb_enable(False)
+        # closes once the response has been written
+        self.close()
+
+
+class MetricsListener(gutils.ListenerEvent):
+    """
+    Serve `render()` over HTTP on any gensio accepter.
+
+    listener = serve("tcp,localhost,9100")
+    """
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        request = MetricsRequest()
+        request.io = io
+        self.track(request)
+        io.read_cb_enable(True)
+        return io
+
+
+def serve(gensio_str):
+    listener = MetricsListener()
+    listener.acc = gensio.gensio_accepter(gutils.osfuncs(), gensio_str, listener)
+    listener.acc.startup()
+    return listener
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help="gensio accepter to serve Prometheus metrics on, e.g. tcp,localhost,9100",
+    )
+
+
+def start_metrics(args):
+    if args.metrics:
+        return serve(args.metrics)
+    return None
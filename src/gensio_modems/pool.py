@@ -0,0 +1,290 @@
+"""
+Pre-connected upstream gensios for the gateway side of a session.
+
+Opening `tcp,cms.winlink.org,8772` and waiting for the `Callsign :` prompt
+takes a while on a slow uplink. An UpstreamPool keeps a few connections open
+and already at the prompt, so a new RF session can take one immediately.
+
+pool = UpstreamPool("tcp,cms.winlink.org,8772", size=2, ready_prompt=b"callsign")
+pool.start()
+if not pool.attach(pipe):  # pipe is a gutils.PipeEvent
+    ...open pipe.io2 as usual...
+"""
+
+import time
+import weakref
+
+import gensio
+
+from .failover import split_gateways
+from .gutils import IOEvent, TIMERS, osfuncs, register_collector
+from .logs import category_logger
+from .registry import ConnectionRegistry
+
+
+logger = category_logger("control", "pool")
+
+DEFAULT_IDLE_TTL = 300  # seconds a warm connection is kept before replacing it
+CONNECT_TIMEOUT = 30  # seconds for a new connection to show the ready prompt
+CHECK_INTERVAL = 10  # seconds between health checks of idle connections
+RETRY_DELAY = 5  # seconds to back off after a connection fails
+
+
+_pools = weakref.WeakSet()
+
+
+class PooledUpstream(IOEvent):
+    """
+    An idle upstream connection: reads are left enabled so anything the far
+    end sends is buffered (and a dropped connection is noticed) until a
+    session takes it over.
+    """
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+        self.ready = False
+        self.created_at = time.monotonic()
+        self.ready_at = None
+
+    def open_done(self, io, err):
+        super().open_done(io, err)
+        if err:
+            # close_done never comes for a gensio that failed to open
+            self.pool.open_failed(self)
+            return
+        if self.pool.ready_prompt is None:
+            self.mark_ready()
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        if (
+            not self.ready
+            and not err
+            and self.pool.ready_prompt is not None
+            and self.pool.ready_prompt in self.bufA.tobytes().lower()
+        ):
+            self.mark_ready()
+        return count
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_at = time.monotonic()
+        self.log_for(
+            self.io, "ready in %.3fs", self.ready_at - self.created_at
+        )
+
+    @property
+    def healthy(self):
+        return self.io is not None and not self.in_close and not self.in_error
+
+
+class UpstreamPool:
+    """
+    Keep `size` connections to `gensio_str` open and ready for checkout.
+
+    A connection is ready once it is open and, with `ready_prompt`, once the
+    far end has sent it (compared lowercased). Ready connections are replaced
+    after `idle_ttl` seconds, connections that drop or never get ready are
+    discarded, and the pool refills itself from the wait loop.
+    """
+
+    def __init__(
+        self,
+        gensio_str,
+        size=2,
+        idle_ttl=DEFAULT_IDLE_TTL,
+        ready_prompt=None,
+        connect_timeout=CONNECT_TIMEOUT,
+        check_interval=CHECK_INTERVAL,
+    ):
+        self.gensio_str = gensio_str
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self.ready_prompt = ready_prompt.lower() if ready_prompt else None
+        self.connect_timeout = connect_timeout
+        self.check_interval = check_interval
+        self.members = ConnectionRegistry()
+        self.in_shutdown = False
+        self.refill_timer = None
+        self.check_timer = None
+        self.retry_at = 0
+        # counters for metrics
+        self.checkouts = 0
+        self.misses = 0
+        self.expired = 0
+        self.failed = 0
+        _pools.add(self)
+
+    def __len__(self):
+        return len(self.members)
+
+    @property
+    def ready_count(self):
+        return sum(1 for _, m in self.members if m.ready and m.healthy)
+
+    def start(self):
+        self.refill()
+        self.check_timer = TIMERS.call_later(self.check_interval, self.check)
+        return self
+
+    def open_member(self):
+        member = PooledUpstream(self)
+        member.listener = self
+        member.conn_id = self.members.add(member)
+        try:
+            member.io = gensio.gensio(osfuncs(), self.gensio_str, member)
+            member.io.open(member)
+        except Exception as exc:
+            logger.error("pool: cannot open %s: %s", self.gensio_str, exc)
+            self.open_failed(member)
+
+    def refill(self):
+        self.refill_timer = None
+        if self.in_shutdown:
+            return
+        delay = self.retry_at - time.monotonic()
+        if delay > 0:
+            self.schedule_refill(delay)
+            return
+        for _ in range(self.size - len(self.members)):
+            self.open_member()
+
+    def schedule_refill(self, delay=0):
+        if self.refill_timer is None and not self.in_shutdown:
+            self.refill_timer = TIMERS.call_later(delay, self.refill)
+
+    def discard(self, member):
+        """Close `member` and replace it."""
+        self.members.remove(member.conn_id)
+        member.listener = None
+        if member.io is not None:
+            member.close(member.io)
+        self.schedule_refill()
+
+    def open_failed(self, member):
+        self.failed += 1
+        self.retry_at = time.monotonic() + RETRY_DELAY
+        self.members.remove(member.conn_id)
+        member.listener = None
+        self.schedule_refill(RETRY_DELAY)
+
+    def io_closed(self, conn_id):
+        """An idle member's gensio closed (the far end hung up)."""
+        if self.members.remove(conn_id) is not None:
+            logger.info("pool: idle connection %s dropped", conn_id)
+            self.schedule_refill()
+
+    def check(self):
+        """Health check: drop members that are dead, stuck or past their ttl."""
+        self.check_timer = None
+        if self.in_shutdown:
+            return
+        now = time.monotonic()
+        for conn_id, member in self.members:
+            if not member.healthy:
+                self.discard(member)
+            elif not member.ready and now - member.created_at > self.connect_timeout:
+                logger.warning("pool: no prompt after %ss", self.connect_timeout)
+                self.discard(member)
+            elif member.ready and now - member.ready_at > self.idle_ttl:
+                self.expired += 1
+                self.discard(member)
+        self.refill()
+        self.check_timer = TIMERS.call_later(self.check_interval, self.check)
+
+    def checkout(self):
+        """Return a ready PooledUpstream (no longer owned by the pool), or None."""
+        for conn_id, member in self.members:
+            if member.ready and member.healthy:
+                self.members.remove(conn_id)
+                member.listener = None
+                self.checkouts += 1
+                self.schedule_refill()
+                return member
+        self.misses += 1
+        return None
+
+    def attach(self, pipe):
+        """
+        Make a pooled connection the `io2` of `pipe` (a gutils.PipeEvent).
+
+        Whatever the far end already sent (e.g. the RMS `Callsign :` prompt)
+        is replayed through `pipe.read_callback`. Returns False, and leaves
+        `pipe` alone, when no connection is ready.
+        """
+        member = self.checkout()
+        if member is None:
+            return False
+        io = member.io
+        pending = member.bufA.tobytes()
+        member.io = None
+        pipe.io2 = io  # takes over the gensio callbacks
+        if pipe.opened_at is None:
+            pipe.opened_at = time.monotonic()
+        io.write_cb_enable(True)
+        io.read_cb_enable(True)
+        if pending:
+            pipe.read_callback(io, None, pending, None)
+        return True
+
+    def shutdown(self):
+        self.in_shutdown = True
+        for timer in (self.refill_timer, self.check_timer):
+            if timer is not None:
+                timer.cancel()
+        for conn_id, member in self.members:
+            self.members.remove(conn_id)
+            member.listener = None
+            if member.io is not None:
+                member.close(member.io)
+
+
+def collect_pools():
+    for pool in list(_pools):
+        labels = {"gateway": pool.gensio_str}
+        yield "upstream_pool_connections", labels, len(pool)
+        yield "upstream_pool_ready", labels, pool.ready_count
+        yield "upstream_pool_checkouts_total", labels, pool.checkouts
+        yield "upstream_pool_misses_total", labels, pool.misses
+        yield "upstream_pool_expired_total", labels, pool.expired
+        yield "upstream_pool_failures_total", labels, pool.failed
+
+
+register_collector(collect_pools)
+
+
+def add_pool_arguments(parser):
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=0,
+        help="Keep this many gateway connections open and logged in up to the "
+        "first prompt, ready for new sessions (0 disables the pool)",
+    )
+    parser.add_argument(
+        "--pool-ttl",
+        type=float,
+        default=DEFAULT_IDLE_TTL,
+        help="Replace idle pooled gateway connections after this many seconds",
+    )
+
+
+def start_pool(args, gensio_str, rms=False):
+    """
+    Start a pool for the gateway `gensio_str` if --pool-size was given.
+    Gateways with per-session %-substitutions can't be pre-connected; of a
+    list of gateways (see failover.py), the first is.
+    """
+    if args.pool_size <= 0:
+        return None
+    gensio_str = split_gateways(gensio_str)[0]
+    if "%" in gensio_str:
+        logger.warning("pool: %s depends on the session, not pooling", gensio_str)
+        return None
+    return UpstreamPool(
+        gensio_str,
+        size=args.pool_size,
+        idle_ttl=args.pool_ttl,
+        ready_prompt=b"callsign" if rms else None,
+    ).start()
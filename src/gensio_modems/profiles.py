@@ -0,0 +1,311 @@
+"""
+Per-peer AX.25 link profiles, learned from completed sessions.
+
+Every peer starts on the middle rung of LADDER (window 7, paclen 256, no
+extended mode). A failed session (the link dropped, or never came up) or
+one whose connect took much longer than the best seen for that peer - a
+sign of retransmitted SABMs - moves it a rung down to smaller frames and a
+smaller window with more retries; a run of clean sessions moves it a rung
+up, towards extended mode and a large window. Like capture, this module has
+no gensio dependency; the store is a JSON file.
+
+profiles = ProfileStore("/var/lib/gensio-modems/profiles.json")
+endpoint = tune_endpoint(endpoint, profiles.profile_for(ax25_peer(endpoint)))
+...
+profiles.observe("KF7HVM", failed=False, rtt=2.1, size=5120, duration=45.0)
+
+python -m gensio_modems.profiles show profiles.json
+"""
+
+import json
+import os
+import re
+import time
+from typing import NamedTuple
+
+
+class LinkProfile(NamedTuple):
+    window: int  # I-frames outstanding (readwindow / writewindow)
+    paclen: int  # bytes per I-frame (max_write_size)
+    extended: bool  # modulo-128 sequence numbers, needed for window > 7
+    retries: int  # retransmissions before the link is given up
+
+    def options(self):
+        """The profile as gensio ax25 options."""
+        return {
+            "readwindow": str(self.window),
+            "writewindow": str(self.window),
+            "max_write_size": str(self.paclen),
+            "extended": "1" if self.extended else "0",
+            "retries": str(self.retries),
+        }
+
+
+# from lossy (short frames, one at a time, persistent) to clean paths
+LADDER = (
+    LinkProfile(window=1, paclen=64, extended=False, retries=10),
+    LinkProfile(window=2, paclen=128, extended=False, retries=8),
+    LinkProfile(window=4, paclen=128, extended=False, retries=6),
+    LinkProfile(window=7, paclen=256, extended=False, retries=4),
+    LinkProfile(window=16, paclen=256, extended=True, retries=3),
+    LinkProfile(window=32, paclen=256, extended=True, retries=3),
+)
+DEFAULT_LEVEL = 3
+# clean sessions in a row before moving a rung up
+CLIMB_AFTER = 2
+# a connect this many times slower than the best seen counts as retried
+SLOW_CONNECT = 2.0
+# weight of the newest session in the running averages
+EWMA = 0.3
+
+
+class PeerStats:
+    """What the store knows about one peer."""
+
+    FIELDS = (
+        "level",
+        "streak",
+        "sessions",
+        "failures",
+        "rtt",
+        "rtt_min",
+        "retries",
+        "throughput",
+        "updated",
+    )
+
+    def __init__(self, level=DEFAULT_LEVEL):
+        self.level = level
+        self.streak = 0  # clean sessions since the last change
+        self.sessions = 0
+        self.failures = 0
+        self.rtt = None  # seconds to connect, running average
+        self.rtt_min = None
+        self.retries = 0.0  # estimated retransmissions per connect, average
+        self.throughput = None  # bytes/s over the session, running average
+        self.updated = None  # time.time of the last session
+
+    @property
+    def profile(self):
+        return LADDER[self.level]
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for name in cls.FIELDS:
+            if name in data:
+                setattr(stats, name, data[name])
+        stats.level = min(max(int(stats.level), 0), len(LADDER) - 1)
+        return stats
+
+
+def average(old, new):
+    return new if old is None else old + EWMA * (new - old)
+
+
+class ProfileStore:
+    """
+    Link profiles by callsign (without SSID), kept in the JSON file at
+    `path` (None: in memory only) and saved after every session.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.peers = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.peers = {
+                call: PeerStats.from_dict(stats)
+                for call, stats in data.get("peers", {}).items()
+            }
+
+    @staticmethod
+    def key(callsign):
+        return callsign.partition("-")[0].upper()
+
+    def stats_for(self, callsign):
+        key = self.key(callsign)
+        stats = self.peers.get(key)
+        if stats is None:
+            stats = self.peers[key] = PeerStats()
+        return stats
+
+    def profile_for(self, callsign):
+        stats = self.peers.get(self.key(callsign))
+        return LADDER[DEFAULT_LEVEL] if stats is None else stats.profile
+
+    def observe(self, callsign, failed=False, rtt=None, size=0, duration=None):
+        """
+        Record a completed session with `callsign` and return the profile
+        for the next one. `rtt` is how long the link took to come up (None
+        when it wasn't timed, e.g. an accepted link), `size` the bytes
+        carried in both directions over `duration` seconds.
+        """
+        stats = self.stats_for(callsign)
+        stats.sessions += 1
+        stats.updated = time.time()
+        retried = False
+        if rtt is not None:
+            stats.rtt = average(stats.rtt, rtt)
+            if stats.rtt_min is None or rtt < stats.rtt_min:
+                stats.rtt_min = rtt
+            # each retransmitted SABM adds about one more connect time
+            retries = max(rtt / stats.rtt_min - 1, 0.0) if stats.rtt_min else 0.0
+            stats.retries = average(stats.retries, retries)
+            retried = rtt > stats.rtt_min * SLOW_CONNECT
+        if duration and size and not failed:
+            stats.throughput = average(stats.throughput, size / duration)
+        if failed:
+            stats.failures += 1
+        if failed or retried:
+            stats.level = max(stats.level - 1, 0)
+            stats.streak = 0
+        else:
+            stats.streak += 1
+            if stats.streak >= CLIMB_AFTER and stats.level < len(LADDER) - 1:
+                stats.level += 1
+                stats.streak = 0
+        self.save()
+        return stats.profile
+
+    def save(self):
+        if self.path is None:
+            return
+        data = {
+            "version": 1,
+            "peers": {call: stats.to_dict() for call, stats in self.peers.items()},
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def observe_session(profiles, ioev, callsign, side, rtt=None):
+    """
+    Record the closed IOEvent `ioev`, whose AX.25 link to `callsign` is its
+    `side` ("io" or "io2"), in `profiles`.
+    """
+    error = ioev.errors.get(side)
+    # a disconnect by the far end is a clean end of session
+    failed = error is not None and "remote end closed" not in error.lower()
+    duration = None
+    if ioev.opened_at is not None:
+        duration = time.monotonic() - ioev.opened_at
+    size = ioev.bufA.total_in + ioev.bufB.total_in
+    return profiles.observe(
+        callsign, failed=failed, rtt=rtt, size=size, duration=duration
+    )
+
+
+_AX25_OPTIONS = re.compile(r"\bax25\(")
+
+
+def split_options(text):
+    """Split gensio options on the commas that aren't in quotes."""
+    options = []
+    start = 0
+    quoted = False
+    for ix, char in enumerate(text):
+        if char == '"':
+            quoted = not quoted
+        elif char == "," and not quoted:
+            options.append(text[start:ix])
+            start = ix + 1
+    options.append(text[start:])
+    return [option for option in options if option]
+
+
+def _ax25_span(endpoint):
+    """(start, end) of the option list in `endpoint`'s ax25(...), or None."""
+    match = _AX25_OPTIONS.search(endpoint)
+    if match is None:
+        return None
+    quoted = False
+    for ix in range(match.end(), len(endpoint)):
+        char = endpoint[ix]
+        if char == '"':
+            quoted = not quoted
+        elif char == ")" and not quoted:
+            return match.end(), ix
+    return None
+
+
+def ax25_peer(endpoint):
+    """The destination callsign of an ax25(addr="<port>,<dest>,<src>") endpoint."""
+    span = _ax25_span(endpoint)
+    if span is None:
+        return None
+    for option in split_options(endpoint[span[0] : span[1]]):
+        key, _, value = option.partition("=")
+        if key.strip() == "addr":
+            addrs = value.strip('"').split(",")
+            return addrs[1] if len(addrs) > 1 else None
+    return None
+
+
+def tune_endpoint(endpoint, profile):
+    """`endpoint` with its ax25 options set to those of `profile`."""
+    span = _ax25_span(endpoint)
+    if span is None:
+        return endpoint
+    wanted = profile.options()
+    options = []
+    for option in split_options(endpoint[span[0] : span[1]]):
+        key = option.partition("=")[0].strip()
+        if key not in wanted:
+            options.append(option)
+    options.extend("{}={}".format(key, value) for key, value in wanted.items())
+    return endpoint[: span[0]] + ",".join(options) + endpoint[span[1] :]
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        "--profiles",
+        default=None,
+        help="Learn AX.25 link parameters per peer callsign, kept in this JSON file",
+    )
+
+
+def start_profiles(args):
+    if not args.profiles:
+        return None
+    return ProfileStore(args.profiles)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show learned AX.25 link profiles")
+    parser.add_argument("command", choices=["show"])
+    parser.add_argument("profiles")
+    args = parser.parse_args()
+
+    store = ProfileStore(args.profiles)
+    for call, stats in sorted(store.peers.items()):
+        profile = stats.profile
+        print(
+            "{:<10} window={:<3} paclen={:<4} extended={} retries={:<3} "
+            "sessions={} failures={} rtt={} retries/connect={:.2f} {}".format(
+                call,
+                profile.window,
+                profile.paclen,
+                int(profile.extended),
+                profile.retries,
+                stats.sessions,
+                stats.failures,
+                "-" if stats.rtt is None else "{:.2f}s".format(stats.rtt),
+                stats.retries,
+                "-"
+                if stats.throughput is None
+                else "{:.0f}B/s".format(stats.throughput),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -6,33 +6,40 @@ use with pat to establish a "telnet" connection that uses gensio for
 AX.25 transport.
 """
 
-import array
-import argparse
-import logging
 import re
-import shlex
-import subprocess
 import sys
+import time
 
 import gensio
 
-
-# python-native logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger("gaxproxy")
+from gensio_modems.admission import add_admission_arguments, start_admission
+from gensio_modems.buffer import ChunkBuffer
+from gensio_modems.expect import Expect, Step, login_stats
+from gensio_modems.gutils import (
+    DEFAULT_COALESCE_DELAY,
+    DEFAULT_HIGH_WATER,
+    DEFAULT_LOW_WATER,
+    ListenerEvent,
+    PipeEvent,
+    TIMERS,
+    osfuncs,
+)
+from gensio_modems.logs import add_logging_arguments, category_logger, setup_logging
+from gensio_modems.profiles import (
+    add_profile_arguments,
+    ax25_peer,
+    observe_session,
+    start_profiles,
+    tune_endpoint,
+)
+
+logger = category_logger("control", "gaxproxy")
 
 CRED_PROMPTS = [b"Callsign :\r", b"Password :\r"]
-
-
-class GensioLogger:
-    """gensio internal log callback"""
-
-    def gensio_log(self, level, log):
-        logger.debug("***%s log: %s", level, log)
-
-
-gensio.gensio_set_log_mask(gensio.GENSIO_LOG_MASK_ALL)
-o = gensio.alloc_gensio_selector(GensioLogger())
+# one credential per line; blank lines (e.g. the \n of a split \r\n) are skipped
+CRED_LINE = Step(rb"[\r\n]*([^\r\n]+)[\r\n]", name="credential")
+# seconds the client has to answer each prompt
+CRED_TIMEOUT = 60
 
 
 def replace_positional(endpoint, *args):
@@ -43,213 +50,308 @@ def replace_positional(endpoint, *args):
 
 def spawn_for(ioev, endpoint):
     logger.info(f"spawning {endpoint}")
-    return gensio.gensio(o, endpoint, ioev)
-
-
-class IOEvent:
-    def __init__(self, accev, require_creds=1):
-        self.accev = accev
-        self._io = None  # the "listener" end, typically telnet connection
-        self._io2 = None  # established on demand to make an ax25 connection
-        # io reads into bufA and io2 writes from bufA
-        self.bufA = array.array("B")
-        # io writes from bufB and io2 reads into bufB
-        self.bufB = array.array("B")
-        self.in_close = False  # true if either gensio is down or going down
+    return gensio.gensio(osfuncs(), endpoint, ioev)
+
+
+class ParkedLink:
+    """Handler for an idle AX.25 link held by a LinkCache."""
+
+    def __init__(self, cache, endpoint, io):
+        self.cache = cache
+        self.endpoint = endpoint
+        self.io = io
+        # anything the gateway sends while parked goes to the next session
+        self.pending = ChunkBuffer()
+        self.parked_at = time.monotonic()
+        self.timer = TIMERS.call_later(cache.idle, self.expire)
+        io.set_cbs(self)
+        io.write_cb_enable(False)
+        io.read_cb_enable(True)
+
+    def read_callback(self, io, err, data, auxdata):
+        if err:
+            logger.info("parked link to %s dropped: %s", self.endpoint, err)
+            self.close()
+            return 0
+        self.pending.extend(data)
+        return len(data)
+
+    def write_callback(self, io):
+        io.write_cb_enable(False)
+
+    def expire(self):
+        self.timer = None
+        logger.info("parked link to %s idle for %ss, closing", self.endpoint, self.cache.idle)
+        self.close()
+
+    def unpark(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        io, self.io = self.io, None
+        return io
+
+    def close(self):
+        self.cache.remove(self)
+        io = self.unpark()
+        if io is not None:
+            io.close(self)
+
+    def close_done(self, io):
+        pass
+
+
+class LinkCache:
+    """
+    Keep AX.25 links open for `idle` seconds after their telnet session
+    ends, keyed by the endpoint (gateway) they were opened for, so the next
+    session to the same gateway skips the connection setup.
+    """
+
+    def __init__(self, idle):
+        self.idle = idle
+        self.links = {}  # endpoint -> [ParkedLink], most recent last
+        self.parked = 0
+        self.reused = 0
+
+    def __len__(self):
+        return sum(len(links) for links in self.links.values())
+
+    def park(self, endpoint, io):
+        logger.info("parking link to %s for up to %ss", endpoint, self.idle)
+        self.links.setdefault(endpoint, []).append(ParkedLink(self, endpoint, io))
+        self.parked += 1
+
+    def take(self, endpoint):
+        """Return (io, pending bytes) of a parked link to `endpoint`, or None."""
+        links = self.links.get(endpoint)
+        if not links:
+            return None
+        link = links.pop()
+        if not links:
+            del self.links[endpoint]
+        self.reused += 1
+        logger.info(
+            "reusing link to %s, parked %.1fs",
+            endpoint,
+            time.monotonic() - link.parked_at,
+        )
+        return link.unpark(), link.pending.tobytes()
+
+    def remove(self, link):
+        links = self.links.get(link.endpoint, [])
+        if link in links:
+            links.remove(link)
+            if not links:
+                del self.links[link.endpoint]
+
+    def shutdown(self):
+        for links in list(self.links.values()):
+            for link in list(links):
+                link.close()
+
+
+class ProxyPipeEvent(PipeEvent):
+    """
+    Pipe from a telnet client (io) to an AX.25 link (io2).
+
+    The AX.25 link is only opened once the client has answered
+    `require_creds` prompts; the answers fill in %0, %1, ... of the
+    listener's endpoint.
+    """
+
+    def __init__(self, listener, require_creds=1, **kwargs):
+        super().__init__(**kwargs)
+        self.proxy = listener
         self.require_creds = require_creds
         self.creds = []
+        self.cred_login = None
+        self.cred_timer = None
+        self.endpoint = None  # io2's endpoint, once the credentials are in
+        self.io2_open = False
+        # for the listener's link profiles
+        self.link_peer = None
+        self.link_started = None
+        self.link_rtt = None
+        if self.require_creds:
+            self.cred_login = Expect([CRED_LINE] * self.require_creds)
+            self.cred_timer = TIMERS.call_later(CRED_TIMEOUT, self.creds_expired)
         if self.require_creds == 1:
             # the "Password"-only style
             self.bufB.extend(CRED_PROMPTS[1])
         elif self.require_creds:
             self.bufB.extend(CRED_PROMPTS[0])
 
-    @property
-    def io(self):
-        return self._io
-
-    @io.setter
-    def io(self, value):
-        self._io = value
-        if self._io is not None:
-            self._io.set_cbs(self)
-            self.spawn_io2_when_ready()
-
-    @property
-    def io2(self):
-        return self._io2
-
-    @io2.setter
-    def io2(self, value):
-        self._io2 = value
-        if self._io2 is not None:
-            self._io2.set_cbs(self)
-
-    def name_for(self, io):
-        if io.same_as(self.io):
-            return "io"
-        elif io.same_as(self.io2):
-            return "io2"
-        raise ValueError("Unknown io: {!r}".format(io))
-
-    def log_for(self, io, message, *args, level=logging.DEBUG, **kwargs):
-        """
-        Log a message in the context of the given `io`.
-        """
-        logger.log(level, "{} {}".format(self.name_for(io), message), *args, **kwargs)
-
-    def close(self, io):
-        self.in_close = True
-        # with in_close=True, write_callback will close io after buffer is drained
-        self.io.write_cb_enable(True)
-        self.io2.write_cb_enable(True)
-        io.close(self)
-
-    def get_read_buffer(self, io):
-        if io.same_as(self.io):
-            return self.bufA
-        elif io.same_as(self.io2):
-            return self.bufB
-        raise ValueError("Unknown io: {!r}".format(io))
-
-    def spawn_io2_when_ready(self):
+    def close(self, io=None):
+        if self.cred_timer is not None:
+            self.cred_timer.cancel()
+            self.cred_timer = None
+        if io is not None and io.same_as(self.io):
+            self.park_io2()
+        elif io is not None and io.same_as(self.io2):
+            self.io2_open = False
+        super().close(io)
+
+    def park_io2(self):
+        """Hand an idle, healthy io2 to the link cache instead of closing it."""
+        links = self.proxy.links
         if (
-            self.io2 is None
-            and len(self.creds) >= self.require_creds
-            and not self.in_close
+            links is None
+            or self.proxy.in_shutdown
+            or self.io2 is None
+            or not self.io2_open
+            or self.bufA
         ):
-            # once creds are received, spawn and connect the second endpoint
-            self.io2 = spawn_for(
-                ioev=self,
-                endpoint=replace_positional(self.accev.endpoint, *self.creds),
-            )
-            self.io2.open(self)
+            return
+        io2 = self.io2
+        self.io2 = None
+        self.io2_open = False
+        links.park(self.endpoint, io2)
+
+    def creds_expired(self):
+        self.cred_timer = None
+        login_stats("proxy").timeouts += 1
+        self.logger.error(
+            "no credentials after %ss (got %s of %s), closing",
+            CRED_TIMEOUT,
+            len(self.creds),
+            self.require_creds,
+        )
+        if self.io is not None:
+            self.close(self.io)
+
+    def handle_creds(self, data):
+        """Collect credential lines from `data`; anything after them is kept for io2."""
+        for hit in self.cred_login.feed(data):
+            self.creds.append(hit.match.group(1).decode("utf-8", "replace").strip())
+            if len(self.creds) < self.require_creds:
+                self.bufB.extend(CRED_PROMPTS[len(self.creds) % len(CRED_PROMPTS)])
+                self.io.write_cb_enable(True)
+                # the deadline is per prompt
+                self.cred_timer.cancel()
+                self.cred_timer = TIMERS.call_later(CRED_TIMEOUT, self.creds_expired)
+        if self.cred_login.done:
+            self.cred_timer.cancel()
+            self.cred_timer = None
+            login_stats("proxy").add(self.cred_login)
+            self.bufA.extend(self.cred_login.drain().lstrip(b"\r\n"))
+            # fast path: no more credential checks for this connection
+            self.cred_login = None
+            self.spawn_io2()
+
+    def spawn_io2(self):
+        """Connect the AX.25 side, reusing a parked link when there is one."""
+        if self.in_close:
+            return
+        self.endpoint = replace_positional(self.proxy.endpoint, *self.creds)
+        link = None
+        if self.proxy.links is not None:
+            link = self.proxy.links.take(self.endpoint)
+        if link is not None:
+            self.io2, pending = link
+            self.io2_open = True
+            self.bufB.extend(pending)
+            self.io.write_cb_enable(True)
+            self.io2.write_cb_enable(True)
+            self.io2.read_cb_enable(True)
+            return
+        endpoint = self.endpoint
+        if self.proxy.profiles is not None:
+            self.link_peer = ax25_peer(endpoint)
+            if self.link_peer:
+                profile = self.proxy.profiles.profile_for(self.link_peer)
+                endpoint = tune_endpoint(endpoint, profile)
+                if self.paclen2:
+                    self.paclen2 = profile.paclen
+        self.link_started = time.monotonic()
+        self.io2 = spawn_for(ioev=self, endpoint=endpoint)
+        self.io2.open(self)
 
     def read_callback(self, io, err, data, auxdata):
-        if err:
-            self.log_for(io, "read: %s", err)
-            if err != "Remote end closed connection":
-                self.log_for(io, "read error: %s", err)
-            self.close(io)
-            return 0
-        if data:
-            self.log_for(io, "read_callback: data=%r", data)
-            if len(self.creds) < self.require_creds and io.same_as(self.io):
-                self.creds.append(data.decode("utf-8").strip())
-                if len(self.creds) < self.require_creds:
-                    self.bufB.extend(CRED_PROMPTS[len(self.creds) % len(CRED_PROMPTS)])
-            else:
-                self.get_read_buffer(io).extend(data)
-        self.spawn_io2_when_ready()
-        if self.bufA:
-            self.io2.write_cb_enable(True)
-        if self.bufB:
-            self.io.write_cb_enable(True)
+        if self.cred_login is None or err or not data or not io.same_as(self.io):
+            return super().read_callback(io, err, data, auxdata)
+        # credential stage: nothing is forwarded until io2 is connected
+        self.log_payload(io, "read", data)
+        self.handle_creds(data)
         return len(data)
 
-    def get_write_buffer(self, io):
-        if io.same_as(self.io):
-            return self.bufB
-        elif io.same_as(self.io2):
-            return self.bufA
-        raise ValueError("Unknown io: {!r}".format(io))
-
-    def write_callback(self, io):
-        buf = self.get_write_buffer(io)
-        if buf:
-            try:
-                count = io.write(buf.tobytes(), None)
-            except Exception as e:
-                self.log_for(io, "write: %s", e)
-                if str(e) != "Remote end closed connection":
-                    self.log_for(io, "write error: %s", e)
-                self.close(io)
-                return
-            self.log_for(io, "write_callback: data=%s", buf[:count].tobytes())
-            buf[:] = buf[count:]
-
-        if not buf:
-            io.write_cb_enable(False)
-            if self.in_close:
-                io.close(self)
-
     def open_done(self, io, err):
+        super().open_done(io, err)
         if err:
-            self.log_for(io, "open error: %s", err)
-            for io in [self.io, self.io2]:
-                if io is not None:
-                    try:
-                        io.close(self)
-                    except Exception:
-                        pass  # ignore close errors for unestablished sessions
+            # the AX.25 link failed, hang up on the telnet client as well
+            if self.io is not None:
+                self.close(self.io)
             return
-        self.log_for(io, "Opened gensio: %s", io)
-        io.write_cb_enable(True)
-        io.read_cb_enable(True)
-
-    def close_done(self, io):
-        self.log_for(io, "closed gensio: %s", io)
-        setattr(self, self.name_for(io), None)
-        if self.io is None and self.io2 is None:
-            self.accev.io_closed(self)
-
-            # Break reference loops
-            self.accev = None
-
-
-class AccEvent:
-    def __init__(self, endpoint, require_creds):
-        self.ios = []
-        self.waiter = gensio.waiter(o)
+        if self.io2 is not None and io.same_as(self.io2):
+            self.io2_open = True
+            self.link_rtt = time.monotonic() - self.link_started
+
+    def notify_closed(self):
+        if self.link_peer and self.proxy.profiles is not None:
+            observe_session(
+                self.proxy.profiles, self, self.link_peer, "io2", rtt=self.link_rtt
+            )
+        super().notify_closed()
+
+
+class ProxyListener(ListenerEvent):
+    """
+    Accept telnet connections and proxy each one to an AX.25 link.
+
+    The gateway callsign isn't known until the credentials are in, so an
+    `admission` (admission.Admission) applies only its listener-wide limits.
+    """
+
+    def __init__(
+        self,
+        endpoint,
+        require_creds=1,
+        links=None,
+        pipe_kwargs=None,
+        profiles=None,
+        admission=None,
+    ):
+        super().__init__()
         self.endpoint = endpoint
         self.require_creds = require_creds
-        self.in_shutdown = False
-
-    def log(self, acc, level, logval):
-        logger.error("gensio acc %s err: %s", level, logval)
+        self.links = links  # optional LinkCache
+        self.pipe_kwargs = pipe_kwargs or {}
+        # optional profiles.ProfileStore, tunes each link's ax25 options
+        self.profiles = profiles
+        self.admission = admission
 
     def new_connection(self, acc, io):
         if self.in_shutdown:
             # it will free automatically
-            return
-        ioev = IOEvent(self, require_creds=self.require_creds)
-        logger.info("accepted new connection: %r", io)
+            return None
+        self.logger.info("accepted new connection: %r", io)
+        return self.admit(io, lambda: self.start_session(io))
+
+    def start_session(self, io):
+        ioev = ProxyPipeEvent(self, require_creds=self.require_creds, **self.pipe_kwargs)
         ioev.io = io
-        self.ios.append(ioev)
+        self.track(ioev)
+        if not self.require_creds:
+            ioev.spawn_io2()
         # enable callbacks explicitly, since io is already open so
-        # IOEvent.open_done will not be called
+        # open_done will not be called
         io.write_cb_enable(True)
         io.read_cb_enable(True)
+        return ioev
 
-    def check_finish(self):
-        if len(self.ios) == 0 and self.acc is None:
-            self.waiter.wake()
-
-    def io_closed(self, ioev):
-        i = self.ios.index(ioev)
-        del self.ios[i]
-        logger.info("connection closed: %r", ioev)
-        self.check_finish()
+    def shutdown(self):
+        if self.links is not None:
+            self.links.shutdown()
+        super().shutdown()
 
-    def shutdown_done(self, acc):
-        self.acc = None
-        self.check_finish()
 
-    def shutdown(self, ioev):
-        if self.in_shutdown:
-            return
-        self.in_shutdown = True
-        self.acc.shutdown(self)
-        for i in self.ios:
-            if i != ioev:
-                # The caller will close itself, let it finish its write
-                i.close(io)
-
-    def wait(self):
-        self.waiter.wait(1)
+def main():
+    import argparse
 
+    # only the tools need these, not importers of this module
+    from gensio_modems.capture import add_capture_arguments, start_capture
+    from gensio_modems.metrics import add_metrics_arguments, start_metrics, watch_listener
 
-def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--mycall", help="my callsign")
     parser.add_argument(
@@ -277,21 +379,103 @@ def main():
         default="tcp,localhost,8001",
         help="gensio kiss connection string",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Accept connections in this many worker processes",
+    )
+    # a listening socket inherited from the --workers supervisor
+    parser.add_argument("--listen-fd", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--link-idle",
+        type=float,
+        default=0,
+        help="Keep the AX.25 link open this many seconds after a telnet session "
+        "ends and reuse it for the next session to the same gateway (0 disables)",
+    )
+    parser.add_argument(
+        "--high-water",
+        type=int,
+        default=DEFAULT_HIGH_WATER,
+        help="Pause reads from a side once this many bytes are waiting to be sent",
+    )
+    parser.add_argument(
+        "--low-water",
+        type=int,
+        default=DEFAULT_LOW_WATER,
+        help="Resume paused reads once the backlog drains to this many bytes",
+    )
+    parser.add_argument(
+        "--paclen",
+        type=int,
+        default=None,
+        help="AX.25 I-frame size (ax25 max_write_size); coalesce telnet input "
+        "into frames of this size",
+    )
+    parser.add_argument(
+        "--coalesce-delay",
+        type=float,
+        default=DEFAULT_COALESCE_DELAY,
+        help="With --paclen, send a partial frame after waiting this many seconds",
+    )
+    add_logging_arguments(parser)
+    add_metrics_arguments(parser)
+    add_capture_arguments(parser)
+    add_profile_arguments(parser)
+    add_admission_arguments(parser)
     args = parser.parse_args()
+    setup_logging(args)
+
+    if args.workers > 1:
+        from gensio_modems.workers import run_proxy_workers
+
+        try:
+            run_proxy_workers(args.listen, sys.argv[1:], args.workers)
+        except ValueError as exc:
+            parser.error(str(exc))
+        return
 
     endpoint_conf = args.ax25_conf
-    if not re.search(r"\bladder=", endpoint_conf):
+    if not re.search(r"\bladdr=", endpoint_conf):
         endpoint_conf = f"laddr={args.mycall}," + endpoint_conf
-    if not re.search(r"\badder=", endpoint_conf):
+    if not re.search(r"\baddr=", endpoint_conf):
         endpoint_conf = f'addr="0,{args.gateway},{args.mycall}",' + endpoint_conf
+    if args.paclen and not re.search(r"\bmax_write_size=", endpoint_conf):
+        endpoint_conf += f",max_write_size={args.paclen}"
 
-    accev = AccEvent(
+    start_metrics(args)
+    start_capture(args)
+    listener = ProxyListener(
         endpoint=f"ax25({endpoint_conf}),kiss,{args.kiss}",
         require_creds=int(args.require_creds),
+        links=LinkCache(args.link_idle) if args.link_idle > 0 else None,
+        pipe_kwargs=dict(
+            high_water=args.high_water,
+            low_water=args.low_water,
+            paclen2=args.paclen,
+            coalesce_delay=args.coalesce_delay,
+        ),
+        profiles=start_profiles(args),
+        admission=start_admission(args),
     )
-    accev.acc = gensio.gensio_accepter(o, args.listen, accev)
-    accev.acc.startup()
-    accev.wait()
+    if args.listen_fd is not None:
+        import socket
+
+        from gensio_modems.sockio import SocketAccepter, SocketSelector
+
+        sockets = SocketSelector()
+        listener.acc = SocketAccepter(
+            sockets, socket.socket(fileno=args.listen_fd), listener
+        )
+        listener.acc.startup()
+        watch_listener(listener)
+        sockets.serve(listener)
+        return
+    listener.acc = gensio.gensio_accepter(osfuncs(), args.listen, listener)
+    listener.acc.startup()
+    watch_listener(listener)
+    listener.wait()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+"""Bookkeeping for accepted connections."""
+
+import itertools
+
+
+class ConnectionRegistry:
+    """
+    Track open connections by a stable per-connection id.
+
+    Adding and removing are O(1); connections may optionally be indexed by
+    remote callsign as well.
+    """
+
+    def __init__(self):
+        self._conns = {}  # conn_id -> conn
+        self._callsigns = {}  # conn_id -> callsign
+        self._by_callsign = {}  # callsign -> {conn_id: conn}
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self._conns)
+
+    def __contains__(self, conn_id):
+        return conn_id in self._conns
+
+    def __iter__(self):
+        return iter(list(self._conns.items()))
+
+    def add(self, conn, callsign=None):
+        conn_id = next(self._ids)
+        self._conns[conn_id] = conn
+        if callsign is not None:
+            callsign = callsign.upper()
+            self._callsigns[conn_id] = callsign
+            self._by_callsign.setdefault(callsign, {})[conn_id] = conn
+        return conn_id
+
+    def get(self, conn_id):
+        return self._conns.get(conn_id)
+
+    def remove(self, conn_id):
+        """Stop tracking `conn_id`; returns the connection or None if unknown."""
+        conn = self._conns.pop(conn_id, None)
+        callsign = self._callsigns.pop(conn_id, None)
+        if callsign is not None:
+            same_call = self._by_callsign[callsign]
+            del same_call[conn_id]
+            if not same_call:
+                del self._by_callsign[callsign]
+        return conn
+
+    def callsign_of(self, conn_id):
+        return self._callsigns.get(conn_id)
+
+    def by_callsign(self, callsign):
+        """Return the connections from `callsign` as a list."""
+        return list(self._by_callsign.get(callsign.upper(), {}).values())
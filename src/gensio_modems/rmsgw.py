@@ -4,36 +4,104 @@ Mixin for handling Winlink RMS Gateway login.
 For use with AX.25 or VARA winlink gateways.
 """
 
+from .expect import Expect, Step, login_stats
+from .gutils import TIMERS
+
+
+# seconds to wait for each CMS prompt before giving up on the gateway
+LOGIN_STEP_TIMEOUT = 60
+
+# the prompt's line ending is swallowed along with it
+CALLSIGN_PROMPT = Step(rb"callsign\s*:[ \t]*\r?\n?", name="callsign")
+PASSWORD_PROMPT = Step(rb"password\s*:[ \t]*\r?\n?", name="password")
+
 
 class RMSGatewayLogin:
-    """For best results, mix with gutils.PipeEvent."""
-
-    def _handle_login(self, io, err, data):
-        if (
-            getattr(self, "_cms_logged_in", False)
-            or not data
-            or err
-            or not io.same_as(self.rms_io)
-        ):
-            return
-
-        ldata = data.strip().lower()
-        send_line = None
-        if ldata.startswith(b"callsign"):
-            send_line = b"%s\r\n" % self.callsign
-        elif ldata.startswith(b"password"):
-            send_line = b"%s\r\n" % self.password
-            self._cms_logged_in = True
-        if send_line is not None:
-            self.logger.info("_handle_login: data={}".format(ldata))
-            self.get_write_buffer(io).extend(send_line)
+    """
+    For best results, mix with gutils.PipeEvent.
+
+    Output from the gateway is run through an Expect matcher until the
+    password has been sent; prompts are answered and swallowed, anything
+    else is passed on to the user. After that `read_callback` is replaced
+    by the plain pipe's for the rest of the session.
+    """
+
+    _login = None
+    _login_timer = None
+
+    def start_login(self):
+        if self._login is not None or "read_callback" in self.__dict__:
+            return  # in progress or already done
+        self._login = Expect([CALLSIGN_PROMPT, PASSWORD_PROMPT])
+        self._arm_login_timer()
+
+    def reset_login(self):
+        if self._login_timer is not None:
+            self._login_timer.cancel()
+            self._login_timer = None
+        self._login = None
+        # drop the fast path, the next gateway connection logs in again
+        self.__dict__.pop("read_callback", None)
+
+    def _arm_login_timer(self):
+        if self._login_timer is not None:
+            self._login_timer.cancel()
+        self._login_timer = TIMERS.call_later(LOGIN_STEP_TIMEOUT, self._login_expired)
+
+    def _login_expired(self):
+        self._login_timer = None
+        login_stats("rms").timeouts += 1
+        self.logger.error(
+            "RMS login: no %s prompt after %ss",
+            self._login.current.name,
+            LOGIN_STEP_TIMEOUT,
+        )
+        if self.rms_io is not None:
+            self.close(self.rms_io)
+
+    def _handle_login(self, io, data):
+        """Answer prompts in `data`; returns the bytes to pass on to the user."""
+        login = self._login
+        passthrough = []
+        hits = login.feed(data)
+        for hit in hits:
+            passthrough.append(hit.before)
+            if hit.step is CALLSIGN_PROMPT:
+                reply = self.callsign
+            else:
+                reply = self.password
+            self.log_for(io, "RMS login: answering %s prompt", hit.step.name)
+            self.get_write_buffer(io).extend(b"%s\r\n" % reply)
             io.write_cb_enable(True)
-            return True
+        passthrough.append(login.drain())
+        if login.done:
+            self._login_finished(io)
+        elif hits:
+            self._arm_login_timer()  # the deadline is per prompt
+        return b"".join(passthrough)
+
+    def _login_finished(self, io):
+        self._login_timer.cancel()
+        self._login_timer = None
+        login_stats("rms").add(self._login)
+        self.log_for(io, "RMS login took %.3fs", self._login.elapsed)
+        self._login = None
+        # fast path: gateway reads go straight to the pipe from now on
+        self.read_callback = super().read_callback
 
     def read_callback(self, io, err, data, auxdata):
-        if self._handle_login(io, err, data):
-            return len(data)
-        return super().read_callback(io, err, data, auxdata)
+        if err or not data or not io.same_as(self.rms_io):
+            return super().read_callback(io, err, data, auxdata)
+        self.start_login()
+        passthrough = self._handle_login(io, data)
+        if passthrough:
+            super().read_callback(io, err, passthrough, auxdata)
+        return len(data)
+
+    def open_done(self, io, err):
+        super().open_done(io, err)
+        if not err and self.rms_io is not None and io.same_as(self.rms_io):
+            self.start_login()
 
     @property
     def callsign(self):
@@ -49,4 +117,5 @@ class RMSGatewayLogin:
 
     def close(self, io=None):
         if io and io.same_as(self.rms_io):
-            self._cms_logged_in = False
+            self.reset_login()
+        super().close(io)
@@ -0,0 +1,716 @@
+"""
+Offline stand-ins for the radio side: a KISS-over-TCP TNC and a VARA modem.
+
+Both put their traffic on a simulated `Channel` with a bitrate, latency,
+frame loss and, for half duplex channels, a turnaround time each time a
+transmitter keys up, so gateway performance can be measured without
+Direwolf, a VARA install or a radio.
+
+    # two ax25 gensios on kiss,tcp,localhost,8001 can connect to each other
+    python -m gensio_modems.sim kiss --listen tcp,localhost,8001 --bitrate 1200
+
+    # VARA control/data ports 8300/8301; connecting to 8302 looks like a
+    # station calling over the air
+    python -m gensio_modems.sim vara --port 8300 --bitrate 2400 --latency 0.5
+"""
+
+import random
+import time
+from typing import NamedTuple
+
+import gensio
+
+from .gutils import IOEvent, ListenerEvent, TIMERS, osfuncs
+from .logs import add_logging_arguments, category_logger, setup_logging
+from .varaproto import LineFramer
+
+logger = category_logger("control", "sim")
+
+FEND = b"\xc0"
+# bytes on air around a KISS frame's contents (HDLC flags and FCS)
+AX25_FRAMING = 4
+# bytes on air around a VARA data frame's payload
+VARA_FRAMING = 20
+# size of a VARA acknowledgement / connect request on air
+ACK_SIZE = 12
+# VARA payload bytes per data frame
+VARA_FRAME_SIZE = 256
+# a VARA frame lost this many times in a row takes the link down
+MAX_RETRIES = 10
+# VaraSim disconnect delay: one request / acknowledgement over the channel
+EXCHANGE = object()
+
+
+class Airtime(NamedTuple):
+    start: float  # time.monotonic
+    end: float
+    lost: bool
+
+
+class Channel:
+    """
+    A simulated RF channel.
+
+    `bitrate` is in bits/s (None: no transmit time), every frame arrives
+    `latency` seconds after its transmission ends, or not at all with
+    probability `loss`. On a `half_duplex` channel one frame is on air at a
+    time and every key-up (after the channel was idle, or by a different
+    station) waits `turnaround` seconds first; otherwise each sender has a
+    channel of its own.
+    """
+
+    def __init__(
+        self,
+        bitrate=None,
+        latency=0.0,
+        loss=0.0,
+        turnaround=0.0,
+        half_duplex=True,
+        seed=None,
+    ):
+        self.bitrate = bitrate
+        self.latency = latency
+        self.loss = loss
+        self.turnaround = turnaround
+        self.half_duplex = half_duplex
+        self.random = random.Random(seed)
+        self.busy_until = {}  # sender (None for the shared channel) -> time
+        self.last_sender = None
+        # statistics
+        self.frames = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.airtime = 0.0
+
+    def transmit(self, sender, size, deliver, *args, lossy=True):
+        """
+        Put `size` bytes from `sender` on the channel; `deliver(*args)` is
+        called when they arrive, unless the frame is lost.
+        """
+        now = time.monotonic()
+        key = None if self.half_duplex else sender
+        busy = self.busy_until.get(key, 0.0)
+        start = max(now, busy)
+        if self.turnaround and (
+            start > busy or (self.half_duplex and sender is not self.last_sender)
+        ):
+            start += self.turnaround
+        end = start + (size * 8 / self.bitrate if self.bitrate else 0.0)
+        self.busy_until[key] = end
+        self.last_sender = sender
+        self.frames += 1
+        self.bytes += size
+        self.airtime += end - start
+        lost = lossy and self.loss > 0 and self.random.random() < self.loss
+        if lost:
+            self.dropped += 1
+        else:
+            delay = end + self.latency - now
+            if delay > 0:
+                TIMERS.call_later(delay, deliver, *args)
+            else:
+                deliver(*args)
+        return Airtime(start, end, lost)
+
+
+def listen(listener, gensio_str):
+    listener.acc = gensio.gensio_accepter(osfuncs(), gensio_str, listener)
+    listener.acc.startup()
+    return listener
+
+
+# KISS
+
+
+class KissPort(IOEvent):
+    """One KISS client of a KissTNC, i.e. one station on the channel."""
+
+    def __init__(self, tnc):
+        super().__init__()
+        self.tnc = tnc
+        self.partial = bytearray()
+
+    def read_callback(self, io, err, data, auxdata):
+        if err:
+            return super().read_callback(io, err, data, auxdata)
+        self.partial += data
+        *frames, rest = bytes(self.partial).split(FEND)
+        self.partial = bytearray(rest)
+        for frame in frames:
+            # the low nibble of the command byte is 0 for data, the rest
+            # (TXDELAY, persistence, ...) configure the TNC
+            if frame and frame[0] & 0x0F == 0:
+                self.tnc.transmit(self, frame)
+        return len(data)
+
+    def deliver(self, frame):
+        if self.io is None:
+            return
+        self.bufB.extend(FEND + frame + FEND)
+        self.io.write_cb_enable(True)
+
+
+class KissTNC(ListenerEvent):
+    """
+    KISS-over-TCP "TNC": every client is a station on one shared channel
+    and receives the frames of all the others.
+
+    tnc = listen(KissTNC(Channel(bitrate=1200, latency=0.05)), "tcp,localhost,8001")
+    """
+
+    def __init__(self, channel=None):
+        super().__init__()
+        self.channel = channel or Channel()
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        port = KissPort(self)
+        port.io = io
+        self.track(port)
+        io.read_cb_enable(True)
+        return io
+
+    def transmit(self, sender, frame):
+        # less the KISS command byte
+        size = len(frame) - 1 + AX25_FRAMING
+        self.channel.transmit(sender, size, self.deliver, sender, frame)
+
+    def deliver(self, sender, frame):
+        for conn_id, port in self.connections:
+            if port is not sender:
+                port.deliver(frame)
+
+
+# VARA
+
+
+class ArqEnd:
+    """
+    One end of a simulated ARQ link: queued bytes go out a frame at a time,
+    each acknowledged by the `peer` end before the next is sent; lost frames
+    are sent again. `on_data(data)` gets the bytes received, `on_buffer(n)`
+    the bytes still waiting to be acknowledged, `on_ptt(on)` the keying of
+    this end's transmitter and `on_failed()` is called when a frame could
+    not be delivered in MAX_RETRIES tries.
+    """
+
+    def __init__(
+        self, channel, on_data, on_buffer=None, on_ptt=None, on_failed=None
+    ):
+        self.channel = channel
+        self.on_data = on_data
+        self.on_buffer = on_buffer
+        self.on_ptt = on_ptt
+        self.on_failed = on_failed
+        self.peer = None
+        self.tx = bytearray()
+        self.in_flight = 0
+        self.ptt = False
+        self.ptt_until = 0.0
+
+    def connect(self, peer):
+        """Link with the ArqEnd `peer` and start sending what is queued."""
+        self.peer = peer
+        peer.peer = self
+        for end in (self, peer):
+            if not end.in_flight:
+                end._next_frame()
+
+    def send(self, data):
+        self.tx += data
+        self._report_buffer()
+        if not self.in_flight:
+            self._next_frame()
+
+    def clear(self):
+        """Drop unsent bytes (CLEANTXBUFFER)."""
+        del self.tx[self.in_flight :]
+        self._report_buffer()
+
+    def reset(self):
+        self.peer = None
+        self.tx.clear()
+        self.in_flight = 0
+        self._report_buffer()
+
+    def transmit(self, size, deliver, *args, lossy=True):
+        airtime = self.channel.transmit(self, size, deliver, *args, lossy=lossy)
+        if self.on_ptt is not None:
+            now = time.monotonic()
+            self.ptt_until = max(self.ptt_until, airtime.end)
+            TIMERS.call_later(max(airtime.start - now, 0), self._key, True)
+            TIMERS.call_later(max(airtime.end - now, 0), self._unkey)
+        return airtime
+
+    def _key(self, on):
+        if on != self.ptt:
+            self.ptt = on
+            self.on_ptt(on)
+
+    def _unkey(self):
+        if time.monotonic() >= self.ptt_until - 1e-6:
+            self._key(False)
+
+    def _report_buffer(self):
+        if self.on_buffer is not None:
+            self.on_buffer(len(self.tx))
+
+    def _next_frame(self):
+        peer = self.peer
+        if not self.tx or peer is None:
+            return
+        frame = bytes(self.tx[:VARA_FRAME_SIZE])
+        self.in_flight = len(frame)
+        for _ in range(MAX_RETRIES):
+            airtime = self.transmit(
+                len(frame) + VARA_FRAMING, peer._frame_arrived, self, frame
+            )
+            if not airtime.lost:
+                return
+        self.in_flight = 0
+        if self.on_failed is not None:
+            self.on_failed()
+
+    def _frame_arrived(self, sender, frame):
+        if sender is not self.peer:
+            return  # the link went down meanwhile
+        self.on_data(frame)
+        self.transmit(ACK_SIZE, sender._acked, self, lossy=False)
+
+    def _acked(self, sender):
+        if sender is not self.peer or not self.in_flight:
+            return
+        del self.tx[: self.in_flight]
+        self.in_flight = 0
+        self._report_buffer()
+        self._next_frame()
+
+
+class VaraEther:
+    """The modems (and their channel) that can reach each other."""
+
+    def __init__(self, channel=None):
+        self.channel = channel or Channel()
+        self.modems = []
+
+    def find(self, callsign):
+        for modem in self.modems:
+            if modem.listening and modem.answers(callsign):
+                return modem
+        return None
+
+
+class VaraControlPort(IOEvent):
+    def __init__(self, modem):
+        super().__init__()
+        self.modem = modem
+        self.framer = LineFramer()
+
+    def get_read_buffer(self, io):
+        return self.framer
+
+    def read_callback(self, io, err, data, auxdata):
+        count = super().read_callback(io, err, data, auxdata)
+        for line in self.framer.lines():
+            self.modem.command(line)
+        return count
+
+    def send(self, line):
+        if self.io is not None:
+            self.bufB.extend(line.encode("utf-8") + b"\r")
+            self.io.write_cb_enable(True)
+
+
+class VaraDataPort(IOEvent):
+    """The modem's data port: bytes to send over the link, bytes received."""
+
+    def __init__(self, modem):
+        super().__init__()
+        self.modem = modem
+
+    def read_callback(self, io, err, data, auxdata):
+        if err or not data:
+            return super().read_callback(io, err, data, auxdata)
+        if self.modem.link_up:
+            self.modem.arq.send(data)
+        return len(data)
+
+    def deliver(self, data):
+        if self.io is not None:
+            self.bufB.extend(data)
+            self.io.write_cb_enable(True)
+
+
+class RemoteStation(IOEvent):
+    """
+    A TCP client of the modem's station port, standing in for a station
+    that connected over the air: its bytes cross the channel to the modem.
+    """
+
+    def __init__(self, modem):
+        super().__init__()
+        self.modem = modem
+        self.callsign = modem.remote
+        self.arq = ArqEnd(modem.ether.channel, self.deliver, on_failed=self.link_failed)
+
+    def read_callback(self, io, err, data, auxdata):
+        if err or not data:
+            return super().read_callback(io, err, data, auxdata)
+        self.arq.send(data)
+        return len(data)
+
+    def deliver(self, data):
+        if self.io is not None:
+            self.bufB.extend(data)
+            self.io.write_cb_enable(True)
+
+    def link_failed(self):
+        if self.io is not None:
+            self.close(self.io)
+
+    def link_down(self):
+        """The modem ended the link."""
+        self.arq.reset()
+        if self.io is not None:
+            self.close()
+
+    def notify_closed(self):
+        super().notify_closed()
+        self.modem.peer_gone(self)
+
+
+class _PortListener(ListenerEvent):
+    def __init__(self, modem, handler):
+        super().__init__()
+        self.modem = modem
+        self.handler = handler
+
+    def new_connection(self, acc, io):
+        if self.in_shutdown:
+            return None
+        ioev = self.handler(io)
+        if ioev is None:
+            return None
+        ioev.io = io
+        self.track(ioev)
+        io.read_cb_enable(True)
+        return io
+
+
+class VaraSim:
+    """
+    VARA modem emulator speaking the `vara_to_application` protocol on a
+    control port and a data port, linked over `ether` to other emulated
+    modems (CONNECT / LISTEN by callsign) and, optionally, to TCP clients
+    of a `station` port, each seen as station `remote` calling us.
+
+    Reports CONNECTED, DISCONNECTED, BUFFER and PTT; other commands are
+    answered with OK (or WRONG). `disconnect_delay` / `abort_delay` are how
+    long DISCONNECT / ABORT take to bring the link down (default: one
+    request / acknowledgement over the channel; None: never, like a wedged
+    modem).
+
+    modem = VaraSim(
+        "tcp,localhost,8300", "tcp,localhost,8301", station="tcp,localhost,8302"
+    )
+    """
+
+    BANDWIDTH = 2300
+
+    def __init__(
+        self,
+        control,
+        data,
+        station=None,
+        ether=None,
+        remote="N0CALL",
+        disconnect_delay=EXCHANGE,
+        abort_delay=0,
+    ):
+        self.ether = ether or VaraEther()
+        self.ether.modems.append(self)
+        self.remote = remote
+        self.disconnect_delay = disconnect_delay
+        self.abort_delay = abort_delay
+        self.mycalls = []
+        self.listening = False
+        self.control = None  # VaraControlPort
+        self.data = None  # VaraDataPort
+        self.commands = []
+        self.arq = ArqEnd(
+            self.ether.channel,
+            self._deliver,
+            on_buffer=self._report_buffer,
+            on_ptt=lambda on: self.send("PTT ON" if on else "PTT OFF"),
+            on_failed=self.link_failed,
+        )
+        self.peer = None  # the VaraSim or RemoteStation at the other end
+        self.station = None
+        self.pending = None  # timer for CONNECT / DISCONNECT in progress
+        self.buffer = 0
+        self.listeners = [
+            listen(_PortListener(self, self._new_control), control),
+            listen(_PortListener(self, self._new_data), data),
+        ]
+        if station is not None:
+            self.listeners.append(
+                listen(_PortListener(self, self._new_station), station)
+            )
+
+    @property
+    def mycall(self):
+        return self.mycalls[0] if self.mycalls else None
+
+    @property
+    def link_up(self):
+        return self.peer is not None
+
+    def answers(self, callsign):
+        return callsign.upper() in self.mycalls
+
+    def send(self, line):
+        if self.control is not None:
+            self.control.send(line)
+
+    def _new_control(self, io):
+        self.control = VaraControlPort(self)
+        return self.control
+
+    def _new_data(self, io):
+        self.data = VaraDataPort(self)
+        return self.data
+
+    def _new_station(self, io):
+        if self.station is not None or self.link_up:
+            return None  # VARA carries one session at a time
+        station = self.station = RemoteStation(self)
+        channel = self.ether.channel
+        # connect request and its answer
+        delay = 2 * (channel.latency + channel.turnaround)
+        if delay:
+            TIMERS.call_later(delay, self._station_connected, station)
+        else:
+            self._station_connected(station)
+        return station
+
+    def _station_connected(self, station):
+        if self.station is station and station.io is not None:
+            self._link(station, station.arq, self.remote, self.mycall)
+
+    def _deliver(self, data):
+        if self.data is not None:
+            self.data.deliver(data)
+
+    def _report_buffer(self, size):
+        if size != self.buffer:
+            self.buffer = size
+            self.send("BUFFER {}".format(size))
+
+    def _link(self, peer, peer_arq, source, destination):
+        self.peer = peer
+        self.arq.connect(peer_arq)
+        self.send("CONNECTED {} {} {}".format(source, destination, self.BANDWIDTH))
+
+    def command(self, line):
+        self.commands.append(line)
+        words = line.split()
+        if not words:
+            return
+        handler = getattr(self, "cmd_" + words[0].lower(), None)
+        if handler is None:
+            if words[0].upper().startswith("BW"):
+                self.send("OK")
+                return
+            self.send("WRONG")
+            return
+        handler(words[1:])
+
+    def cmd_mycall(self, args):
+        self.mycalls = [call.upper() for call in args]
+        self.send("OK")
+
+    def cmd_listen(self, args):
+        self.listening = bool(args) and args[0].upper() == "ON"
+        self.send("OK")
+
+    def cmd_connect(self, args):
+        self.send("OK")
+        if self.link_up or len(args) < 2:
+            return
+        source, destination = args[0], args[1]
+        target = self.ether.find(destination)
+        if target is None or target.link_up or target is self:
+            # nobody answers: VARA gives up after its retries
+            self.pending = TIMERS.call_later(
+                max(self.ether.channel.latency, 0.1) * MAX_RETRIES, self.connect_failed
+            )
+            return
+        # connect request, then the answer
+        self.arq.transmit(
+            ACK_SIZE, self._connect_request, target, source, destination, lossy=False
+        )
+
+    def _connect_request(self, target, source, destination):
+        if target.link_up:
+            self.connect_failed()
+            return
+        target.arq.transmit(
+            ACK_SIZE, self._connect_answer, target, source, destination, lossy=False
+        )
+
+    def _connect_answer(self, target, source, destination):
+        target._link(self, self.arq, source, destination)
+        self._link(target, target.arq, source, destination)
+
+    def connect_failed(self):
+        self.pending = None
+        self.send("DISCONNECTED")
+
+    def cmd_disconnect(self, args):
+        self.send("OK")
+        self._end_link(self.disconnect_delay)
+
+    def cmd_abort(self, args):
+        self.send("OK")
+        if self.pending is not None:
+            self.pending.cancel()
+            self.connect_failed()
+            return
+        self._end_link(self.abort_delay)
+
+    def cmd_cleantxbuffer(self, args):
+        self.arq.clear()
+        self.send("OK")
+
+    def cmd_version(self, args):
+        self.send("VERSION VARA sim")
+
+    def _end_link(self, delay):
+        if not self.link_up or delay is None:
+            return
+        if delay is EXCHANGE:
+            # disconnect request and its acknowledgement
+            channel = self.ether.channel
+            delay = 2 * (channel.latency + channel.turnaround)
+        if delay:
+            TIMERS.call_later(delay, self.disconnect)
+        else:
+            self.disconnect()
+
+    def disconnect(self):
+        """Take the link down at both ends."""
+        peer = self.peer
+        if peer is None:
+            return
+        self.link_down()
+        peer.link_down()
+
+    def link_down(self):
+        if self.peer is None:
+            return
+        self.peer = None
+        self.station = None
+        self.arq.reset()
+        self.send("DISCONNECTED")
+
+    def link_failed(self):
+        logger.info("%s: link failed after %s retries", self.mycall, MAX_RETRIES)
+        self.disconnect()
+
+    def peer_gone(self, peer):
+        """A RemoteStation hung up."""
+        if self.peer is peer:
+            self.link_down()
+        elif self.station is peer:
+            self.station = None  # before the link was up
+
+    def shutdown(self):
+        if self in self.ether.modems:
+            self.ether.modems.remove(self)
+        for listener in self.listeners:
+            listener.shutdown()
+
+
+def add_channel_arguments(parser):
+    parser.add_argument("--bitrate", type=float, default=None, help="bits/s")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="frame loss probability")
+    parser.add_argument(
+        "--turnaround", type=float, default=0.0, help="seconds to key up (half duplex)"
+    )
+    parser.add_argument("--full-duplex", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def channel_from_args(args):
+    return Channel(
+        bitrate=args.bitrate,
+        latency=args.latency,
+        loss=args.loss,
+        turnaround=args.turnaround,
+        half_duplex=not args.full_duplex,
+        seed=args.seed,
+    )
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline KISS TNC / VARA modem simulators")
+    sub = parser.add_subparsers(dest="kind", required=True)
+    kiss = sub.add_parser("kiss", help="KISS-over-TCP TNC shared by all its clients")
+    kiss.add_argument("--listen", default="tcp,localhost,8001")
+    vara = sub.add_parser("vara", help="VARA modems on one channel")
+    vara.add_argument("--port", type=int, default=8300, help="control port of the first modem")
+    vara.add_argument(
+        "--count", type=int, default=1, help="modems, on ports --port, --port + 10, ..."
+    )
+    vara.add_argument("--remote", default="N0CALL", help="callsign of station port clients")
+    for sub_parser in (kiss, vara):
+        add_channel_arguments(sub_parser)
+        add_logging_arguments(sub_parser)
+    args = parser.parse_args()
+    setup_logging(args)
+
+    channel = channel_from_args(args)
+    if args.kind == "kiss":
+        listeners = [listen(KissTNC(channel), args.listen)]
+    else:
+        ether = VaraEther(channel)
+        for n in range(args.count):
+            port = args.port + 10 * n
+            VaraSim(
+                "tcp,localhost,{}".format(port),
+                "tcp,localhost,{}".format(port + 1),
+                station="tcp,localhost,{}".format(port + 2),
+                ether=ether,
+                remote=args.remote,
+            )
+            logger.info(
+                "VARA modem %s: control %s, data %s, station %s",
+                n,
+                port,
+                port + 1,
+                port + 2,
+            )
+        listeners = [listener for modem in ether.modems for listener in modem.listeners]
+    try:
+        for listener in listeners:
+            listener.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info(
+            "channel: %s frames, %s bytes, %s dropped, %.1fs on air",
+            channel.frames,
+            channel.bytes,
+            channel.dropped,
+            channel.airtime,
+        )
+        for listener in listeners:
+            listener.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+gensio style callbacks for plain python sockets.
+
+gensio can't adopt a socket it didn't open, nor share a listening socket
+between processes. The proxy workers (see workers.py) inherit one listening
+socket from the supervisor and accept on it themselves; a SocketAccepter and
+the SocketIOs it accepts give those sockets the accepter / gensio interface
+ListenerEvent and IOEvent use, so their sessions run like any other.
+
+A SocketSelector thread waits for the sockets to be ready and wakes the
+gensio waiter the main thread sleeps in; every callback runs on the main
+thread, between gensio's own.
+
+sockets = SocketSelector()
+listener.acc = SocketAccepter(sockets, socket.socket(fileno=fd), listener)
+listener.acc.startup()
+sockets.serve(listener)  # instead of listener.wait()
+"""
+
+import os
+import selectors
+import threading
+
+import gensio
+
+from .gutils import TIMERS, osfuncs
+from .logs import category_logger
+
+
+logger = category_logger("control", "sockio")
+
+READ_SIZE = 64 * 1024
+# the error gensio reports for a clean close by the peer, see IOEvent
+REMOTE_CLOSED = "Remote end closed connection"
+
+
+class SocketSelector:
+    """
+    Wait for python sockets from a helper thread, dispatch on the main one.
+
+    Only the helper thread touches the selector: the main thread records
+    what each socket should be watched for (`watch`) or that it is done with
+    it (`close`), and pokes the helper, which applies that before its next
+    select. A socket is closed only after it is unregistered, so its fd
+    number can't be reused by a new socket while still registered.
+    """
+
+    def __init__(self):
+        self.waiter = gensio.waiter(osfuncs())
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.wanted = {}  # owner (SocketIO / SocketAccepter) -> event mask
+        self.closing = []  # owners whose socket is to be closed
+        self.ready = []  # (owner, event mask) for the main thread
+        self.consumed = threading.Event()
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._select_loop, name="sockio", daemon=True
+            )
+            self.thread.start()
+
+    def watch(self, owner, events):
+        """Watch `owner.sock` for `events` (selectors.EVENT_*; 0: neither)."""
+        with self.lock:
+            self.wanted[owner] = events
+        self._poke()
+
+    def close(self, owner):
+        """Stop watching `owner.sock` and close it."""
+        with self.lock:
+            self.wanted.pop(owner, None)
+            self.closing.append(owner)
+        self._poke()
+
+    def _poke(self):
+        try:
+            os.write(self.wake_w, b"\0")
+        except BlockingIOError:
+            pass  # already poked
+
+    def _apply(self):
+        for owner in self.closing:
+            try:
+                self.selector.unregister(owner.sock)
+            except (KeyError, ValueError):
+                pass
+            owner.sock.close()
+        self.closing = []
+        for owner, events in self.wanted.items():
+            try:
+                key = self.selector.get_key(owner.sock)
+            except KeyError:
+                key = None
+            if not events:
+                if key is not None:
+                    self.selector.unregister(owner.sock)
+            elif key is None:
+                self.selector.register(owner.sock, events, owner)
+            elif key.events != events:
+                self.selector.modify(owner.sock, events, owner)
+
+    def _select_loop(self):
+        while True:
+            with self.lock:
+                self._apply()
+            ready = []
+            for key, events in self.selector.select():
+                if key.fileobj == self.wake_r:
+                    while True:
+                        try:
+                            if not os.read(self.wake_r, 4096):
+                                break
+                        except BlockingIOError:
+                            break
+                else:
+                    ready.append((key.data, events))
+            if ready:
+                with self.lock:
+                    self.consumed.clear()
+                    self.ready.extend(ready)
+                self.waiter.wake()
+                # sockets stay ready until the main thread has read them
+                self.consumed.wait()
+
+    def dispatch(self):
+        """Run the callbacks for the sockets found ready; main thread only."""
+        with self.lock:
+            ready, self.ready = self.ready, []
+        if not ready:
+            # woken by a timer or gensio: the helper may be about to hand
+            # over sockets, and must not go back to select before they are
+            # read, or it finds them ready again
+            return
+        try:
+            for owner, events in ready:
+                try:
+                    owner.ready(events)
+                except Exception:
+                    logger.exception("Unhandled Exception in socket callback")
+        finally:
+            self.consumed.set()
+
+    def run(self, done):
+        """Service gensio, timers and the sockets until `done()` is true."""
+        self.start()
+        while not done():
+            # a wake landing on a timeout is lost, so check for events too
+            TIMERS.wait(self.waiter, done=lambda: self.ready or done())
+            self.dispatch()
+
+    def serve(self, listener):
+        """Like `listener.wait()`, for a listener on a SocketAccepter."""
+        self.run(lambda: listener.acc is None and not len(listener.connections))
+
+
+class SocketIO:
+    """One connected socket, with the gensio methods IOEvent calls."""
+
+    def __init__(self, sockets, sock):
+        sock.setblocking(False)
+        self.sockets = sockets
+        self.sock = sock
+        self.handler = None
+        self.read_enabled = False
+        self.write_enabled = False
+        self.pending = b""  # read, but not taken by the handler yet
+        self.pending_timer = None
+        self.closed = False
+
+    def __repr__(self):
+        try:
+            peer = self.sock.getpeername()
+        except OSError:
+            peer = "closed"
+        return "SocketIO({})".format(peer)
+
+    def set_cbs(self, handler):
+        self.handler = handler
+
+    def same_as(self, other):
+        return other is self
+
+    def read_cb_enable(self, enabled):
+        self.read_enabled = enabled
+        self.update()
+        self.redeliver()
+
+    def write_cb_enable(self, enabled):
+        self.write_enabled = enabled
+        self.update()
+
+    def update(self):
+        if self.closed:
+            return
+        events = 0
+        if self.read_enabled and not self.pending:
+            events |= selectors.EVENT_READ
+        if self.write_enabled:
+            events |= selectors.EVENT_WRITE
+        self.sockets.watch(self, events)
+
+    def ready(self, events):
+        if self.closed or self.handler is None:
+            return
+        if events & selectors.EVENT_READ and self.read_enabled and not self.pending:
+            self.read()
+        if events & selectors.EVENT_WRITE and self.write_enabled and not self.closed:
+            self.handler.write_callback(self)
+
+    def read(self):
+        try:
+            data = self.sock.recv(READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as exc:
+            self.read_error(str(exc))
+            return
+        if not data:
+            self.read_error(REMOTE_CLOSED)
+            return
+        self.deliver(data)
+
+    def read_error(self, err):
+        self.read_enabled = False
+        self.update()
+        self.handler.read_callback(self, err, None, None)
+
+    def deliver(self, data):
+        count = self.handler.read_callback(self, None, data, None)
+        if count is not None and count < len(data):
+            # like gensio, the rest is offered again while reads are enabled
+            self.pending = data[count:]
+            self.update()
+            self.redeliver()
+
+    def redeliver(self):
+        if self.read_enabled and self.pending and self.pending_timer is None:
+            self.pending_timer = TIMERS.call_later(0, self.deliver_pending)
+
+    def deliver_pending(self):
+        self.pending_timer = None
+        if self.closed or not self.read_enabled or not self.pending:
+            return
+        data, self.pending = self.pending, b""
+        self.deliver(data)
+        if not self.pending:
+            self.update()
+
+    def write(self, data, auxdata):
+        try:
+            return self.sock.send(data)
+        except (BlockingIOError, InterruptedError):
+            return 0
+
+    def close(self, handler):
+        if self.closed:
+            return
+        self.closed = True
+        self.read_enabled = self.write_enabled = False
+        if self.pending_timer is not None:
+            self.pending_timer.cancel()
+            self.pending_timer = None
+        self.sockets.close(self)
+        TIMERS.call_later(0, handler.close_done, self)
+
+
+class SocketAccepter:
+    """A listening socket, with the accepter methods ListenerEvent calls."""
+
+    def __init__(self, sockets, sock, handler):
+        sock.setblocking(False)
+        self.sockets = sockets
+        self.sock = sock
+        self.handler = handler
+
+    def startup(self):
+        self.sockets.watch(self, selectors.EVENT_READ)
+
+    def ready(self, events):
+        try:
+            conn, _ = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return  # another worker took it
+        except OSError as exc:
+            logger.error("accept: %s", exc)
+            return
+        io = SocketIO(self.sockets, conn)
+        self.handler.new_connection(self, io)
+        if io.handler is None:
+            conn.close()  # not taken, e.g. the listener is shutting down
+
+    def shutdown(self, handler):
+        self.sockets.close(self)
+        TIMERS.call_later(0, handler.shutdown_done, self)
@@ -1,33 +1,80 @@
 """
 VARA Modem Listener.
 """
-import argparse
-import array
+import configparser
 import logging
-import time
 
 import gensio
 
-from .gutils import IOEvent, PipeEvent, OSFUNCS
+from .failover import gateway_set
+from .gutils import (
+    DEFAULT_HIGH_WATER,
+    DEFAULT_LOW_WATER,
+    IOEvent,
+    PipeEvent,
+    TIMERS,
+    osfuncs,
+)
+from . import varaproto
+from .logs import add_logging_arguments, category_logger, setup_logging
+from .pool import add_pool_arguments, start_pool
 from .rmsgw import RMSGatewayLogin
 
 
-logger = logging.getLogger("vara")
+logger = category_logger("control", "vara")
 
 
 WAIT_FOR_DISCONNECT = 120
-WAIT_FOR_STEP_MSEC = 1000
+RECONNECT_DELAY = 5  # seconds before reconnecting to a modem that went away
 
 
 class VaraPipeEvent(PipeEvent):
-    def __init__(self, vara_control):
-        super().__init__()
-        self.vara_control = vara_control
+    """
+    Pipe between the VARA data port (io) and the gateway (io2).
 
-    def connect_channel(self, spawn):
+    With `tx_target` set, reads from the gateway are paused while VARA
+    reports more than `tx_target` bytes in its TX queue (BUFFER), and resumed
+    once it drains to `tx_resume` (default half the target).
+    """
+
+    def __init__(self, vara_control, tx_target=None, tx_resume=None, **kwargs):
+        super().__init__(**kwargs)
+        self.vara_control = vara_control
+        self.tx_target = tx_target
+        if tx_resume is None and tx_target is not None:
+            tx_resume = tx_target // 2
+        self.tx_resume = tx_resume
+        self.tx_paused = False
+        self.disconnect_timers = []
+
+    def update_tx_buffer(self, size):
+        """Called with each BUFFER report from VARA."""
+        if self.tx_target is None or self.io2 is None:
+            return
+        if not self.tx_paused and size > self.tx_target:
+            self.log_for(self.io2, "VARA TX queue %s bytes, pausing gateway", size)
+            self.tx_paused = True
+            self.io2.read_cb_enable(False)
+        elif self.tx_paused and size <= self.tx_resume:
+            self.log_for(self.io2, "VARA TX queue %s bytes, resuming gateway", size)
+            self.tx_paused = False
+            if "io2" not in self.read_paused:
+                self.io2.read_cb_enable(True)
+
+    def reads_allowed(self, io):
+        if self.tx_paused and io.same_as(self.io2):
+            return False
+        return super().reads_allowed(io)
+
+    def connect_channel(self, spawn, pool=None, gateways=None):
         self.reset_channel()
+        if pool is not None and pool.attach(self):
+            return
+        if gateways is not None:
+            self.race = gateways.connect(self)
+            return
         # connect the program/console
-        self.io2 = gensio.gensio(OSFUNCS, spawn, self)
+        self.io2 = gensio.gensio(osfuncs(), spawn, self)
         self.io2.open(self)
 
     def close_channel(self):
@@ -35,33 +82,58 @@ class VaraPipeEvent(PipeEvent):
 
     def reset_channel(self):
         # clean up any buffer remnants
-        buf = self.bufA  # io2 writes from bufA
-        buf[:] = buf[1:0]
+        self.bufA.clear()  # io2 writes from bufA
         self.in_close = False
+        self.tx_paused = False
+        self.cancel_disconnect()
+        if self.race is not None:
+            self.race.cancel()
+            self.race = None
+        self.resume_reads(self.io)
 
-    def graceful_disconnect(self):
+    @property
+    def disconnecting(self):
+        return bool(self.disconnect_timers)
+
+    def start_disconnect(self):
+        """
+        Ask VARA to disconnect the link without blocking the selector.
+
+        DISCONNECT is sent now, ABORT if VARA hasn't reported DISCONNECTED
+        after 90% of WAIT_FOR_DISCONNECT, and the link is treated as
+        disconnected once WAIT_FOR_DISCONNECT expires. The DISCONNECTED
+        message (or expiry) ends up in `reset_channel`, which cancels the
+        timers.
+        """
+        if self.disconnecting:
+            return
         self.vara_control.execute("DISCONNECT")
-        # wait until VARA acknowledges the disconnect
-        abort = time.time() + (WAIT_FOR_DISCONNECT * 0.9)
-        expire = time.time() + WAIT_FOR_DISCONNECT
-        while True:
-            if time.time() > abort:
-                self.vara_control.execute("ABORT")
-                abort = float("inf")  # dont abort again
-            if time.time() > expire:
-                self.logger.error("VARA control never signaled disconnect.")
-                break
-            if not self.vara_control.connected:
-                break
-            self.waiter.wait_timeout(1, WAIT_FOR_STEP_MSEC)
+        self.disconnect_timers = [
+            TIMERS.call_later(WAIT_FOR_DISCONNECT * 0.9, self._disconnect_abort),
+            TIMERS.call_later(WAIT_FOR_DISCONNECT, self._disconnect_expired),
+        ]
+
+    def cancel_disconnect(self):
+        for timer in self.disconnect_timers:
+            timer.cancel()
+        self.disconnect_timers = []
+
+    def _disconnect_abort(self):
+        if self.vara_control.connected:
+            self.vara_control.execute("ABORT")
+
+    def _disconnect_expired(self):
+        self.disconnect_timers = []
+        if self.vara_control.connected:
+            self.logger.error("VARA control never signaled disconnect.")
+            self.vara_control.on_disconnected(varaproto.Disconnected())
 
     def close(self, io=None):
         if (io is not None and io.same_as(self.io)) or self.vara_control.in_shutdown:
             if self.vara_control.connected:
-                try:
-                    self.graceful_disconnect()
-                except Exception as exc:
-                    self.logger.exception("Unhandled Exception in graceful_disconnect")
+                # the rest of the close happens when VARA reports DISCONNECTED
+                self.start_disconnect()
+                return
             if not self.vara_control.in_shutdown:
                 # Note: we do NOT want to close the VARA side of the data connection
                 #       until we're shutting down the control side as well.
@@ -70,6 +142,10 @@ class VaraPipeEvent(PipeEvent):
 
 
 class VaraRMSPipeEvent(RMSGatewayLogin, VaraPipeEvent):
+    def reset_channel(self):
+        super().reset_channel()
+        self.reset_login()
+
     @property
     def callsign(self):
         return self.vara_control.laddr.partition("-")[0].encode("utf-8")
@@ -79,22 +155,58 @@ DEFAULT_SPAWN = "stdio(self)"
 
 
 class VaraControlEvent(IOEvent):
-    def __init__(self, laddr, data_port, spawn=None, banner=None, rms=False):
+    def __init__(
+        self,
+        laddr,
+        data_port,
+        spawn=None,
+        banner=None,
+        rms=False,
+        pipe_kwargs=None,
+        name=None,
+        pool=None,
+        gateways=None,
+    ):
         super().__init__()
         self.laddr = laddr
+        # optional pool.UpstreamPool of pre-connected gateway gensios
+        self.pool = pool
+        # optional failover.GatewaySet raced instead of opening `spawn`
+        self.gateways = gateways
+        # identifies the modem in logs and metrics when several are running
+        self.name = name or laddr
+        self.reconnects = 0
         self.data_port = data_port
         self.spawn = spawn or DEFAULT_SPAWN
         self.banner = banner
         self.connected = None
         self.in_shutdown = False
+        # latest modem state reported on the control channel
+        self.ptt = False
+        self.busy = False
+        self.tx_buffer = None
+        self.framer = varaproto.LineFramer()
+        # control message type -> handler; other messages are only
+        # delivered to subscribers
+        self.handlers = {
+            varaproto.Connected: self.on_connected,
+            varaproto.Disconnected: self.on_disconnected,
+            varaproto.Ptt: self.on_ptt,
+            varaproto.Busy: self.on_busy,
+            varaproto.Buffer: self.on_buffer,
+            varaproto.Wrong: self.on_wrong,
+            varaproto.MissingSoundcard: self.on_missing_soundcard,
+            varaproto.Unknown: self.on_unknown,
+        }
+        self.subscribers = {}
         if rms:
             pipe = VaraRMSPipeEvent
         else:
             pipe = VaraPipeEvent
+        self.pipe_kwargs = pipe_kwargs or {}
         self.data_pipe = self.establish_data_connection(pipe=pipe)
         # this will be sent on the first `write_callback`
-        self.bufB[:] = array.array(
-            "B",
+        self.bufB.extend(
             b"\r".join(
                 [
                     f"MYCALL {laddr}".encode("utf-8"),
@@ -106,72 +218,102 @@ class VaraControlEvent(IOEvent):
     @classmethod
     def from_gensio_str(cls, gensio_str, **kwargs):
         vc = cls(**kwargs)
-        vc.io = gensio.gensio(OSFUNCS, gensio_str, vc)
+        vc.io = gensio.gensio(osfuncs(), gensio_str, vc)
         vc.io.open(vc)
         return vc
 
     def establish_data_connection(self, pipe=VaraPipeEvent):
-        data_pipe = pipe(vara_control=self)
+        data_pipe = pipe(vara_control=self, **self.pipe_kwargs)
         data_pipe.io = gensio.gensio(
-            OSFUNCS,
+            osfuncs(),
             self.data_port,
             data_pipe,
         )
         data_pipe.io.open(data_pipe)
         return data_pipe
 
-    def dispatch(self, command):
-        args = command.split()
-        command = args[0].lower()
-        if command == "connected":
-            source, destination = args[1:3]
-            if source == self.laddr:
-                # we initiated a connection to destination
-                self.connected = destination
-            else:
-                # we accepted a connection from source
-                self.connected = source
-            try:
-                self.data_pipe.connect_channel(self.spawn)
-            except Exception:
-                self.log_for(self.io, f"Connection failed", exc_info=True)
-                self.data_pipe.close_channel()
-                return
-            if self.banner is not None:
-                self.data_pipe.bufB.extend(f"{self.banner}\r\n".encode("utf-8"))
-            self.log_for(self.io, f"Connected: s:{source} -> d:{destination}")
-        elif command == "disconnected":
-            disconnected_from = self.connected
-            self.connected = None
-            if self.data_pipe is not None:
-                self.data_pipe.reset_channel()
-            self.logger.info(f"Disconnected from {disconnected_from}")
-        elif command == "wrong":
-            self.log_for(self.io, f"WRONG!", level=logging.INFO)
-        elif command in [
-            "ok",
-            "iamalive",
-            "ptt",
-            "buffer",
-            "registered",
-            "link",
-            "pending",
-            "cancelpending",
-            "busy",
-        ]:
-            # these commands are all ignored at this point
-            pass
+    def subscribe(self, event_type, callback):
+        """
+        Call `callback(event)` for each parsed control message of `event_type`
+        (one of the `varaproto` event classes).
+        """
+        self.subscribers.setdefault(event_type, []).append(callback)
+
+    def unsubscribe(self, event_type, callback):
+        self.subscribers.get(event_type, []).remove(callback)
+
+    def on_connected(self, event):
+        if event.source == self.laddr:
+            # we initiated a connection to destination
+            self.connected = event.destination
         else:
-            self.log_for(
-                self.io,
-                f"unrecognized command: {command}",
-                level=logging.INFO,
+            # we accepted a connection from source
+            self.connected = event.source
+        try:
+            self.data_pipe.connect_channel(
+                self.spawn, pool=self.pool, gateways=self.gateways
             )
+        except Exception:
+            self.log_for(self.io, f"Connection failed", exc_info=True)
+            self.data_pipe.close_channel()
+            return
+        if self.banner is not None:
+            self.data_pipe.bufB.extend(f"{self.banner}\r\n".encode("utf-8"))
+        self.log_for(
+            self.io, f"Connected: s:{event.source} -> d:{event.destination}"
+        )
+
+    def on_disconnected(self, event):
+        disconnected_from = self.connected
+        self.connected = None
+        self.tx_buffer = None
+        if self.data_pipe is not None:
+            self.data_pipe.reset_channel()
+        self.logger.info(f"Disconnected from {disconnected_from}")
+        if self.in_shutdown and disconnected_from is not None:
+            # close() was waiting for the link to come down (a DISCONNECTED
+            # after the wait expired finds it closed already)
+            self.finish_close()
+
+    def on_ptt(self, event):
+        self.ptt = event.on
+
+    def on_busy(self, event):
+        self.busy = event.on
+
+    def on_buffer(self, event):
+        self.tx_buffer = event.size
+        if self.data_pipe is not None:
+            self.data_pipe.update_tx_buffer(event.size)
+
+    def on_wrong(self, event):
+        self.log_for(self.io, f"WRONG!", level=logging.INFO)
+
+    def on_missing_soundcard(self, event):
+        self.log_for(
+            self.io, "VARA reports MISSING SOUNDCARD", level=logging.ERROR
+        )
+
+    def on_unknown(self, event):
+        self.log_for(
+            self.io,
+            f"unrecognized command: {event.line}",
+            level=logging.INFO,
+        )
+
+    def dispatch(self, command):
+        event = varaproto.parse(command)
+        handler = self.handlers.get(type(event))
+        if handler is not None:
+            handler(event)
+        for callback in self.subscribers.get(type(event), ()):
+            callback(event)
 
     def execute(self, *args):
         def encode_utf8(obj):
             if not isinstance(obj, bytes):
                 return str(obj).encode("utf-8")
+            return obj
 
         self.bufB.extend(
             b" ".join(encode_utf8(a) for a in args) + b"\r",
@@ -187,21 +329,42 @@ class VaraControlEvent(IOEvent):
         if self.data_pipe.io is None:
             self.close()
             return data_len
-        readBuf = self.get_read_buffer(io)
-        if readBuf:
-            readBuf[:], commands = (
-                array.array("B"),
-                readBuf.tobytes().decode("utf-8").strip().splitlines(),
-            )
-            for command in commands:
-                try:
-                    self.dispatch(command)
-                except Exception as exc:
-                    self.logger.exception("Unhandled Exception in dispatch")
+        for command in self.framer.lines():
+            try:
+                self.dispatch(command)
+            except Exception as exc:
+                self.logger.exception("Unhandled Exception in dispatch")
         return data_len
 
+    def open_done(self, io, err):
+        super().open_done(io, err)
+        if err:
+            # close_done never comes for a gensio that failed to open
+            self.notify_closed()
+
+    def get_read_buffer(self, io):
+        if io.same_as(self.io):
+            # control messages are split into lines as they arrive
+            return self.framer
+        return super().get_read_buffer(io)
+
     def close(self, io=None):
+        if self.in_close:
+            # finish_close has run, this is write_callback closing the gensio
+            # now that the last commands are out
+            super().close(io)
+            return
         self.in_shutdown = True
+        if io is not None:
+            # the control channel itself failed, nobody will report DISCONNECTED
+            self.connected = None
+        if self.connected and self.data_pipe is not None:
+            # finish_close runs once VARA reports DISCONNECTED
+            self.data_pipe.start_disconnect()
+            return
+        self.finish_close(io)
+
+    def finish_close(self, io=None):
         self.data_pipe.close()
         super().close(io)
 
@@ -210,13 +373,184 @@ class VaraControlEvent(IOEvent):
             try:
                 self.wait()
             except KeyboardInterrupt:
-                if self.in_close:
+                if self.in_shutdown:
                     raise  # second interrupt kills us
                 self.logger.info("Interrupt, closing modem...")
             finally:
                 self.close()
 
 
+class VaraModem:
+    """
+    One modem in a multi-modem process: (re)creates its VaraControlEvent
+    and reconnects `reconnect_delay` seconds after the modem goes away.
+    """
+
+    def __init__(self, name, gensio_str, control_kwargs, reconnect_delay=RECONNECT_DELAY):
+        self.name = name
+        self.gensio_str = gensio_str
+        self.control_kwargs = control_kwargs
+        self.reconnect_delay = reconnect_delay
+        self.control = None
+        self.reconnects = 0
+        self.in_shutdown = False
+        self.reconnect_timer = None
+
+    def connect(self):
+        self.reconnect_timer = None
+        if self.in_shutdown:
+            return
+        logger.info("%s: connecting to VARA at %s", self.name, self.gensio_str)
+        try:
+            control = VaraControlEvent.from_gensio_str(
+                gensio_str=self.gensio_str, name=self.name, **self.control_kwargs
+            )
+        except Exception:
+            logger.exception("%s: could not connect to VARA", self.name)
+            self.schedule_reconnect()
+            return
+        control.reconnects = self.reconnects
+        # VaraControlEvent.notify_closed reports back through io_closed
+        control.listener = self
+        self.control = control
+        # imported here, not by importers of this module
+        from .metrics import watch_vara
+
+        watch_vara(control)
+
+    def io_closed(self, conn_id):
+        from .metrics import unwatch_vara
+
+        unwatch_vara(self.control)
+        self.control = None
+        if not self.in_shutdown:
+            self.schedule_reconnect()
+
+    def schedule_reconnect(self):
+        logger.warning(
+            "%s: lost VARA, reconnecting in %ss", self.name, self.reconnect_delay
+        )
+        self.reconnects += 1
+        self.reconnect_timer = TIMERS.call_later(self.reconnect_delay, self.connect)
+
+    def close(self):
+        self.in_shutdown = True
+        if self.reconnect_timer is not None:
+            self.reconnect_timer.cancel()
+            self.reconnect_timer = None
+        if self.control is not None:
+            self.control.close()
+
+
+class VaraModems:
+    """
+    Drive several VARA modems on the shared gensio selector.
+
+    modems = VaraModems(load_modems("modems.ini", defaults))
+    modems.run()
+    """
+
+    def __init__(self, modems):
+        self.modems = modems
+        self.waiter = gensio.waiter(osfuncs())
+
+    def connected(self):
+        return [m for m in self.modems if m.control is not None]
+
+    def run(self):
+        for modem in self.modems:
+            modem.connect()
+        try:
+            while True:
+                TIMERS.wait(self.waiter)
+        except KeyboardInterrupt:
+            logger.info("Interrupt, closing modems...")
+        for modem in self.modems:
+            modem.close()
+        # links still up get their graceful disconnect; a second interrupt
+        # kills us
+        while self.connected():
+            TIMERS.wait(self.waiter, done=lambda: not self.connected())
+
+
+# config keys (and their argparse dest) that may be given per modem
+MODEM_OPTIONS = {
+    "listen": "listen",
+    "vara-host": "vara_host",
+    "vara-port": "vara_port",
+    "gateway": "gateway",
+    "banner": "banner",
+    "high-water": "high_water",
+    "low-water": "low_water",
+    "tx-target": "tx_target",
+}
+INT_OPTIONS = ("vara-port", "high-water", "low-water", "tx-target")
+
+
+def modem_settings(args):
+    """The single-modem command line as a settings dict."""
+    return {key: getattr(args, dest) for key, dest in MODEM_OPTIONS.items()}
+
+
+def make_modem(settings):
+    """Return (control gensio string, VaraControlEvent kwargs) for `settings`."""
+    gw1, rms, gw2 = settings["gateway"].partition("rms,")
+    port = int(settings["vara-port"])
+    control_kwargs = dict(
+        laddr=settings["listen"],
+        data_port=f"tcp,{settings['vara-host']},{port + 1}",
+        spawn=gw1 + gw2,
+        banner=settings["banner"],
+        rms=bool(rms),
+        pipe_kwargs=dict(
+            high_water=settings["high-water"],
+            low_water=settings["low-water"],
+            tx_target=settings["tx-target"],
+        ),
+    )
+    return f"tcp,{settings['vara-host']},{port}", control_kwargs
+
+
+def load_modems(path, defaults):
+    """
+    Read one modem per section of the ini file at `path`; keys are the long
+    command line options (listen, vara-host, vara-port, gateway, banner,
+    high-water, low-water, tx-target), falling back to `defaults`.
+
+    [hf]
+    listen = KF7HVM-10
+    vara-port = 8300
+
+    [fm]
+    listen = KF7HVM-11
+    vara-port = 8400
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    with open(path) as f:
+        config.read_file(f)
+    modems = []
+    for name in config.sections():
+        section = config[name]
+        unknown = set(section) - set(MODEM_OPTIONS)
+        if unknown:
+            raise ValueError(
+                "{}: unknown option(s) in [{}]: {}".format(
+                    path, name, ", ".join(sorted(unknown))
+                )
+            )
+        settings = dict(defaults)
+        for key in section:
+            value = section[key]
+            settings[key] = int(value) if key in INT_OPTIONS else value
+        if not settings["listen"]:
+            raise ValueError("{}: [{}] needs a listen callsign".format(path, name))
+        gensio_str, control_kwargs = make_modem(settings)
+        modems.append(VaraModem(name, gensio_str, control_kwargs))
+    if not modems:
+        raise ValueError("{}: no modems configured".format(path))
+    return modems
+
+
 """
 Some other ideas for spawning a gateway
 SPAWN = "tcp,india.colorado.edu,13"   # time
@@ -225,13 +559,25 @@ SPAWN = "tcp,telehack.com,23"         # sort of shell
 
 
 def main():
+    import argparse
+
+    # only the tool needs these, not importers of this module
+    from .capture import add_capture_arguments, start_capture
+    from .metrics import add_metrics_arguments, start_metrics, watch_vara
+
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-l",
         "--listen",
-        required=True,
         help="Callsign-SSID to listen for VARA connections.",
     )
+    parser.add_argument(
+        "-c",
+        "--config",
+        default=None,
+        help="ini file with one section per modem to run them all in this process "
+        "(options given here are the defaults for every modem)",
+    )
     parser.add_argument(
         "-p",
         "--vara-port",
@@ -246,26 +592,82 @@ def main():
     parser.add_argument(
         "--gateway",
         default="rms,tcp,cms.winlink.org,8772",
-        help="Gensio connection string for gateway endpoint.",
+        help="Gensio connection string for gateway endpoint; several separated "
+        "by ';' are raced, in order, for each session.",
     )
     parser.add_argument(
         "--banner",
         default=None,
         help="Text displayed when user connects",
     )
+    parser.add_argument(
+        "--high-water",
+        type=int,
+        default=DEFAULT_HIGH_WATER,
+        help="Pause reads from a side once this many bytes are waiting to be sent",
+    )
+    parser.add_argument(
+        "--low-water",
+        type=int,
+        default=DEFAULT_LOW_WATER,
+        help="Resume paused reads once the backlog drains to this many bytes",
+    )
+    parser.add_argument(
+        "--tx-target",
+        type=int,
+        default=None,
+        help="Pause the gateway while VARA reports more than this many bytes queued "
+        "for transmit (BUFFER); disabled by default",
+    )
 
-    args = parser.parse_args()
-
-    gw1, rms, gw2 = args.gateway.partition("rms,")
+    add_logging_arguments(parser)
+    add_metrics_arguments(parser)
+    add_capture_arguments(parser)
+    add_pool_arguments(parser)
 
-    VaraControlEvent.from_gensio_str(
-        gensio_str=f"tcp,{args.vara_host},{args.vara_port}",
-        laddr=args.listen,
-        data_port=f"tcp,{args.vara_host},{int(args.vara_port)+1}",
-        spawn=gw1 + gw2,
-        banner=args.banner,
-        rms=bool(rms),
-    ).wait_till_close()
+    args = parser.parse_args()
+    if not args.listen and not args.config:
+        parser.error("one of -l/--listen or -c/--config is required")
+    setup_logging(args)
+    start_metrics(args)
+    start_capture(args)
+
+    pools = {}
+    gateway_sets = {}
+
+    def pool_for(control_kwargs):
+        # modems with the same gateway share its pool
+        key = (control_kwargs["spawn"], control_kwargs["rms"])
+        if key not in pools:
+            pools[key] = start_pool(args, *key)
+        return pools[key]
+
+    def gateways_for(control_kwargs):
+        # ... and the health of its endpoints
+        key = (control_kwargs["spawn"], control_kwargs["rms"])
+        if key not in gateway_sets:
+            gateway_sets[key] = gateway_set(*key)
+        return gateway_sets[key]
+
+    if args.config:
+        try:
+            modems = load_modems(args.config, modem_settings(args))
+        except (OSError, ValueError, configparser.Error) as exc:
+            parser.error(str(exc))
+        for modem in modems:
+            modem.control_kwargs["pool"] = pool_for(modem.control_kwargs)
+            modem.control_kwargs["gateways"] = gateways_for(modem.control_kwargs)
+        VaraModems(modems).run()
+        return
+
+    gensio_str, control_kwargs = make_modem(modem_settings(args))
+    control_kwargs["pool"] = pool_for(control_kwargs)
+    control_kwargs["gateways"] = gateways_for(control_kwargs)
+    vara_control = VaraControlEvent.from_gensio_str(
+        gensio_str=gensio_str, **control_kwargs
+    )
+    watch_vara(vara_control)
+    vara_control.wait_till_close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,208 @@
+"""
+VARA control channel protocol: line framing and message parsing.
+
+See vara_to_application.txt for the messages VARA sends to the application.
+This module has no gensio dependency so it can be used on its own.
+
+framer = LineFramer()
+framer.extend(b"CONNEC")
+framer.extend(b"TED K1ABC KF7HVM-10 2300\\r")
+for line in framer.lines():
+    event = parse(line)  # Connected(source='K1ABC', ...)
+"""
+
+import re
+from typing import NamedTuple, Optional, Tuple
+
+
+_EOL = re.compile(rb"[\r\n]+")
+
+
+class LineFramer:
+    """
+    Incremental CR (or LF) delimited line splitter.
+
+    Bytes are accumulated with `extend` (so a framer can stand in for an
+    IOEvent read buffer); `lines` returns each complete, non-empty line and
+    keeps any trailing partial line for the next read.
+    """
+
+    def __init__(self, encoding="utf-8", max_line=4096):
+        self.encoding = encoding
+        # a line longer than this is discarded rather than buffered forever
+        self.max_line = max_line
+        self._buf = bytearray()
+        self._scan = 0  # bytes of self._buf already searched for a delimiter
+
+    def __len__(self):
+        return len(self._buf)
+
+    def __bool__(self):
+        return bool(self._buf)
+
+    def extend(self, data):
+        self._buf.extend(data)
+        return len(data)
+
+    def clear(self):
+        self._buf.clear()
+        self._scan = 0
+
+    def lines(self):
+        """Return the complete lines received so far, consuming them."""
+        buf = self._buf
+        lines = []
+        start = 0
+        for match in _EOL.finditer(buf, self._scan):
+            if match.start() > start:
+                lines.append(buf[start : match.start()].decode(self.encoding, "replace"))
+            start = match.end()
+        del buf[:start]
+        self._scan = len(buf)
+        if self._scan > self.max_line:
+            self.clear()
+        return lines
+
+
+# VARA -> application messages
+
+
+class Connected(NamedTuple):
+    source: str
+    destination: str
+    digipeaters: Tuple[str, ...] = ()
+    bandwidth: Optional[int] = None
+
+
+class Disconnected(NamedTuple):
+    pass
+
+
+class Ptt(NamedTuple):
+    on: bool
+
+
+class Buffer(NamedTuple):
+    size: int
+
+
+class Pending(NamedTuple):
+    pass
+
+
+class CancelPending(NamedTuple):
+    pass
+
+
+class Busy(NamedTuple):
+    on: bool
+
+
+class Registered(NamedTuple):
+    callsign: str
+
+
+class Link(NamedTuple):
+    registered: bool
+
+
+class IAmAlive(NamedTuple):
+    pass
+
+
+class MissingSoundcard(NamedTuple):
+    pass
+
+
+class CQFrame(NamedTuple):
+    source: str
+    digipeaters: Tuple[str, ...] = ()
+    bandwidth: Optional[int] = None
+
+
+class SN(NamedTuple):
+    value: float
+
+
+class Ok(NamedTuple):
+    pass
+
+
+class Wrong(NamedTuple):
+    pass
+
+
+class Unknown(NamedTuple):
+    line: str
+
+
+def _on_off(args):
+    return bool(args) and args[0].upper() == "ON"
+
+
+def _split_path(args):
+    """Split `[via] Digi1 Digi2 [BW]` into (digipeaters, bandwidth)."""
+    args = list(args)
+    bandwidth = None
+    if args and args[-1].isdigit():
+        bandwidth = int(args.pop())
+    if args and args[0].upper() == "VIA":
+        args.pop(0)
+    return tuple(args), bandwidth
+
+
+def _parse_connected(args):
+    digipeaters, bandwidth = _split_path(args[2:])
+    return Connected(args[0], args[1], digipeaters, bandwidth)
+
+
+def _parse_cqframe(args):
+    digipeaters, bandwidth = _split_path(args[1:])
+    return CQFrame(args[0], digipeaters, bandwidth)
+
+
+def _parse_missing(args):
+    if args and args[0].upper() == "SOUNDCARD":
+        return MissingSoundcard()
+    return None
+
+
+def _parse_link(args):
+    if args and args[0].upper() in ("REGISTERED", "UNREGISTERED"):
+        return Link(args[0].upper() == "REGISTERED")
+    return None
+
+
+# first word of a message -> parser taking the remaining words
+COMMANDS = {
+    "CONNECTED": _parse_connected,
+    "DISCONNECTED": lambda args: Disconnected(),
+    "PTT": lambda args: Ptt(_on_off(args)),
+    "BUFFER": lambda args: Buffer(int(args[0])),
+    "PENDING": lambda args: Pending(),
+    "CANCELPENDING": lambda args: CancelPending(),
+    "BUSY": lambda args: Busy(_on_off(args)),
+    "REGISTERED": lambda args: Registered(args[0]),
+    "LINK": _parse_link,
+    "IAMALIVE": lambda args: IAmAlive(),
+    "MISSING": _parse_missing,
+    "CQFRAME": _parse_cqframe,
+    "SN": lambda args: SN(float(args[0])),
+    "OK": lambda args: Ok(),
+    "WRONG": lambda args: Wrong(),
+}
+
+
+def parse(line):
+    """Parse one control line into an event; malformed lines become `Unknown`."""
+    words = line.split()
+    if not words:
+        return Unknown(line)
+    parser = COMMANDS.get(words[0].upper())
+    if parser is None:
+        return Unknown(line)
+    try:
+        event = parser(words[1:])
+    except (IndexError, ValueError):
+        event = None
+    return Unknown(line) if event is None else event
@@ -0,0 +1,278 @@
+"""
+Run a front end as several worker processes.
+
+Each worker is a fresh `python -m gensio_modems.<tool>` interpreter with its
+own gensio selector; the supervisor restarts any worker that exits.
+Options naming a port or file only one process may own (PER_WORKER_OPTIONS)
+are given a value of their own in each worker, e.g. port+N or <path>.N.
+
+ax25: the listen callsigns are sharded across workers, each of which opens
+its own KISS connection and only answers for its own callsigns, so the TNC
+must take several clients over tcp (a serial port has only one owner).
+
+proxy: the supervisor opens the `--listen` socket and every worker inherits
+it and accepts on it (see sockio.py), so sessions never pass through the
+supervisor; the kernel hands each connection to one of the workers waiting.
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from .logs import category_logger
+
+
+logger = category_logger("control", "workers")
+
+RESTART_DELAY = 5  # seconds to wait before restarting a crashed worker
+CHECK_INTERVAL_MSEC = 1000
+
+
+def strip_options(argv, names, takes_value=True):
+    """Return `argv` without any occurrence of the options in `names`."""
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        if arg in names:
+            skip = takes_value
+            continue
+        if any(arg.startswith(name + "=") for name in names if name.startswith("--")):
+            continue
+        if takes_value and any(
+            arg.startswith(name) and len(arg) > len(name)
+            for name in names
+            if not name.startswith("--")
+        ):
+            continue  # short option with attached value, e.g. -lKF7HVM
+        result.append(arg)
+    return result
+
+
+def worker_options(argv, index, per_worker):
+    """
+    Return `argv` with the value of each option in `per_worker` (option name
+    -> function(value, index) returning worker `index`'s value) replaced.
+    """
+    result = []
+    rewrite = None
+    for arg in argv:
+        if rewrite is not None:
+            result.append(rewrite(arg, index))
+            rewrite = None
+            continue
+        name, eq, value = arg.partition("=")
+        if name in per_worker:
+            if eq:
+                arg = "{}={}".format(name, per_worker[name](value, index))
+            else:
+                rewrite = per_worker[name]
+        result.append(arg)
+    return result
+
+
+def numbered_path(path, index):
+    """A file of worker `index`'s own, next to `path`."""
+    return "{}.{}".format(path, index)
+
+
+def numbered_port(gensio_str, index):
+    """
+    An accepter of worker `index`'s own: `gensio_str`'s port plus `index`
+    (or, for a unix socket, its path numbered).
+    """
+    head, _, last = gensio_str.rpartition(",")
+    if last.isdigit():
+        last = str(int(last) + index)
+    else:
+        last = numbered_path(last, index)
+    return "{},{}".format(head, last) if head else last
+
+
+# options naming something only one process may own (a listening port, a
+# file it rewrites), given a value of its own in each worker
+PER_WORKER_OPTIONS = {
+    "--metrics": numbered_port,
+    "--capture": numbered_path,
+    "--profiles": numbered_path,
+}
+
+
+def shard(items, count):
+    """Split `items` round-robin into at most `count` non-empty lists."""
+    shards = [items[i::count] for i in range(count)]
+    return [s for s in shards if s]
+
+
+class Worker:
+    def __init__(self, index, argv, pass_fds=()):
+        self.index = index
+        self.argv = argv
+        self.proc = None
+        self.restarts = 0
+        self.restart_at = 0
+        self.pass_fds = pass_fds
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        logger.info("starting worker %s: %s", self.index, " ".join(self.argv))
+        self.proc = subprocess.Popen(self.argv, pass_fds=self.pass_fds)
+
+    def stop(self):
+        if self.alive:
+            self.proc.terminate()
+
+
+class Supervisor:
+    """
+    Start `argvs` as worker processes and keep them running.
+
+    supervisor = Supervisor([[sys.executable, "-m", "gensio_modems.ax25", ...]])
+    supervisor.run()
+
+    `pass_fds` are left open in every worker (e.g. a shared listening socket).
+    """
+
+    def __init__(self, argvs, restart_delay=RESTART_DELAY, pass_fds=()):
+        self.workers = [
+            Worker(ix, argv, pass_fds=pass_fds) for ix, argv in enumerate(argvs)
+        ]
+        self.restart_delay = restart_delay
+        self.in_shutdown = False
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def check_workers(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.alive or self.in_shutdown:
+                continue
+            if worker.restart_at == 0:
+                logger.error(
+                    "worker %s exited with %s, restarting in %ss",
+                    worker.index,
+                    worker.proc.returncode,
+                    self.restart_delay,
+                )
+                worker.restart_at = now + self.restart_delay
+            elif now >= worker.restart_at:
+                worker.restart_at = 0
+                worker.restarts += 1
+                worker.start()
+
+    def stop(self):
+        self.in_shutdown = True
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            if worker.proc is not None:
+                worker.proc.wait()
+
+    def run(self):
+        """Supervise until interrupted."""
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.start()
+        try:
+            while True:
+                time.sleep(CHECK_INTERVAL_MSEC / 1000)
+                self.check_workers()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+def run_ax25_workers(callsigns, kiss, argv, workers):
+    """Shard `callsigns` across `workers` ax25 processes."""
+    if not kiss_over_tcp(kiss):
+        # a serial TNC can only be opened by one process
+        raise ValueError(
+            "--workers needs a --kiss TNC reached over tcp, not {!r}".format(kiss)
+        )
+    base = strip_options(argv, ("--workers",))
+    base = strip_options(base, ("-l", "--listen"))
+    argvs = [
+        [
+            sys.executable,
+            "-m",
+            "gensio_modems.ax25",
+            "-l",
+            ",".join(calls),
+            *worker_options(base, ix, PER_WORKER_OPTIONS),
+        ]
+        for ix, calls in enumerate(shard(callsigns, workers))
+    ]
+    if len(argvs) < workers:
+        logger.warning(
+            "only %s callsign(s) to listen on, starting %s worker(s)",
+            len(callsigns),
+            len(argvs),
+        )
+    Supervisor(argvs).run()
+
+
+def kiss_over_tcp(kiss):
+    """Whether the KISS gensio string `kiss` connects to its TNC over tcp."""
+    return any(field.partition("(")[0] == "tcp" for field in kiss.split(","))
+
+
+def listen_socket(listen):
+    """
+    Open a listening socket for the gensio string `listen`, which must be a
+    plain "tcp,[host,]port" or "unix,path" accepter.
+    """
+    fields = listen.split(",")
+    kind = fields[0].partition("(")[0]
+    if kind == "unix" and len(fields) == 2:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(fields[1])
+        sock.listen()
+        return sock
+    if kind == "tcp" and len(fields) in (2, 3) and fields[-1].isdigit():
+        port = int(fields[-1])
+        if len(fields) == 3 and fields[1]:
+            return socket.create_server((fields[1], port))
+        if socket.has_dualstack_ipv6():
+            return socket.create_server(
+                ("", port), family=socket.AF_INET6, dualstack_ipv6=True
+            )
+        return socket.create_server(("", port))
+    raise ValueError(
+        "--workers needs --listen tcp,[host,]port or unix,path, not {!r}".format(
+            listen
+        )
+    )
+
+
+def run_proxy_workers(listen, argv, workers):
+    """Run `workers` proxy processes all accepting on `listen`."""
+    sock = listen_socket(listen)
+    base = strip_options(argv, ("--workers",))
+    base = strip_options(base, ("-l", "--listen", "--listen-fd"))
+    argvs = [
+        [
+            sys.executable,
+            "-m",
+            "gensio_modems.proxy",
+            "--listen-fd",
+            str(sock.fileno()),
+            *worker_options(base, ix, PER_WORKER_OPTIONS),
+        ]
+        for ix in range(workers)
+    ]
+    try:
+        Supervisor(argvs, pass_fds=(sock.fileno(),)).run()
+    finally:
+        if sock.family == socket.AF_UNIX:
+            os.unlink(sock.getsockname())
+        sock.close()
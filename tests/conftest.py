@@ -0,0 +1,112 @@
+import socket
+import types
+
+import gensio
+import pytest
+
+from gensio_modems.gutils import osfuncs
+
+
+class FakeIO:
+    """
+    Stands in for a gensio: records what is written and which callbacks are
+    enabled; `accept` limits how many bytes each write takes.
+    """
+
+    def __init__(self, name="io", accept=None):
+        self.name = name
+        self.accept = accept
+        self.handler = None
+        self.written = bytearray()
+        self.read_enabled = None
+        self.write_enabled = None
+        self.closed = False
+
+    def __repr__(self):
+        return self.name
+
+    def same_as(self, other):
+        return other is self
+
+    def set_cbs(self, handler):
+        self.handler = handler
+
+    def read_cb_enable(self, enabled):
+        self.read_enabled = enabled
+
+    def write_cb_enable(self, enabled):
+        self.write_enabled = enabled
+
+    def write(self, data, auxdata):
+        count = len(data) if self.accept is None else min(self.accept, len(data))
+        self.written += data[:count]
+        return count
+
+    def open(self, handler):
+        pass
+
+    def close(self, handler):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_io():
+    """Factory for FakeIO gensios."""
+    return FakeIO
+
+
+@pytest.fixture
+def fake_gensio(monkeypatch, fake_io):
+    """
+    `fake_gensio(module)` makes `module`'s gensio.gensio(...) return FakeIOs,
+    and returns the list they are appended to.
+    """
+
+    def patch(module):
+        opened = []
+
+        def new_gensio(osfuncs, gensio_str, handler):
+            io = fake_io(gensio_str)
+            io.handler = handler
+            opened.append(io)
+            return io
+
+        monkeypatch.setattr(
+            module, "gensio", types.SimpleNamespace(gensio=new_gensio)
+        )
+        return opened
+
+    return patch
+
+
+class _NoConnections:
+    def new_connection(self, acc, io):
+        return None
+
+    def shutdown_done(self, acc):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def gensio_net():
+    """Skip unless gensio can listen on (and connect to) localhost TCP here."""
+    try:
+        acc = gensio.gensio_accepter(
+            osfuncs(), "tcp,localhost,{}".format(free_port()), _NoConnections()
+        )
+        acc.startup()
+    except Exception as exc:
+        pytest.skip("gensio can't listen on tcp here: {}".format(exc))
+    acc.shutdown_s()
+
+
+@pytest.fixture
+def gensio_port(gensio_net):
+    """A free localhost port for a gensio accepter."""
+    return free_port()
@@ -0,0 +1,216 @@
+import time
+
+import pytest
+
+from gensio_modems import ax25
+from gensio_modems.admission import Admission, TokenBucket
+from gensio_modems.gutils import IOEvent, ListenerEvent, TIMERS
+
+
+def run_timers(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.005)
+        TIMERS.run_due()
+
+
+def drain(ioev, io):
+    """Let `ioev` write (and close) `io` as a gensio would."""
+    while io.write_enabled and not io.closed:
+        ioev.write_callback(io)
+
+
+class Listener(ListenerEvent):
+    """Starts a bare IOEvent session for each connection it admits."""
+
+    def __init__(self, admission, fake_io):
+        super().__init__()
+        self.admission = admission
+        self.fake_io = fake_io
+
+    def connect(self, callsign):
+        io = self.fake_io(callsign)
+        self.admit(io, lambda: self.start_session(io, callsign), callsign)
+        return io
+
+    def start_session(self, io, callsign):
+        ioev = IOEvent()
+        ioev.io = io
+        self.track(ioev, callsign=callsign)
+        return ioev
+
+    def session_of(self, io):
+        for conn_id, ioev in self.connections:
+            if ioev.io is io:
+                return conn_id, ioev
+        return None, None
+
+    def hang_up(self, io):
+        conn_id, _ = self.session_of(io)
+        self.io_closed(conn_id)
+
+
+def held_for(admission, io):
+    return next(held for held in admission.held if held.io is io)
+
+
+@pytest.fixture
+def admission():
+    admission = Admission(
+        max_sessions=2, max_per_callsign=1, queue_size=2, queue_timeout=0.2
+    )
+    yield admission
+    admission.shutdown()
+
+
+@pytest.fixture
+def listener(admission, fake_io):
+    return Listener(admission, fake_io)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=2, burst=3, now=0.0)
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    # two tokens a second
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+    # never more than the burst saved up
+    assert [bucket.take(100.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_token_bucket_burst_defaults_to_rate():
+    assert TokenBucket(rate=5, now=0.0).burst == 5
+    assert TokenBucket(rate=0.1, now=0.0).burst == 1
+
+
+def test_callsign_rate_turns_away(fake_io):
+    admission = Admission(callsign_rate=0.01, callsign_burst=2)
+    listener = Listener(admission, fake_io)
+    listener.connect("K1ABC")
+    listener.connect("K1ABC")
+    io = listener.connect("K1ABC")
+    listener.connect("K2DEF")
+    assert admission.rejected["callsign_rate"] == 1
+    assert len(listener.connections) == 3
+    drain(held_for(admission, io), io)
+    assert io.written == b"Busy, please retry later.\r\n"
+    assert io.closed
+
+
+def test_over_cap_queues_then_turns_away(listener, admission):
+    listener.connect("K1ABC")
+    listener.connect("K1ABC")  # over the callsign cap
+    listener.connect("K2DEF")
+    listener.connect("K3GHI")  # over max_sessions
+    assert len(listener.connections) == 2
+    assert [held.callsign for held in admission.queue] == ["K1ABC", "K3GHI"]
+    io = listener.connect("K4JKL")  # the queue is full
+    assert admission.rejected["sessions"] == 1
+    assert not io.read_enabled
+    assert held_for(admission, io) not in admission.queue
+
+
+def test_next_waiting_is_fair(listener, admission):
+    a1 = listener.connect("K1ABC")
+    listener.connect("K2DEF")
+    listener.connect("K1ABC")
+    listener.connect("K3GHI")
+    # K1ABC queued first, but already has a session: K3GHI goes next
+    listener.hang_up(listener.connections.by_callsign("K2DEF")[0].io)
+    assert [ioev.io.name for _, ioev in listener.connections] == ["K1ABC", "K3GHI"]
+    assert [held.callsign for held in admission.queue] == ["K1ABC"]
+    # K1ABC's queued connection waits for its first session to end
+    assert admission.next_waiting(listener) is None
+    listener.hang_up(a1)
+    assert admission.queue == []
+    assert admission.admitted == 4
+
+
+def test_fewest_sessions_first(fake_io):
+    admission = Admission(max_sessions=3, queue_size=3, queue_timeout=1)
+    listener = Listener(admission, fake_io)
+    first = listener.connect("K1ABC")
+    listener.connect("K1ABC")
+    listener.connect("K2DEF")
+    listener.connect("K1ABC")
+    listener.connect("K3GHI")
+    listener.hang_up(first)
+    # K3GHI has no session yet, K1ABC has one left
+    assert admission.queue[0].callsign == "K1ABC"
+    assert len(listener.connections.by_callsign("K3GHI")) == 1
+    admission.shutdown()
+
+
+def test_queue_timeout(listener, admission):
+    listener.connect("K1ABC")
+    listener.connect("K2DEF")
+    io = listener.connect("K3GHI")
+    assert io.read_enabled
+    run_timers(admission.queue_timeout + 0.05)
+    assert admission.queue == []
+    assert admission.rejected["timeout"] == 1
+    held = held_for(admission, io)
+    drain(held, io)
+    assert io.written == b"Busy, please retry later.\r\n"
+    assert io.closed
+    held.close_done(io)
+    assert held not in admission.held
+
+
+def test_start_replays_held_bytes(listener, admission):
+    listener.connect("K1ABC")
+    b = listener.connect("K2DEF")
+    c = listener.connect("K3GHI")
+    held = held_for(admission, c)
+    # the station talks while it waits
+    held.read_callback(c, None, b"hello", None)
+    listener.hang_up(b)
+    _, session = listener.session_of(c)
+    assert c.handler is session
+    assert session.bufA.tobytes() == b"hello"
+    assert held.io is None
+    assert held not in admission.held
+    assert held.timer is None
+
+
+def test_hang_up_while_queued(listener, admission):
+    listener.connect("K1ABC")
+    b = listener.connect("K2DEF")
+    c = listener.connect("K3GHI")
+    held = held_for(admission, c)
+    held.read_callback(c, "Remote end closed connection", None, None)
+    assert c.closed
+    held.close_done(c)
+    assert admission.queue == []
+    listener.hang_up(b)
+    assert listener.session_of(c) == (None, None)
+
+
+def ax25_io(fake_io, callsign):
+    """A FakeIO that reports an AX.25 address, as an accepted ax25 gensio."""
+    io = fake_io(callsign)
+    io.control = lambda depth, get, option, data: "ax25:0,{},GW".format(callsign)
+    return io
+
+
+def test_ax25_listener(monkeypatch, fake_io):
+    gateways = []
+
+    def spawn_for(ioev, template):
+        gateways.append(fake_io("gw-" + ioev.ax25_addr.callsign))
+        return gateways[-1]
+
+    monkeypatch.setattr(ax25, "spawn_for", spawn_for)
+    admission = Admission(max_per_callsign=1, queue_size=1)
+    listener = ax25.AX25ListenerEvent("tcp,gw,8772", admission=admission)
+    first = ax25_io(fake_io, "K1ABC-1")
+    second = ax25_io(fake_io, "K1ABC-2")
+    listener.new_connection(None, first)
+    listener.new_connection(None, second)
+    # no gateway for the queued connection yet
+    assert [io.name for io in gateways] == ["gw-K1ABC"]
+    assert [held.callsign for held in admission.queue] == ["K1ABC"]
+    conn_id, _ = next(iter(listener.connections))
+    listener.io_closed(conn_id)
+    assert len(gateways) == 2
+    assert admission.queue == []
@@ -0,0 +1,153 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from gensio_modems.aio import (
+    DEFAULT_WRITE_LOW_WATER,
+    AsyncIOEvent,
+    GensioLoopDriver,
+    open_connection,
+    start_server,
+)
+
+
+def test_idle_ticks_back_off():
+    async def main():
+        loop = asyncio.get_running_loop()
+        driver = GensioLoopDriver(loop, idle_interval=0.01, max_idle_interval=0.08)
+        ticks = []
+        tick = driver._tick
+
+        def counted_tick():
+            ticks.append(loop.time())
+            tick()
+
+        driver._tick = counted_tick
+        driver.start()
+        await asyncio.sleep(0.5)
+        idle = len(ticks)
+        assert driver.interval == 0.08
+
+        driver.kick()
+        assert driver.interval == 0.01
+        await asyncio.sleep(0.05)
+        driver.stop()
+        return idle, ticks
+
+    idle, ticks = asyncio.run(main())
+    # 0.01 + 0.02 + 0.04, then every 0.08s: ~8 ticks, not the 50 of a fixed 10ms poll
+    assert idle <= 12
+    gaps = [b - a for a, b in zip(ticks, ticks[1:idle])]
+    assert max(gaps) >= 0.07
+
+
+def attached(fake_io, io_name="io"):
+    """An AsyncIOEvent on a FakeIO, as open_connection leaves it."""
+    driver = GensioLoopDriver(asyncio.get_running_loop())
+    driver.start()
+    handler = AsyncIOEvent(driver)
+    io = fake_io(io_name, accept=0)
+    handler.attach(io)
+    handler.opened.set_result(None)
+    return handler, io
+
+
+def test_peer_drops_with_writes_pending(fake_io):
+    async def main():
+        handler, io = attached(fake_io)
+        handler.writer.write(b"x" * (2 * DEFAULT_WRITE_LOW_WATER))
+        drain = asyncio.ensure_future(handler.writer.drain())
+        await asyncio.sleep(0)
+        assert not drain.done()
+        handler.read_callback(io, "Connection reset by peer", None, None)
+        handler.write_callback(io)
+        with pytest.raises(ConnectionError):
+            await drain
+        assert not handler.buf
+        assert io.write_enabled is False
+        assert io.closed
+        handler.close_done(io)
+        await handler.writer.wait_closed()
+        with pytest.raises(ConnectionError):
+            handler.writer.write(b"more")
+
+    asyncio.run(main())
+
+
+def test_write_error_closes(fake_io):
+    class Broken(fake_io):
+        def write(self, data, auxdata):
+            raise OSError("Broken pipe")
+
+    async def main():
+        handler, io = attached(Broken)
+        handler.writer.write(b"data")
+        handler.write_callback(io)
+        with pytest.raises(ConnectionError):
+            await handler.writer.drain()
+        assert not handler.buf
+        assert io.write_enabled is False
+        assert io.closed
+        handler.close_done(io)
+
+    asyncio.run(main())
+
+
+def test_echo_server(gensio_port):
+    async def echo(reader, writer):
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+    async def main():
+        server = await start_server(echo, "tcp,localhost,{}".format(gensio_port))
+        async with server:
+            reader, writer = await open_connection(
+                "tcp,localhost,{}".format(gensio_port)
+            )
+            payload = bytes(range(256)) * 1024
+            writer.write(payload)
+            await writer.drain()
+            got = await reader.readexactly(len(payload))
+            writer.close()
+            await writer.wait_closed()
+        return payload, got
+
+    payload, got = asyncio.run(main())
+    assert got == payload
+
+
+def test_server_write_to_dropped_peer(gensio_port):
+    async def flood(reader, writer):
+        try:
+            while True:
+                writer.write(b"x" * 65536)
+                await writer.drain()
+        except ConnectionError:
+            result.set_result("error")
+        await writer.wait_closed()
+
+    async def main():
+        nonlocal result
+        result = asyncio.get_running_loop().create_future()
+        server = await start_server(flood, "tcp,localhost,{}".format(gensio_port))
+        async with server:
+            sock = await asyncio.to_thread(
+                socket.create_connection, ("localhost", gensio_port), 10
+            )
+            await asyncio.to_thread(sock.recv, 1)
+            # reset rather than a clean close, with writes still queued
+            linger = struct.pack("ii", 1, 0)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, linger)
+            sock.close()
+            return await asyncio.wait_for(result, 10)
+
+    result = None
+    assert asyncio.run(main()) == "error"
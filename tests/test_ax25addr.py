@@ -0,0 +1,67 @@
+import pytest
+
+from benchmarks.bench_ax25addr import old_substitution
+from gensio_modems.ax25 import AX25Address, CommandTemplate, parse_ax25_addr
+
+ADDRESSES = [
+    "ax25:0,N0CALL-7,KF7HVM-10,WIDE1-1,WIDE2-2",
+    "ax25:0,n0call,KF7HVM-10",
+    "ax25:1,K1ABC-15,GW",
+]
+COMMANDS = [
+    "stdio,/usr/local/bin/rmsgw -l debug -P %d %U",
+    "stdio,/bin/echo %u %S %s",
+    "stdio,/bin/echo %P %p %R %r %%",
+    "rms,tcp,cms.winlink.org,8772",
+    "stdio,/bin/echo %U%U-%x",
+]
+
+
+class FakeAX25IO:
+    def __init__(self, address):
+        self.address = address
+
+    def control(self, depth, get, option, data):
+        return self.address
+
+
+@pytest.mark.parametrize(
+    "addr, expected",
+    [
+        ("ax25:0,N0CALL-7,KF7HVM-10", ("N0CALL-7", "KF7HVM-10", ())),
+        (
+            "ax25:0,N0CALL-7,KF7HVM-10,WIDE1-1,WIDE2-2",
+            ("N0CALL-7", "KF7HVM-10", ("WIDE1-1", "WIDE2-2")),
+        ),
+        ("ax25:0,N0CALL", ("N0CALL", "", ())),
+        ("ax25:KF7HVM-10", ("KF7HVM-10", "", ())),
+    ],
+)
+def test_parse_ax25_addr(addr, expected):
+    assert parse_ax25_addr(addr) == expected
+
+
+def test_address_from_io():
+    addr = AX25Address.from_io(FakeAX25IO("ax25:0,n0call-7,KF7HVM-10,WIDE1-1"))
+    assert addr == AX25Address(
+        remote="n0call-7",
+        callsign="N0CALL",
+        ssid=7,
+        digipeaters=("WIDE1-1",),
+        local="KF7HVM-10",
+    )
+    assert AX25Address.from_io(FakeAX25IO("ax25:0,N0CALL,GW")).ssid == 0
+
+
+@pytest.mark.parametrize("address", ADDRESSES)
+@pytest.mark.parametrize("command", COMMANDS)
+def test_template_matches_old_substitution(address, command):
+    io = FakeAX25IO(address)
+    rendered = CommandTemplate(command).render(AX25Address.from_io(io))
+    assert rendered == old_substitution(io, command)
+
+
+def test_static_template():
+    template = CommandTemplate("tcp,cms.winlink.org,8772")
+    assert template.static
+    assert template.render(None) == "tcp,cms.winlink.org,8772"
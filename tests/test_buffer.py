@@ -0,0 +1,69 @@
+from gensio_modems.buffer import ChunkBuffer
+
+
+def test_consume_whole_chunks():
+    buf = ChunkBuffer(b"abc")
+    buf.extend(b"def")
+    buf.consume(3)
+    assert buf.tobytes() == b"def"
+    buf.consume(3)
+    assert not buf
+    assert buf.peek() == b""
+
+
+def test_partial_consume():
+    buf = ChunkBuffer(b"abcdef")
+    buf.extend(b"gh")
+    buf.consume(2)
+    assert len(buf) == 6
+    assert buf.tobytes() == b"cdefgh"
+    # across the chunk boundary
+    buf.consume(5)
+    assert buf.tobytes() == b"h"
+    # more than is left
+    buf.consume(10)
+    assert len(buf) == 0
+    assert buf.total_in == 8
+    assert buf.total_out == 8
+
+
+def test_peek_limit():
+    buf = ChunkBuffer(b"x" * 100)
+    assert bytes(buf.peek(limit=10)) == b"x" * 10
+    # peek doesn't consume
+    assert len(buf) == 100
+    buf.consume(95)
+    assert bytes(buf.peek(limit=10)) == b"x" * 5
+
+
+def test_peek_coalesces_small_chunks():
+    buf = ChunkBuffer()
+    for byte in b"abcdef":
+        buf.extend(bytes([byte]))
+    buf.consume(1)
+    assert bytes(buf.peek(limit=4)) == b"bcde"
+    assert bytes(buf.peek()) == b"bcdef"
+    buf.consume(4)
+    assert bytes(buf.peek()) == b"f"
+    assert buf.tobytes() == b"f"
+
+
+def test_capacity():
+    buf = ChunkBuffer(capacity=5)
+    assert buf.extend(b"abc") == 3
+    assert buf.free == 2
+    assert buf.extend(b"defg") == 2
+    assert buf.extend(b"h") == 0
+    buf.consume(4)
+    assert buf.free == 4
+    assert buf.tobytes() == b"e"
+    assert buf.peak == 5
+
+
+def test_clear():
+    buf = ChunkBuffer(b"abc")
+    buf.consume(1)
+    buf.clear()
+    assert not buf
+    buf.extend(b"xy")
+    assert buf.tobytes() == b"xy"
@@ -0,0 +1,102 @@
+import types
+
+import pytest
+
+from gensio_modems import capture
+from gensio_modems.capture import Journal, read_journal, sessions
+from gensio_modems.gutils import PipeEvent
+
+
+def session(conn_id=1):
+    return types.SimpleNamespace(capture_id=None, conn_id=conn_id)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "capture.bin")
+
+
+def test_round_trip(path):
+    journal = Journal(path, size=64 * 1024)
+    a, b = session(1), session(2)
+    journal.read(a, "io", b"hello")
+    journal.write(a, "io2", b"hello, gateway", 5)
+    journal.read(b, "io2", b"other")
+    journal.close_session(a, "io")
+    journal.close()
+
+    records = list(read_journal(path))
+    assert [(r.session, r.side, r.kind, r.data) for r in records] == [
+        (1, "io", "open", b"SimpleNamespace conn=1"),
+        (1, "io", "read", b"hello"),
+        (1, "io2", "write", b"hello"),
+        (2, "io", "open", b"SimpleNamespace conn=2"),
+        (2, "io2", "read", b"other"),
+        (1, "io", "close", b""),
+    ]
+    summary = sessions(records)
+    assert summary[1]["bytes"] == {"io": 5, "io2": 0}
+    assert summary[2]["label"] == "SimpleNamespace conn=2"
+
+
+def test_truncated(path):
+    journal = Journal(path, size=64 * 1024, max_payload=4)
+    journal.read(session(), "io", b"0123456789")
+    journal.close()
+    record = list(read_journal(path))[-1]
+    assert record.data == b"0123"
+    assert record.truncated
+
+
+def test_ring_keeps_the_newest(path):
+    journal = Journal(path, size=4096)
+    ioev = session()
+    for n in range(500):
+        journal.read(ioev, "io", b"%04d" % n)
+    assert journal.wraps > 0
+    journal.close()
+    records = [r for r in read_journal(path) if r.kind == "read"]
+    numbers = [int(r.data) for r in records]
+    # the oldest were overwritten, what is left is in order up to the last
+    assert numbers == list(range(numbers[0], 500))
+    assert numbers[0] > 0
+
+
+def test_reopened_journal_appends(path):
+    journal = Journal(path, size=64 * 1024)
+    journal.read(session(), "io", b"first")
+    journal.close()
+    journal = Journal(path, size=64 * 1024)
+    journal.read(session(), "io", b"second")
+    journal.close()
+    records = [r for r in read_journal(path) if r.kind == "read"]
+    assert [(r.session, r.data) for r in records] == [(1, b"first"), (2, b"second")]
+
+
+def test_other_size_starts_afresh(path):
+    journal = Journal(path, size=64 * 1024)
+    journal.read(session(), "io", b"old")
+    journal.close()
+    journal = Journal(path, size=32 * 1024)
+    journal.close()
+    assert list(read_journal(path)) == []
+
+
+def test_not_a_journal(path):
+    with open(path, "wb") as f:
+        f.write(b"\0" * capture.DATA_START)
+    with pytest.raises(ValueError):
+        list(read_journal(path))
+
+
+def test_pipe_reads_captured(path, fake_io):
+    journal = Journal(path, size=64 * 1024)
+    pipe = PipeEvent()
+    pipe.capture = journal
+    pipe.io = fake_io("station")
+    pipe.io2 = fake_io("gateway")
+    pipe.read_callback(pipe.io, None, b"from the station", None)
+    pipe.read_callback(pipe.io2, None, b"from the gateway", None)
+    journal.close()
+    reads = [(r.side, r.data) for r in read_journal(path) if r.kind == "read"]
+    assert reads == [("io", b"from the station"), ("io2", b"from the gateway")]
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from gensio_modems.gutils import PipeEvent, TIMERS
+
+
+@pytest.fixture
+def pipe(fake_io):
+    pipe = PipeEvent(paclen=10, coalesce_delay=0.02)
+    pipe.io = fake_io("ax25")
+    pipe.io2 = fake_io("tcp")
+    yield pipe
+    for timer in pipe.flush_timers.values():
+        timer.cancel()
+
+
+def pump(pipe, io):
+    """
+    Run write callbacks on `io` for as long as the pipe keeps them enabled
+    (or until it closes `io`).
+    """
+    io.write_enabled = True
+    while io.write_enabled and not io.closed:
+        pipe.write_callback(io)
+
+
+def feed(pipe, io, data):
+    pipe.read_callback(io, None, data, None)
+    pump(pipe, pipe.peer_of(io))
+
+
+def test_whole_frames_only(pipe):
+    feed(pipe, pipe.io2, b"x" * 25)
+    assert pipe.io.written == b"x" * 20
+    assert len(pipe.bufB) == 5
+    assert "io" in pipe.flush_timers
+
+
+def test_more_data_fills_the_frame(pipe):
+    feed(pipe, pipe.io2, b"a" * 5)
+    assert pipe.io.written == b""
+    timer = pipe.flush_timers["io"]
+    feed(pipe, pipe.io2, b"b" * 5)
+    assert pipe.io.written == b"a" * 5 + b"b" * 5
+    assert not pipe.bufB
+    # nothing held back any more, so no flush pending
+    assert pipe.flush_timers == {}
+    assert timer.cancelled
+
+
+def test_tail_flushed_after_coalesce_delay(pipe):
+    feed(pipe, pipe.io2, b"x" * 13)
+    assert len(pipe.io.written) == 10
+    assert not pipe.io.write_enabled
+    time.sleep(pipe.coalesce_delay)
+    TIMERS.run_due()
+    assert pipe.io.write_enabled
+    pump(pipe, pipe.io)
+    assert pipe.io.written == b"x" * 13
+    assert pipe.flush_timers == {}
+    assert pipe.flush_due == set()
+
+
+def test_paclen_only_applies_to_its_side(pipe):
+    # io2 has no paclen2: data read from the AX.25 side goes straight on
+    feed(pipe, pipe.io, b"y" * 3)
+    assert pipe.io2.written == b"y" * 3
+    assert pipe.flush_timers == {}
+
+
+def test_paclen2(fake_io):
+    pipe = PipeEvent(paclen2=4)
+    pipe.io = fake_io("ax25")
+    pipe.io2 = fake_io("tcp")
+    feed(pipe, pipe.io, b"z" * 6)
+    assert pipe.io2.written == b"z" * 4
+    assert "io2" in pipe.flush_timers
+    pipe.cancel_flush("io2")
+
+
+def test_close_writes_the_tail(pipe):
+    feed(pipe, pipe.io2, b"x" * 7)
+    assert pipe.io.written == b""
+    pipe.close()
+    pump(pipe, pipe.io)
+    assert pipe.io.written == b"x" * 7
+    assert pipe.io.closed
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from gensio_modems import expect, rmsgw
+from gensio_modems.expect import Expect, Step
+from gensio_modems.gutils import PipeEvent, TIMERS
+from gensio_modems.rmsgw import RMSGatewayLogin
+
+
+def login():
+    return Expect([Step(rb"callsign\s*:"), Step(rb"password\s*:")])
+
+
+def test_prompt_split_across_reads():
+    matcher = login()
+    assert matcher.feed(b"Welcome!\r\nCallsi") == []
+    (hit,) = matcher.feed(b"gn :")
+    assert hit.step is matcher.steps[0]
+    assert hit.before == b"Welcome!\r\n"
+    assert matcher.current is matcher.steps[1]
+
+
+def test_prompts_in_one_read():
+    matcher = login()
+    hits = matcher.feed(b"Callsign :\r\nPassword :\r\n[WL2K]")
+    assert [hit.step for hit in hits] == matcher.steps
+    assert hits[1].before == b"\r\n"
+    assert matcher.done
+    # once done, everything fed is passed on
+    assert matcher.drain() == b"\r\n[WL2K]"
+
+
+def test_drain_keeps_the_window():
+    matcher = Expect([Step(rb"password\s*:")], window=12)
+    banner = b"x" * 30
+    assert matcher.feed(banner + b"Pass") == []
+    # only what can't be the start of a prompt any more
+    assert matcher.drain() == banner[:22]
+    assert matcher.drain() == b""
+    (hit,) = matcher.feed(b"word :")
+    assert hit.before == banner[22:]
+    assert matcher.drain() == b""
+
+
+def test_prompt_longer_than_the_window_missed():
+    matcher = Expect([Step(rb"callsign\s*:")], window=4)
+    matcher.feed(b"Callsign")
+    matcher.drain()
+    assert matcher.feed(b" :") == []
+
+
+class Login(RMSGatewayLogin, PipeEvent):
+    pass
+
+
+@pytest.fixture
+def pipe(monkeypatch, fake_io):
+    monkeypatch.setattr(rmsgw, "LOGIN_STEP_TIMEOUT", 0.1)
+    pipe = Login()
+    pipe.io = fake_io("station")
+    pipe.io2 = fake_io("cms")
+    pipe.open_done(pipe.io2, None)
+    yield pipe
+    pipe.reset_login()
+
+
+def run_timers(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.005)
+        TIMERS.run_due()
+
+
+def test_login_expired(pipe):
+    timeouts = expect.login_stats("rms").timeouts
+    pipe.read_callback(pipe.io2, None, b"Welcome\r\n", None)
+    run_timers(0.15)
+    assert expect.login_stats("rms").timeouts == timeouts + 1
+    assert pipe.io2.closed
+    assert pipe._login is None
+    assert pipe._login_timer is None
+
+
+def test_login_deadline_is_per_prompt(pipe):
+    timeouts = expect.login_stats("rms").timeouts
+    run_timers(0.06)
+    pipe.read_callback(pipe.io2, None, b"Callsign :\r\n", None)
+    assert pipe.bufA.tobytes() == b"N0CALL\r\n"
+    run_timers(0.06)
+    assert not pipe.io2.closed
+    pipe.read_callback(pipe.io2, None, b"Password :\r\n", None)
+    assert pipe.bufA.tobytes() == b"N0CALL\r\nCMSTelnet\r\n"
+    assert pipe._login_timer is None
+    run_timers(0.15)
+    assert not pipe.io2.closed
+    assert expect.login_stats("rms").timeouts == timeouts
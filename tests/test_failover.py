@@ -0,0 +1,164 @@
+import time
+
+import pytest
+
+from gensio_modems import failover
+from gensio_modems.failover import MAX_BACKOFF, MIN_BACKOFF, Endpoint, GatewaySet
+from gensio_modems.gutils import PipeEvent, TIMERS
+
+PROMPT = b"Welcome\r\nCallsign :\r\n"
+
+
+def run_timers(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.005)
+        TIMERS.run_due()
+
+
+@pytest.fixture
+def opened(fake_gensio):
+    return fake_gensio(failover)
+
+
+@pytest.fixture
+def gateways():
+    return GatewaySet(
+        ["tcp,a,8772", "tcp,b,8772", "tcp,c,8772"],
+        ready_prompt=b"callsign",
+        stagger=0.05,
+        connect_timeout=0.5,
+    )
+
+
+@pytest.fixture
+def pipe(fake_io):
+    pipe = PipeEvent()
+    pipe.io = fake_io("station")
+    return pipe
+
+
+@pytest.fixture
+def race(gateways, pipe, opened):
+    race = gateways.connect(pipe)
+    yield race
+    race.cancel()
+
+
+def names(opened):
+    return [io.name for io in opened]
+
+
+def test_stagger(race, opened):
+    assert names(opened) == ["tcp,a,8772"]
+    run_timers(0.07)
+    assert names(opened) == ["tcp,a,8772", "tcp,b,8772"]
+    run_timers(0.05)
+    assert len(opened) == 3
+
+
+def test_failure_starts_the_next_now(race, gateways, opened):
+    a = opened[0]
+    a.handler.open_done(a, "Connection refused")
+    assert names(opened) == ["tcp,a,8772", "tcp,b,8772"]
+    assert not gateways.endpoints[0].up(time.monotonic())
+    assert gateways.endpoints[0].failed == 1
+
+
+def test_winner_takes_the_pipe(race, gateways, pipe, opened):
+    run_timers(0.07)
+    a, b = opened
+    b.handler.open_done(b, None)
+    b.handler.read_callback(b, None, PROMPT, None)
+    assert race.done
+    assert pipe.io2 is b
+    assert b.handler is pipe
+    # the prompt the gateway already sent is replayed to the station
+    assert pipe.bufB.tobytes() == PROMPT
+    # the loser is closed and no more endpoints are started
+    assert a.closed
+    run_timers(0.07)
+    assert len(opened) == 2
+    assert [(e.attempts, e.wins) for e in gateways.endpoints] == [
+        (1, 0),
+        (1, 1),
+        (0, 0),
+    ]
+
+
+def test_cancel_closes_every_attempt(race, opened):
+    run_timers(0.07)
+    race.cancel()
+    assert all(io.closed for io in opened)
+    run_timers(0.07)
+    assert len(opened) == 2
+
+
+def test_session_gone_before_ready(race, pipe, opened):
+    pipe.io = None
+    a = opened[0]
+    a.handler.open_done(a, None)
+    a.handler.read_callback(a, None, PROMPT, None)
+    assert race.done
+    assert pipe.io2 is None
+    assert a.closed
+
+
+def test_expired_race_closes_the_session(race, gateways, pipe, opened):
+    run_timers(gateways.connect_timeout + 0.05)
+    assert race.done
+    assert pipe.in_close
+    assert pipe.io.closed
+    assert all(io.closed for io in opened)
+    assert all(e.failures == 1 for e in gateways.endpoints)
+
+
+def test_backoff_doubles_and_resets():
+    endpoint = Endpoint("tcp,a,8772")
+    now = time.monotonic()
+    backoffs = []
+    for _ in range(8):
+        endpoint.failed_attempt(now)
+        backoffs.append(endpoint.down_until - now)
+    assert backoffs[:3] == [MIN_BACKOFF, 2 * MIN_BACKOFF, 4 * MIN_BACKOFF]
+    assert backoffs[-1] == MAX_BACKOFF
+    assert not endpoint.up(now + MAX_BACKOFF - 1)
+    assert endpoint.up(now + MAX_BACKOFF)
+    endpoint.succeeded(0.1)
+    assert endpoint.up(now)
+    assert endpoint.failures == 0
+
+
+def test_ordered_skips_backed_off(gateways):
+    a, b, c = gateways.endpoints
+    now = time.monotonic()
+    a.failed_attempt(now)
+    assert gateways.ordered() == [b, c]
+    # with every one down, all are tried, soonest to recover first
+    b.failed_attempt(now)
+    b.failed_attempt(now)
+    c.failed_attempt(now)
+    assert gateways.ordered() == [a, c, b]
+
+
+def test_closing_the_station_cancels_the_race(gateways, opened, fake_io):
+    from gensio_modems import ax25
+
+    listener = ax25.AX25ListenerEvent("tcp,a,8772;tcp,b,8772")
+    listener.gateways = gateways
+    listener.gateway_templates = {
+        endpoint.gensio_str: ax25.CommandTemplate(endpoint.gensio_str)
+        for endpoint in gateways.endpoints
+    }
+    pipe = PipeEvent()
+    pipe.io = fake_io("station")
+    pipe.ax25_addr = ax25.AX25Address("N0CALL-1", "N0CALL", 1, (), "GW-10")
+    listener.spawn_gateway(pipe)
+    race = pipe.race
+    assert names(opened) == ["tcp,a,8772"]
+    pipe.close(pipe.io)
+    assert race.done
+    assert pipe.race is None
+    assert opened[0].closed
+    run_timers(0.07)
+    assert len(opened) == 1
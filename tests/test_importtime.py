@@ -0,0 +1,27 @@
+import os
+import statistics
+
+import pytest
+
+from benchmarks import importtime
+
+# loaded / slow machines: IMPORTTIME_SCALE=2 python -m pytest ...
+SCALE = float(os.environ.get("IMPORTTIME_SCALE", "1"))
+
+
+@pytest.mark.parametrize("module", sorted(importtime.BUDGETS_MS))
+def test_import_budget(module):
+    ms = statistics.median(importtime.import_ms(module) for _ in range(3))
+    assert ms <= importtime.BUDGETS_MS[module] * SCALE
+
+
+@pytest.mark.parametrize("module", sorted(importtime.BUDGETS_MS))
+def test_import_side_effects(module):
+    assert importtime.side_effects(module) == []
+
+
+@pytest.mark.parametrize("module", importtime.LEAN)
+def test_lazy_modules_not_imported(module):
+    imported = importtime.import_times(module)
+    assert module in imported
+    assert [name for name in importtime.LAZY if name in imported] == []
@@ -0,0 +1,51 @@
+from gensio_modems import gutils, metrics
+
+
+def request(fake_io, *chunks):
+    io = fake_io()
+    req = metrics.MetricsRequest()
+    req.io = io
+    for chunk in chunks:
+        if io.read_enabled is False:
+            break  # a gensio delivers no more once reads are disabled
+        req.read_callback(io, None, chunk, None)
+    return req, io
+
+
+def test_request_answered(fake_io):
+    req, io = request(fake_io, b"GET /metrics HTTP/1.0\r\n", b"Host: x\r\n\r\n")
+    response = req.bufB.tobytes()
+    assert response.startswith(b"HTTP/1.0 200 OK\r\n")
+    assert response.endswith(metrics.render().encode("utf-8"))
+    assert req.in_close
+    assert io.read_enabled is False
+
+
+def test_oversized_request_rejected(fake_io):
+    chunk = b"X-Junk: " + b"a" * 1000 + b"\r\n"
+    chunks = [chunk] * (metrics.MAX_REQUEST // len(chunk) + 2)
+    req, io = request(fake_io, *chunks)
+    assert req.bufB.tobytes().startswith(b"HTTP/1.0 400 Bad Request\r\n")
+    assert not req.bufA
+    assert req.in_close
+    assert io.read_enabled is False
+
+
+def test_listener_sessions_aggregated(fake_io):
+    listener = gutils.ListenerEvent()
+    listener.name = "test"
+    metrics.watch_listener(listener)
+    try:
+        for name, backlog in (("a", 5), ("b", 7)):
+            pipe = gutils.PipeEvent()
+            pipe.io = fake_io(name)
+            pipe.io2 = fake_io(name + "2")
+            listener.track(pipe, callsign=name.upper())
+            pipe.bufA.extend(b"x" * backlog)
+        text = metrics.render()
+    finally:
+        metrics._listeners.discard(listener)
+    assert "conn_id" not in text
+    assert "callsign" not in text
+    assert 'gensio_modems_buffer_bytes{listener="test",side="io2"} 12' in text
+    assert 'gensio_modems_sessions_active{listener="test"} 2' in text
@@ -0,0 +1,65 @@
+import pytest
+
+from gensio_modems.gutils import PipeEvent
+
+
+@pytest.fixture
+def pipe(fake_io):
+    pipe = PipeEvent(high_water=100, low_water=40)
+    pipe.io = fake_io("io")
+    pipe.io2 = fake_io("io2", accept=30)
+    return pipe
+
+
+def test_reads_paused_at_high_water(pipe):
+    pipe.read_callback(pipe.io, None, b"x" * 60, None)
+    assert pipe.io.read_enabled is None  # not touched below high water
+    assert pipe.io2.write_enabled
+    pipe.read_callback(pipe.io, None, b"x" * 60, None)
+    assert pipe.io.read_enabled is False
+    assert pipe.read_paused == {"io"}
+
+
+def test_reads_resumed_at_low_water(pipe):
+    pipe.read_callback(pipe.io, None, b"x" * 120, None)
+    pipe.write_callback(pipe.io2)  # 90 left
+    pipe.write_callback(pipe.io2)  # 60
+    assert pipe.io.read_enabled is False
+    pipe.write_callback(pipe.io2)  # 30
+    assert pipe.io.read_enabled is True
+    assert pipe.read_paused == set()
+    assert len(pipe.bufA) == 30
+
+
+def test_each_side_has_its_own_marks(fake_io):
+    pipe = PipeEvent(high_water=100, low_water=40, high_water2=10, low_water2=0)
+    pipe.io = fake_io("io", accept=4)
+    pipe.io2 = fake_io("io2")
+    pipe.read_callback(pipe.io2, None, b"y" * 10, None)
+    assert pipe.io2.read_enabled is False
+    assert pipe.read_paused == {"io2"}
+    pipe.write_callback(pipe.io)
+    pipe.write_callback(pipe.io)
+    assert pipe.io2.read_enabled is False
+    pipe.write_callback(pipe.io)
+    assert pipe.io2.read_enabled is True
+
+
+def test_unlimited(fake_io):
+    pipe = PipeEvent(high_water=None)
+    pipe.io = fake_io("io")
+    pipe.io2 = fake_io("io2", accept=0)
+    pipe.read_callback(pipe.io, None, b"x" * 1000000, None)
+    assert pipe.io.read_enabled is None
+    assert not pipe.read_paused
+
+
+def test_reads_allowed_keeps_reads_paused(pipe):
+    pipe.reads_allowed = lambda io: False
+    pipe.read_callback(pipe.io, None, b"x" * 120, None)
+    for _ in range(4):
+        pipe.write_callback(pipe.io2)
+    assert not pipe.bufA
+    # the backlog drained, but the subclass holds reads back
+    assert pipe.io.read_enabled is False
+    assert pipe.read_paused == set()
@@ -0,0 +1,137 @@
+import time
+
+import pytest
+
+from gensio_modems import pool as pool_mod
+from gensio_modems.gutils import PipeEvent, TIMERS
+
+PROMPT = b"Callsign :\r\n"
+
+
+@pytest.fixture
+def opened(fake_gensio):
+    return fake_gensio(pool_mod)
+
+
+@pytest.fixture
+def pool(opened):
+    pool = pool_mod.UpstreamPool(
+        "tcp,cms,8772", size=2, idle_ttl=60, ready_prompt=b"callsign"
+    )
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def connect(io, prompt=PROMPT):
+    """Open `io` and have the far end send `prompt`."""
+    io.handler.open_done(io, None)
+    if prompt:
+        io.handler.read_callback(io, None, prompt, None)
+
+
+def members(pool):
+    return [member for _, member in pool.members]
+
+
+def test_checkout_empty_pool(pool, opened):
+    assert len(opened) == 2
+    # open, but the CMS hasn't prompted yet
+    connect(opened[0], prompt=None)
+    assert pool.checkout() is None
+    assert pool.misses == 1
+    assert pool.checkouts == 0
+
+
+def test_checkout_warm_pool(pool, opened):
+    connect(opened[0])
+    assert pool.ready_count == 1
+    member = pool.checkout()
+    assert member.io is opened[0]
+    assert pool.checkouts == 1
+    assert len(pool) == 1
+    # the pool refills itself
+    TIMERS.run_due()
+    assert len(pool) == 2
+    assert len(opened) == 3
+
+
+def test_ttl_expiry_replaces(pool, opened):
+    connect(opened[0])
+    member = members(pool)[0]
+    member.ready_at = time.monotonic() - pool.idle_ttl - 1
+    pool.check()
+    assert pool.expired == 1
+    assert opened[0].closed
+    assert member not in members(pool)
+    assert len(pool) == 2
+    assert len(opened) == 3
+
+
+def test_failed_health_check(pool, opened):
+    connect(opened[0])
+    # the far end hung up while idle
+    opened[0].handler.read_callback(
+        opened[0], "Remote end closed connection", None, None
+    )
+    assert pool.ready_count == 0
+    pool.check()
+    assert len(pool) == 2
+    assert opened[2] in [m.io for m in members(pool)]
+    assert pool.checkout() is None
+
+
+def test_stuck_connection_discarded(pool, opened):
+    connect(opened[0], prompt=None)
+    member = members(pool)[0]
+    member.created_at = time.monotonic() - pool.connect_timeout - 1
+    pool.check()
+    assert opened[0].closed
+    assert member not in members(pool)
+
+
+def test_open_failure_backs_off(pool, opened):
+    opened[0].handler.open_done(opened[0], "Connection refused")
+    assert pool.failed == 1
+    assert len(pool) == 1
+    TIMERS.run_due()
+    assert len(opened) == 2  # not retried before RETRY_DELAY
+
+
+def test_attach_replays_buffered_bytes(pool, opened, fake_io):
+    connect(opened[0], prompt=b"Call")
+    opened[0].handler.read_callback(opened[0], None, b"sign :\r\n", None)
+    pipe = PipeEvent()
+    pipe.io = fake_io("rf")
+    assert pool.attach(pipe)
+    assert pipe.io2 is opened[0]
+    assert opened[0].handler is pipe
+    assert opened[0].read_enabled
+    # what the CMS sent before the session started reaches the station
+    assert pipe.bufB.tobytes() == PROMPT
+
+
+def test_attach_without_ready_connection(pool, fake_io):
+    pipe = PipeEvent()
+    pipe.io = fake_io("rf")
+    assert not pool.attach(pipe)
+    assert pipe.io2 is None
+
+
+def test_fake_cms(gensio_port, fake_io):
+    from benchmarks.fakes import FakeCMS
+    from benchmarks.harness import service_until, start_listener
+
+    gateway = "tcp,localhost,{}".format(gensio_port)
+    cms = start_listener(FakeCMS(prompt_delay=0.1), gateway)
+    pool = pool_mod.UpstreamPool(gateway, size=2, ready_prompt=b"callsign").start()
+    try:
+        service_until(lambda: pool.ready_count == 2, timeout=10)
+        pipe = PipeEvent()
+        pipe.io = fake_io("rf")
+        assert pool.attach(pipe)
+        assert pipe.bufB.tobytes() == PROMPT
+        pipe.close(pipe.io2)
+    finally:
+        pool.shutdown()
+        cms.shutdown()
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from gensio_modems import ax25, profiles
+from gensio_modems.profiles import (
+    CLIMB_AFTER,
+    DEFAULT_LEVEL,
+    LADDER,
+    ProfileStore,
+    ax25_peer,
+    tune_endpoint,
+)
+
+
+def test_new_peer_gets_the_default():
+    store = ProfileStore()
+    assert store.profile_for("KF7HVM-10") == LADDER[DEFAULT_LEVEL]
+    assert store.peers == {}
+
+
+def test_failure_steps_down():
+    store = ProfileStore()
+    assert store.observe("KF7HVM", failed=True) == LADDER[DEFAULT_LEVEL - 1]
+    # the SSID doesn't matter
+    assert store.observe("kf7hvm-3", failed=True) == LADDER[DEFAULT_LEVEL - 2]
+    stats = store.peers["KF7HVM"]
+    assert stats.failures == 2
+    assert stats.sessions == 2
+
+
+def test_bottom_of_the_ladder():
+    store = ProfileStore()
+    for _ in range(len(LADDER) + 2):
+        profile = store.observe("N0CALL", failed=True)
+    assert profile == LADDER[0]
+
+
+def test_clean_sessions_step_up():
+    store = ProfileStore()
+    for _ in range(CLIMB_AFTER - 1):
+        assert store.observe("N0CALL") == LADDER[DEFAULT_LEVEL]
+    assert store.observe("N0CALL") == LADDER[DEFAULT_LEVEL + 1]
+    for _ in range(CLIMB_AFTER * len(LADDER)):
+        profile = store.observe("N0CALL")
+    assert profile == LADDER[-1]
+    assert profile.extended
+
+
+def test_slow_connect_steps_down():
+    store = ProfileStore()
+    store.observe("N0CALL", rtt=1.0)
+    # three SABMs went out before the link came up
+    profile = store.observe("N0CALL", rtt=3.5)
+    assert profile == LADDER[DEFAULT_LEVEL - 1]
+    stats = store.peers["N0CALL"]
+    assert stats.rtt_min == 1.0
+    assert stats.retries == pytest.approx(profiles.EWMA * 2.5)
+
+
+def test_json_round_trip(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    store = ProfileStore(path)
+    store.observe("KF7HVM", failed=True, rtt=2.0)
+    store.observe("N0CALL", size=5000, duration=10.0)
+    with open(path) as f:
+        assert json.load(f)["version"] == 1
+
+    loaded = ProfileStore(path)
+    assert set(loaded.peers) == {"KF7HVM", "N0CALL"}
+    for call, stats in store.peers.items():
+        assert loaded.peers[call].to_dict() == stats.to_dict()
+    assert loaded.profile_for("KF7HVM") == LADDER[DEFAULT_LEVEL - 1]
+    assert loaded.peers["N0CALL"].throughput == 500.0
+
+
+def test_out_of_range_level_is_clamped(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps({"version": 1, "peers": {"N0CALL": {"level": 99}}}))
+    assert ProfileStore(str(path)).profile_for("N0CALL") == LADDER[-1]
+
+
+def test_tune_endpoint():
+    endpoint = 'ax25(addr="0,KF7HVM-10,GW",retries=9,crc=on),kiss,tcp,tnc,8001'
+    assert ax25_peer(endpoint) == "KF7HVM-10"
+    tuned = tune_endpoint(endpoint, LADDER[0])
+    assert tuned == (
+        'ax25(addr="0,KF7HVM-10,GW",crc=on,readwindow=1,writewindow=1,'
+        "max_write_size=64,extended=0,retries=10),kiss,tcp,tnc,8001"
+    )
+    assert tune_endpoint("tcp,cms,8772", LADDER[0]) == "tcp,cms,8772"
+
+
+@pytest.mark.parametrize("configured, expected", [(1024, 128), (100, 100)])
+def test_listener_paclen(monkeypatch, fake_io, configured, expected):
+    monkeypatch.setattr(ax25, "spawn_for", lambda ioev, template: fake_io("gw"))
+    store = ProfileStore()
+    store.observe("KF7HVM", failed=True)  # down to paclen 128
+    listener = ax25.AX25ListenerEvent(
+        "tcp,gw,8772", pipe_kwargs=dict(paclen=configured), profiles=store
+    )
+    io = fake_io("KF7HVM-10")
+    io.control = lambda depth, get, option, data: "ax25:0,KF7HVM-10,GW"
+    listener.new_connection(None, io)
+    assert io.handler.paclen == expected
@@ -0,0 +1,202 @@
+import time
+
+import pytest
+
+from gensio_modems import proxy
+from gensio_modems.gutils import TIMERS
+from gensio_modems.proxy import LinkCache, ProxyListener
+
+
+def run_timers(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.005)
+        TIMERS.run_due()
+
+
+@pytest.fixture
+def links():
+    links = LinkCache(idle=0.05)
+    yield links
+    links.shutdown()
+
+
+def test_park_and_take(links, fake_io):
+    io = fake_io("link")
+    links.park("GW-10", io)
+    assert len(links) == 1
+    assert io.read_enabled and io.write_enabled is False
+    # what the gateway sends meanwhile is kept for the next session
+    io.handler.read_callback(io, None, b"[WL2K]\r", None)
+    assert links.take("GW-11") is None
+    assert links.take("GW-10") == (io, b"[WL2K]\r")
+    assert len(links) == 0
+    assert (links.parked, links.reused) == (1, 1)
+    # the idle timer went with it
+    run_timers(0.07)
+    assert not io.closed
+
+
+def test_most_recent_first(links, fake_io):
+    old, new = fake_io("old"), fake_io("new")
+    links.park("GW-10", old)
+    links.park("GW-10", new)
+    assert links.take("GW-10")[0] is new
+    assert links.take("GW-10")[0] is old
+    assert links.take("GW-10") is None
+
+
+def test_idle_links_expire(links, fake_io):
+    io = fake_io("link")
+    links.park("GW-10", io)
+    run_timers(0.07)
+    assert io.closed
+    assert len(links) == 0
+    assert links.take("GW-10") is None
+
+
+def test_dropped_link_forgotten(links, fake_io):
+    io = fake_io("link")
+    links.park("GW-10", io)
+    io.handler.read_callback(io, "Connection reset", None, None)
+    assert io.closed
+    assert links.take("GW-10") is None
+
+
+def test_shutdown_closes_parked_links(fake_io):
+    links = LinkCache(idle=10)
+    ios = [fake_io("a"), fake_io("b")]
+    links.park("GW-10", ios[0])
+    links.park("GW-11", ios[1])
+    links.shutdown()
+    assert all(io.closed for io in ios)
+    assert len(links) == 0
+
+
+def session(listener, fake_io, creds=b"GW-10\r"):
+    """Start a telnet session on `listener` and answer the password prompt."""
+    telnet = fake_io("telnet")
+    listener.new_connection(None, telnet)
+    pipe = telnet.handler
+    pipe.read_callback(telnet, None, creds, None)
+    return pipe
+
+
+def test_session_reuses_the_parked_link(fake_gensio, fake_io):
+    opened = fake_gensio(proxy)
+    listener = ProxyListener("ax25(laddr=N0CALL,addr=0,%0)", links=LinkCache(idle=10))
+    first = session(listener, fake_io)
+    link = first.io2
+    first.open_done(link, None)
+    first.close(first.io)
+    assert len(listener.links) == 1
+    assert first.io2 is None
+    assert not link.closed
+
+    second = session(listener, fake_io)
+    assert second.io2 is link
+    assert link.handler is second
+    assert len(opened) == 1
+    # another gateway gets a link of its own
+    third = session(listener, fake_io, b"GW-11\r")
+    assert len(opened) == 2
+    assert third.io2 is opened[1]
+    listener.links.shutdown()
+    for pipe in (second, third):
+        pipe.close(pipe.io)
+
+
+def test_busy_link_not_parked(fake_gensio, fake_io):
+    fake_gensio(proxy)
+    listener = ProxyListener("%0", links=LinkCache(idle=10))
+    pipe = session(listener, fake_io)
+    pipe.open_done(pipe.io2, None)
+    pipe.bufA.extend(b"still to send")
+    pipe.close(pipe.io)
+    assert len(listener.links) == 0
+
+
+def test_password_prompt_spawns_the_endpoint(fake_gensio, fake_io):
+    opened = fake_gensio(proxy)
+    listener = ProxyListener("ax25(laddr=N0CALL,addr=0,%0)")
+    telnet = fake_io("telnet")
+    listener.new_connection(None, telnet)
+    pipe = telnet.handler
+    assert pipe.bufB.tobytes() == b"Password :\r"
+    assert telnet.read_enabled and telnet.write_enabled
+    # nothing is forwarded or connected until the credential is in
+    pipe.read_callback(telnet, None, b"GW-", None)
+    assert opened == []
+    assert not pipe.bufA
+    pipe.read_callback(telnet, None, b"10\r\n;FW: N0CALL\r", None)
+    assert [io.name for io in opened] == ["ax25(laddr=N0CALL,addr=0,GW-10)"]
+    assert pipe.creds == ["GW-10"]
+    # what came after the credential goes to the link
+    assert pipe.bufA.tobytes() == b";FW: N0CALL\r"
+    assert pipe.cred_timer is None
+    pipe.close(telnet)
+
+
+def test_callsign_and_password(fake_gensio, fake_io):
+    opened = fake_gensio(proxy)
+    listener = ProxyListener("%0,%1", require_creds=2)
+    telnet = fake_io("telnet")
+    listener.new_connection(None, telnet)
+    pipe = telnet.handler
+    assert pipe.bufB.tobytes() == b"Callsign :\r"
+    for byte in b"N0CALL\r\nGW-10\r\n":
+        pipe.read_callback(telnet, None, bytes([byte]), None)
+    assert pipe.bufB.tobytes() == b"Callsign :\rPassword :\r"
+    assert pipe.creds == ["N0CALL", "GW-10"]
+    assert [io.name for io in opened] == ["N0CALL,GW-10"]
+    pipe.close(telnet)
+
+
+def test_no_creds_spawns_at_once(fake_gensio, fake_io):
+    opened = fake_gensio(proxy)
+    listener = ProxyListener("ax25(laddr=N0CALL,addr=0,GW-10)", require_creds=0)
+    telnet = fake_io("telnet")
+    listener.new_connection(None, telnet)
+    pipe = telnet.handler
+    assert not pipe.bufB
+    assert pipe.io2 is opened[0]
+    pipe.close(telnet)
+
+
+def test_creds_expired(monkeypatch, fake_gensio, fake_io):
+    opened = fake_gensio(proxy)
+    monkeypatch.setattr(proxy, "CRED_TIMEOUT", 0.05)
+    listener = ProxyListener("%0")
+    telnet = fake_io("telnet")
+    listener.new_connection(None, telnet)
+    telnet.handler.write_callback(telnet)  # the prompt
+    run_timers(0.07)
+    assert telnet.closed
+    assert opened == []
+
+
+def test_pipe_both_ways(fake_gensio, fake_io):
+    fake_gensio(proxy)
+    listener = ProxyListener("%0")
+    pipe = session(listener, fake_io)
+    telnet, link = pipe.io, pipe.io2
+    pipe.open_done(link, None)
+    pipe.write_callback(telnet)  # the prompt
+    pipe.read_callback(telnet, None, b"FF\r", None)
+    pipe.write_callback(link)
+    assert link.written == b"FF\r"
+    pipe.read_callback(link, None, b"FQ\r", None)
+    pipe.write_callback(telnet)
+    assert telnet.written == b"Password :\rFQ\r"
+    pipe.close(telnet)
+
+
+def test_failed_link_hangs_up(fake_gensio, fake_io):
+    fake_gensio(proxy)
+    listener = ProxyListener("%0")
+    pipe = session(listener, fake_io)
+    telnet = pipe.io
+    pipe.open_done(pipe.io2, "No route to host")
+    assert pipe.io2 is None
+    assert pipe.in_close
+    assert telnet.closed
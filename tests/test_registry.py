@@ -0,0 +1,51 @@
+from gensio_modems.registry import ConnectionRegistry
+
+
+def test_add_remove():
+    registry = ConnectionRegistry()
+    a = registry.add("a")
+    b = registry.add("b")
+    assert a != b
+    assert len(registry) == 2
+    assert a in registry
+    assert registry.get(a) == "a"
+    assert list(registry) == [(a, "a"), (b, "b")]
+    assert registry.remove(a) == "a"
+    assert a not in registry
+    assert registry.get(a) is None
+    # removing twice, or an id never seen, is harmless
+    assert registry.remove(a) is None
+    assert registry.remove(12345) is None
+    assert len(registry) == 1
+
+
+def test_ids_not_reused():
+    registry = ConnectionRegistry()
+    a = registry.add("a")
+    registry.remove(a)
+    assert registry.add("b") != a
+
+
+def test_iterating_while_removing():
+    registry = ConnectionRegistry()
+    for name in "abc":
+        registry.add(name)
+    for conn_id, _ in registry:
+        registry.remove(conn_id)
+    assert len(registry) == 0
+
+
+def test_by_callsign():
+    registry = ConnectionRegistry()
+    first = registry.add("first", callsign="n0call")
+    second = registry.add("second", callsign="N0CALL")
+    registry.add("other", callsign="K1ABC")
+    registry.add("anonymous")
+    assert registry.callsign_of(first) == "N0CALL"
+    assert registry.by_callsign("N0call") == ["first", "second"]
+    registry.remove(first)
+    assert registry.by_callsign("N0CALL") == ["second"]
+    registry.remove(second)
+    assert registry.by_callsign("N0CALL") == []
+    assert registry.callsign_of(second) is None
+    assert registry.by_callsign("K1ABC") == ["other"]
@@ -0,0 +1,113 @@
+import types
+
+import pytest
+
+from benchmarks.replay import (
+    CMS,
+    STATION,
+    Event,
+    ReplayCMS,
+    Station,
+    Transcript,
+    script_for,
+)
+from gensio_modems.capture import Journal
+
+
+def test_script_for():
+    transcript = Transcript(
+        [
+            Event(0.0, CMS, b"banner"),
+            Event(0.5, STATION, b"hello"),
+            Event(0.6, STATION, b"again"),
+            Event(1.0, CMS, b"ok"),
+        ]
+    )
+    steps, expected = script_for(transcript, STATION)
+    # each step waits for what the other side sent before it
+    assert [(s.expect, s.gap, s.data) for s in steps] == [
+        (6, 0.5, b"hello"),
+        (6, pytest.approx(0.1), b"again"),
+    ]
+    assert expected == b"bannerok"
+    steps, expected = script_for(transcript, CMS)
+    assert [(s.expect, s.data) for s in steps] == [(0, b"banner"), (10, b"ok")]
+    assert expected == b"helloagain"
+
+
+def test_transcripts_from_journal(tmp_path):
+    path = str(tmp_path / "capture.bin")
+    journal = Journal(path, size=64 * 1024)
+    both = types.SimpleNamespace(capture_id=None, conn_id=1)
+    one_way = types.SimpleNamespace(capture_id=None, conn_id=2)
+    journal.read(both, "io2", b"[WL2K]")
+    journal.read(one_way, "io", b"only the station")
+    journal.write(both, "io", b"[WL2K]")
+    journal.read(both, "io", b"[RMS Express]")
+    journal.close()
+    (transcript,) = Transcript.from_journal(path)
+    assert [(e.side, e.data) for e in transcript.events] == [
+        (CMS, b"[WL2K]"),
+        (STATION, b"[RMS Express]"),
+    ]
+    assert transcript.events[0].t == 0.0
+    assert Transcript.from_journal(path, sessions={2}) == []
+
+
+def shuttle(a, b, tamper=None):
+    """Pass what each of `a` and `b` writes to the other until both are quiet."""
+    moved = True
+    while moved:
+        moved = False
+        for src, dst in ((a, b), (b, a)):
+            if src.bufB and dst.io is not None and not dst.in_close:
+                data = src.bufB.tobytes()
+                src.bufB.clear()
+                if tamper is not None and src is tamper:
+                    data = data.replace(b"FS Y", b"FS N")
+                dst.read_callback(dst.io, None, data, None)
+                moved = True
+
+
+def logged_in(fake_io, transcript):
+    """A ReplayCMS session that RP0000 has logged in to, as a gateway would."""
+    cms = ReplayCMS(speed=0)
+    cms.expect("RP0000", transcript)
+    io = fake_io("cms")
+    cms.new_connection(None, io)
+    session = io.handler
+    session.read_callback(io, None, b"RP0000\r\n", None)
+    # the prompts are for the gateway's login, not the station
+    assert session.bufB.tobytes() == b"Callsign :\r\nPassword :\r\n"
+    session.bufB.clear()
+    session.read_callback(io, None, b"CMSTelnet\r\n", None)
+    assert session.started_at is not None
+    return session
+
+
+def connected_station(fake_io, transcript):
+    replay = types.SimpleNamespace(speed=0, station_closed=lambda station: None)
+    station = Station(replay, "RP0000", transcript)
+    station.io = fake_io("station")
+    station.open_done(station.io, None)
+    return station
+
+
+def test_station_and_cms_play_a_session(fake_io):
+    transcript = Transcript.synthetic_b2f(messages=2, size=100)
+    session = logged_in(fake_io, transcript)
+    station = connected_station(fake_io, transcript)
+    shuttle(station, session)
+    assert station.error is None and session.error is None
+    assert station.done and session.done
+    assert station.in_close  # hangs up once done
+    assert len(station.responses) == 4
+
+
+def test_mismatch_detected(fake_io):
+    transcript = Transcript.synthetic_b2f(messages=1, size=100)
+    session = logged_in(fake_io, transcript)
+    station = connected_station(fake_io, transcript)
+    shuttle(station, session, tamper=session)
+    assert station.error.startswith("mismatch")
+    assert not station.done
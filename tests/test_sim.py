@@ -0,0 +1,186 @@
+import socket
+import time
+
+import pytest
+
+from gensio_modems import sim
+from gensio_modems.gutils import TIMERS
+
+
+def run_timers(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.005)
+        TIMERS.run_due()
+
+
+def flush(ioev):
+    """Let `ioev` write what it has buffered to its (fake) gensio."""
+    while ioev.bufB and ioev.io is not None:
+        ioev.write_callback(ioev.io)
+
+
+def connect(listener, fake_io, name):
+    """Accept a FakeIO on `listener`, returning the IOEvent it gets."""
+    io = fake_io(name)
+    assert listener.new_connection(None, io) is io
+    return io.handler
+
+
+def test_channel_airtime():
+    channel = sim.Channel(bitrate=8000, turnaround=0.1)
+    first = channel.transmit("a", 100, lambda: None)
+    # 100 bytes at 8000 bits/s, after keying up
+    assert first.end - first.start == pytest.approx(0.1)
+    assert first.start - time.monotonic() == pytest.approx(0.1, abs=0.01)
+    # the same station goes on without a new turnaround, another waits
+    second = channel.transmit("a", 100, lambda: None)
+    assert second.start == pytest.approx(first.end)
+    third = channel.transmit("b", 100, lambda: None)
+    assert third.start == pytest.approx(second.end + 0.1)
+    assert channel.frames == 3
+    assert channel.bytes == 300
+
+
+def test_channel_full_duplex():
+    channel = sim.Channel(bitrate=8000, half_duplex=False)
+    first = channel.transmit("a", 100, lambda: None)
+    other = channel.transmit("b", 100, lambda: None)
+    assert other.start == pytest.approx(first.start, abs=0.01)
+
+
+def test_channel_latency_and_loss():
+    delivered = []
+    channel = sim.Channel(latency=0.05, loss=0.5, seed=1)
+    lost = [
+        channel.transmit("a", 10, delivered.append, n).lost for n in range(100)
+    ]
+    assert delivered == []
+    run_timers(0.1)
+    assert delivered == [n for n in range(100) if not lost[n]]
+    assert channel.dropped == sum(lost)
+    assert 20 < channel.dropped < 80
+
+
+def test_kiss_loopback(fake_io):
+    tnc = sim.KissTNC(sim.Channel())
+    a = connect(tnc, fake_io, "a")
+    b = connect(tnc, fake_io, "b")
+    c = connect(tnc, fake_io, "c")
+    frame = b"\x00" + b"ax25 frame"
+    # a frame split across reads, then a TNC setting (not put on air)
+    a.read_callback(a.io, None, sim.FEND + frame[:4], None)
+    a.read_callback(a.io, None, frame[4:] + sim.FEND + sim.FEND + b"\x01\x20", None)
+    for port in (a, b, c):
+        flush(port)
+    assert a.io.written == b""
+    assert b.io.written == c.io.written == sim.FEND + frame + sim.FEND
+    assert tnc.channel.frames == 1
+
+
+@pytest.fixture
+def ether(monkeypatch):
+    # the ports are FakeIOs handed to the listeners, not accepted sockets
+    monkeypatch.setattr(sim, "listen", lambda listener, gensio_str: listener)
+    return sim.VaraEther(sim.Channel(latency=0.01))
+
+
+class Modem:
+    """A VaraSim with its control and data ports connected to FakeIOs."""
+
+    def __init__(self, ether, fake_io, name):
+        self.sim = sim.VaraSim("control", "data", ether=ether)
+        control_listener, data_listener = self.sim.listeners
+        self.control = connect(control_listener, fake_io, name + " control")
+        self.data = connect(data_listener, fake_io, name + " data")
+
+    def command(self, line):
+        self.control.read_callback(self.control.io, None, line.encode() + b"\r", None)
+
+    def replies(self, ptt=False):
+        """Lines the modem sent since the last call, PTT ones only if `ptt`."""
+        flush(self.control)
+        lines = self.control.io.written.decode().split("\r")
+        self.control.io.written.clear()
+        return [l for l in lines if l and (ptt or not l.startswith("PTT "))]
+
+
+def test_vara_loopback(ether, fake_io):
+    a = Modem(ether, fake_io, "a")
+    b = Modem(ether, fake_io, "b")
+    b.command("MYCALL GW-1")
+    b.command("LISTEN ON")
+    a.command("MYCALL N0CALL")
+    assert b.replies() == ["OK", "OK"]
+
+    a.command("CONNECT N0CALL GW-1")
+    run_timers(0.1)
+    assert a.replies() == ["OK", "OK", "CONNECTED N0CALL GW-1 2300"]
+    assert b.replies() == ["CONNECTED N0CALL GW-1 2300"]
+
+    payload = bytes(range(256)) * 3
+    a.data.read_callback(a.data.io, None, payload, None)
+    run_timers(0.3)
+    flush(b.data)
+    assert b.data.io.written == payload
+    replies = a.replies(ptt=True)
+    assert "BUFFER {}".format(len(payload)) in replies
+    assert "BUFFER 0" in replies
+    assert "PTT ON" in replies
+
+    a.command("DISCONNECT")
+    run_timers(0.1)
+    assert a.replies()[-1] == "DISCONNECTED"
+    assert b.replies()[-1] == "DISCONNECTED"
+
+
+def test_vara_connect_nobody_answers(ether, fake_io):
+    a = Modem(ether, fake_io, "a")
+    a.command("MYCALL N0CALL")
+    a.command("CONNECT N0CALL NOBODY")
+    run_timers(0.1 * sim.MAX_RETRIES + 0.1)
+    assert a.replies() == ["OK", "OK", "DISCONNECTED"]
+
+
+def test_vara_wedged_disconnect(monkeypatch, fake_io):
+    monkeypatch.setattr(sim, "listen", lambda listener, gensio_str: listener)
+    ether = sim.VaraEther()
+    a = Modem(ether, fake_io, "a")
+    b = Modem(ether, fake_io, "b")
+    a.sim.disconnect_delay = None
+    b.command("MYCALL GW-1")
+    b.command("LISTEN ON")
+    a.command("CONNECT N0CALL GW-1")
+    assert a.sim.link_up
+    a.command("DISCONNECT")
+    assert a.sim.link_up  # never goes down by itself
+    a.command("ABORT")
+    assert not a.sim.link_up
+    assert a.replies()[-1] == "DISCONNECTED"
+
+
+def test_kiss_over_tcp(gensio_port):
+    from benchmarks.harness import service_until
+
+    tnc = sim.listen(sim.KissTNC(), "tcp,localhost,{}".format(gensio_port))
+    try:
+        a = socket.create_connection(("localhost", gensio_port))
+        b = socket.create_connection(("localhost", gensio_port))
+        service_until(lambda: len(tnc.connections) == 2, timeout=10)
+        frame = sim.FEND + b"\x00hello" + sim.FEND
+        a.sendall(frame)
+        b.setblocking(False)
+        got = bytearray()
+
+        def received():
+            try:
+                got.extend(b.recv(100))
+            except BlockingIOError:
+                pass
+            return bytes(got) == frame
+
+        service_until(received, timeout=10)
+        a.close()
+        b.close()
+    finally:
+        tnc.shutdown()
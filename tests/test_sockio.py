@@ -0,0 +1,118 @@
+import os
+import socket
+import threading
+
+from gensio_modems.gutils import IOEvent, ListenerEvent
+from gensio_modems.sockio import SocketAccepter, SocketSelector
+
+
+class Echo(IOEvent):
+    """Write back what is read, taking at most `take` bytes per callback."""
+
+    take = None
+
+    def read_callback(self, io, err, data, auxdata):
+        if data and self.take is not None:
+            data = data[: self.take]
+        count = super().read_callback(io, err, data, auxdata)
+        if self.bufA:
+            self.bufB.extend(self.bufA.tobytes())
+            self.bufA.clear()
+            io.write_cb_enable(True)
+        return count
+
+
+class EchoListener(ListenerEvent):
+    def __init__(self, take=None):
+        super().__init__()
+        self.take = take
+
+    def new_connection(self, acc, io):
+        ioev = Echo()
+        ioev.take = self.take
+        ioev.io = io
+        self.track(ioev)
+        io.read_cb_enable(True)
+        return io
+
+
+def echo_clients(port, payloads, results):
+    def client(ix, payload):
+        with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+            sender = threading.Thread(target=sock.sendall, args=(payload,))
+            sender.start()
+            got = bytearray()
+            while len(got) < len(payload):
+                data = sock.recv(65536)
+                if not data:
+                    break
+                got += data
+            sender.join()
+        results[ix] = bytes(got)
+
+    threads = [
+        threading.Thread(target=client, args=(ix, payload))
+        for ix, payload in enumerate(payloads)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def serve(listener, payloads):
+    sock = socket.create_server(("127.0.0.1", 0))
+    sockets = SocketSelector()
+    listener.acc = SocketAccepter(sockets, sock, listener)
+    listener.acc.startup()
+    results = {}
+    threads = echo_clients(sock.getsockname()[1], payloads, results)
+    sockets.run(lambda: len(results) == len(payloads) and not len(listener.connections))
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_echo_concurrent_sessions():
+    payloads = [os.urandom(1024 * 1024) for _ in range(4)]
+    results = serve(EchoListener(), payloads)
+    assert [results[ix] for ix in range(len(payloads))] == payloads
+
+
+def test_unconsumed_bytes_are_redelivered():
+    payloads = [b"0123456789" * 100]
+    results = serve(EchoListener(take=7), payloads)
+    assert results[0] == payloads[0]
+
+
+def test_accepter_shutdown():
+    sock = socket.create_server(("127.0.0.1", 0))
+    sockets = SocketSelector()
+    listener = EchoListener()
+    listener.acc = SocketAccepter(sockets, sock, listener)
+    listener.acc.startup()
+    listener.shutdown()
+    sockets.serve(listener)
+    assert listener.acc is None
+
+
+def test_dispatch_waits_for_ready_sockets():
+    sockets = SocketSelector()
+    sockets.consumed.clear()
+    sockets.dispatch()
+    # nothing was drained, so the helper thread must keep waiting
+    assert not sockets.consumed.is_set()
+    a, b = socket.socketpair()
+    with a, b:
+        got = []
+
+        class Owner:
+            sock = a
+
+            def ready(self, events):
+                got.append(self.sock.recv(10))
+
+        b.send(b"x")
+        sockets.ready.append((Owner(), 0))
+        sockets.dispatch()
+    assert got == [b"x"]
+    assert sockets.consumed.is_set()
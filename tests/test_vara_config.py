@@ -0,0 +1,77 @@
+import textwrap
+
+import pytest
+
+from gensio_modems import vara
+
+DEFAULTS = {
+    "listen": None,
+    "vara-host": "localhost",
+    "vara-port": 8300,
+    "gateway": "rms,tcp,cms.winlink.org,8772",
+    "banner": None,
+    "high-water": 65536,
+    "low-water": 16384,
+    "tx-target": None,
+}
+
+
+def write_ini(tmp_path, text):
+    path = tmp_path / "modems.ini"
+    path.write_text(textwrap.dedent(text))
+    return str(path)
+
+
+def test_load_modems(tmp_path):
+    path = write_ini(
+        tmp_path,
+        """
+        [hf]
+        listen = KF7HVM-10
+
+        [fm]
+        listen = KF7HVM-11
+        vara-host = 10.0.0.2
+        vara-port = 8400
+        gateway = tcp,localhost,8772
+        tx-target = 2000
+        """,
+    )
+    hf, fm = vara.load_modems(path, DEFAULTS)
+    assert hf.name == "hf"
+    assert hf.gensio_str == "tcp,localhost,8300"
+    assert hf.control_kwargs["laddr"] == "KF7HVM-10"
+    assert hf.control_kwargs["data_port"] == "tcp,localhost,8301"
+    assert hf.control_kwargs["rms"]
+    assert hf.control_kwargs["spawn"] == "tcp,cms.winlink.org,8772"
+    assert hf.control_kwargs["pipe_kwargs"] == dict(
+        high_water=65536, low_water=16384, tx_target=None
+    )
+
+    assert fm.gensio_str == "tcp,10.0.0.2,8400"
+    assert fm.control_kwargs["data_port"] == "tcp,10.0.0.2,8401"
+    assert not fm.control_kwargs["rms"]
+    assert fm.control_kwargs["spawn"] == "tcp,localhost,8772"
+    assert fm.control_kwargs["pipe_kwargs"]["tx_target"] == 2000
+
+
+def test_defaults_give_the_listen_callsign(tmp_path):
+    path = write_ini(tmp_path, "[hf]\nbanner = Welcome\n")
+    (hf,) = vara.load_modems(path, dict(DEFAULTS, listen="GW-1"))
+    assert hf.control_kwargs["laddr"] == "GW-1"
+    assert hf.control_kwargs["banner"] == "Welcome"
+
+
+@pytest.mark.parametrize(
+    "text, error",
+    [
+        ("[hf]\nlisten = GW\nvara_port = 1\n", "unknown option"),
+        ("[hf]\nvara-port = 8300\n", "needs a listen callsign"),
+        ("# nothing here\n", "no modems configured"),
+        ("[hf]\nlisten = GW\nvara-port = eighty\n", "invalid literal"),
+    ],
+)
+def test_bad_config(tmp_path, text, error):
+    path = write_ini(tmp_path, text)
+    with pytest.raises(ValueError, match=error):
+        vara.load_modems(path, DEFAULTS)
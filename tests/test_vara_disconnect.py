@@ -0,0 +1,210 @@
+import time
+import types
+
+import pytest
+
+from gensio_modems import sim, vara
+from gensio_modems.gutils import TIMERS
+
+# ABORT goes out after 0.9 * WAIT, the link is given up after WAIT
+WAIT = 1.0
+
+
+@pytest.fixture
+def control(monkeypatch, fake_io):
+    """A VaraControlEvent on fake gensios, with a link up from N0CALL."""
+    opened = {}
+
+    def fake_gensio(osfuncs, gensio_str, handler):
+        io = opened[gensio_str] = fake_io(gensio_str)
+        return io
+
+    monkeypatch.setattr(vara, "gensio", types.SimpleNamespace(gensio=fake_gensio))
+    monkeypatch.setattr(vara, "WAIT_FOR_DISCONNECT", WAIT)
+    control = vara.VaraControlEvent(laddr="GW", data_port="data", spawn="gateway")
+    control.io = fake_io("control")
+    control.finished = 0
+    finish_close = control.finish_close
+
+    def counted_finish_close(io=None):
+        control.finished += 1
+        finish_close(io)
+
+    control.finish_close = counted_finish_close
+    control.dispatch("CONNECTED N0CALL GW")
+    assert control.connected == "N0CALL"
+    assert control.data_pipe.io2 is opened["gateway"]
+    control.bufB.clear()
+    yield control
+    control.data_pipe.cancel_disconnect()
+
+
+def run_timers(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.005)
+        TIMERS.run_due()
+
+
+def test_close_waits_for_disconnected(control):
+    control.close()
+    assert control.bufB.tobytes() == b"DISCONNECT\r"
+    assert control.data_pipe.disconnecting
+    assert control.finished == 0
+    assert not control.in_close
+
+    control.dispatch("DISCONNECTED")
+    assert control.finished == 1
+    assert not control.data_pipe.disconnecting
+    assert control.in_close
+
+    # the ABORT / expiry timers were cancelled
+    run_timers(WAIT * 1.1)
+    assert b"ABORT" not in control.bufB.tobytes()
+    assert control.finished == 1
+
+
+def test_abort_when_disconnected_never_comes(control):
+    control.close()
+    run_timers(WAIT * 0.95)
+    assert control.bufB.tobytes() == b"DISCONNECT\rABORT\r"
+    assert control.finished == 0
+
+    # treated as disconnected once WAIT_FOR_DISCONNECT expires
+    run_timers(WAIT * 0.1)
+    assert control.connected is None
+    assert control.finished == 1
+
+    # a DISCONNECTED arriving late doesn't close again
+    control.dispatch("DISCONNECTED")
+    assert control.finished == 1
+
+
+def test_close_twice_disconnects_once(control):
+    control.close()
+    control.close()
+    assert control.bufB.tobytes() == b"DISCONNECT\r"
+    control.dispatch("DISCONNECTED")
+    assert control.finished == 1
+
+
+class Wire:
+    """
+    Two FakeIOs connected back to back: what one end writes is read by the
+    other, on the next timer run, as over a socket.
+    """
+
+    def __init__(self, fake_io):
+        self.ends = fake_io("a"), fake_io("b")
+        for end, peer in zip(self.ends, reversed(self.ends)):
+            end.write_cb_enable = self.writer(end)
+            end.write = self.sender(end, end.write, peer)
+
+    @staticmethod
+    def writer(end):
+        def write_cb_enable(enabled):
+            end.write_enabled = enabled
+            if enabled:
+                TIMERS.call_later(0, writable)
+
+        def writable():
+            if end.write_enabled and not end.closed:
+                end.handler.write_callback(end)
+
+        return write_cb_enable
+
+    @staticmethod
+    def sender(end, write, peer):
+        def send(data, auxdata):
+            count = write(data, auxdata)
+            TIMERS.call_later(0, receive, bytes(data[:count]))
+            return count
+
+        def receive(data):
+            if not peer.closed and peer.read_enabled is not False:
+                peer.handler.read_callback(peer, None, data, None)
+
+        return send
+
+
+@pytest.fixture
+def over_sim(monkeypatch, fake_io):
+    """
+    A VaraControlEvent talking to a VaraSim (GW) that station N0CALL, on
+    another VaraSim, has connected to. Returns (control, modem).
+    """
+    opened = {}
+
+    def fake_gensio(osfuncs, gensio_str, handler):
+        io = opened[gensio_str] = fake_io(gensio_str)
+        return io
+
+    monkeypatch.setattr(vara, "gensio", types.SimpleNamespace(gensio=fake_gensio))
+    monkeypatch.setattr(vara, "WAIT_FOR_DISCONNECT", WAIT)
+    monkeypatch.setattr(sim, "listen", lambda listener, gensio_str: listener)
+    ether = sim.VaraEther()
+    modem = sim.VaraSim("control", "data", ether=ether)
+    station = sim.VaraSim("station control", "station data", ether=ether)
+
+    ours, theirs = Wire(fake_io).ends
+    modem.listeners[0].new_connection(None, theirs)
+    control = vara.VaraControlEvent(laddr="GW", data_port="data", spawn="gateway")
+    control.io = ours
+    control.finished = 0
+    finish_close = control.finish_close
+
+    def counted_finish_close(io=None):
+        control.finished += 1
+        finish_close(io)
+
+    control.finish_close = counted_finish_close
+    ours.write_cb_enable(True)  # MYCALL, LISTEN ON
+    run_timers(0.02)
+    assert modem.mycall == "GW" and modem.listening
+
+    station_io = fake_io("station control")
+    station.listeners[0].new_connection(None, station_io)
+    station_io.handler.read_callback(
+        station_io, None, b"MYCALL N0CALL\rCONNECT N0CALL GW\r", None
+    )
+    run_timers(0.02)
+    assert control.connected == "N0CALL"
+    yield control, modem
+    control.data_pipe.cancel_disconnect()
+
+
+def test_sim_disconnect_delayed(over_sim):
+    control, modem = over_sim
+    modem.disconnect_delay = WAIT * 0.5
+    control.close()
+    run_timers(WAIT * 0.25)
+    assert modem.commands[-1] == "DISCONNECT"
+    assert control.connected == "N0CALL"
+    assert control.finished == 0
+
+    run_timers(WAIT * 0.35)
+    assert control.connected is None
+    assert control.finished == 1
+    run_timers(WAIT * 0.6)
+    assert "ABORT" not in modem.commands
+    assert control.finished == 1
+
+
+def test_sim_disconnected_after_the_wait(over_sim):
+    control, modem = over_sim
+    # ABORT doesn't help and DISCONNECTED comes after the wait has expired
+    modem.disconnect_delay = WAIT * 1.3
+    modem.abort_delay = None
+    control.close()
+    run_timers(WAIT * 0.95)
+    assert modem.commands[-2:] == ["DISCONNECT", "ABORT"]
+    assert control.finished == 0
+
+    run_timers(WAIT * 0.1)
+    assert control.connected is None
+    assert control.finished == 1
+    assert modem.link_up
+
+    run_timers(WAIT * 0.3)
+    assert not modem.link_up
+    assert control.finished == 1
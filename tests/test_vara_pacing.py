@@ -0,0 +1,78 @@
+import types
+
+import pytest
+
+from gensio_modems import vara
+
+
+@pytest.fixture
+def control(monkeypatch, fake_io):
+    """A VaraControlEvent with a link up and BUFFER pacing at 1000 bytes."""
+    monkeypatch.setattr(
+        vara,
+        "gensio",
+        types.SimpleNamespace(
+            gensio=lambda osfuncs, gensio_str, handler: fake_io(gensio_str)
+        ),
+    )
+    control = vara.VaraControlEvent(
+        laddr="GW",
+        data_port="data",
+        spawn="gateway",
+        pipe_kwargs=dict(tx_target=1000, high_water=100, low_water=0),
+    )
+    control.io = fake_io("control")
+    control.dispatch("CONNECTED N0CALL GW")
+    return control
+
+
+def test_buffer_pauses_and_resumes_the_gateway(control):
+    pipe = control.data_pipe
+    gateway = pipe.io2
+    control.dispatch("BUFFER 1000")
+    assert not pipe.tx_paused
+    control.dispatch("BUFFER 1500")
+    assert pipe.tx_paused
+    assert gateway.read_enabled is False
+    # not yet down to tx_resume, half the target
+    control.dispatch("BUFFER 600")
+    assert gateway.read_enabled is False
+    control.dispatch("BUFFER 500")
+    assert not pipe.tx_paused
+    assert gateway.read_enabled is True
+    assert control.tx_buffer == 500
+
+
+def test_backlog_drained_while_vara_is_full(control):
+    pipe = control.data_pipe
+    gateway = pipe.io2
+    pipe.read_callback(gateway, None, b"x" * 100, None)
+    assert pipe.read_paused == {"io2"}
+    control.dispatch("BUFFER 2000")
+    pipe.write_callback(pipe.io)
+    # the pipe's backlog is gone, but VARA still has too much queued
+    assert not pipe.bufB
+    assert gateway.read_enabled is False
+    control.dispatch("BUFFER 0")
+    assert gateway.read_enabled is True
+
+
+def test_watermark_pause_outlasts_buffer(control):
+    pipe = control.data_pipe
+    gateway = pipe.io2
+    control.dispatch("BUFFER 2000")
+    pipe.read_callback(gateway, None, b"x" * 100, None)
+    control.dispatch("BUFFER 0")
+    # VARA drained, but the pipe still holds its own backlog
+    assert gateway.read_enabled is False
+    pipe.write_callback(pipe.io)
+    assert gateway.read_enabled is True
+
+
+def test_disconnect_clears_the_pause(control):
+    pipe = control.data_pipe
+    control.dispatch("BUFFER 2000")
+    assert pipe.tx_paused
+    control.dispatch("DISCONNECTED")
+    assert not pipe.tx_paused
+    assert control.tx_buffer is None
@@ -0,0 +1,71 @@
+import types
+
+import pytest
+
+from gensio_modems import vara, varaproto
+from gensio_modems.varaproto import LineFramer
+
+STREAM = b"PTT ON\rBUFFER 120\r\nCONNECTED N0CALL GW 2300\rPTT OFF\r"
+LINES = ["PTT ON", "BUFFER 120", "CONNECTED N0CALL GW 2300", "PTT OFF"]
+
+
+def feed(framer, chunks):
+    lines = []
+    for chunk in chunks:
+        framer.extend(chunk)
+        lines += framer.lines()
+    return lines
+
+
+def test_several_lines_in_one_read():
+    assert feed(LineFramer(), [STREAM]) == LINES
+
+
+def test_byte_by_byte():
+    framer = LineFramer()
+    assert feed(framer, [STREAM[i : i + 1] for i in range(len(STREAM))]) == LINES
+    assert not framer
+
+
+def test_partial_line_kept():
+    framer = LineFramer()
+    assert feed(framer, [b"BUFFER 1", b"20\rCONNEC"]) == ["BUFFER 120"]
+    assert len(framer) == len(b"CONNEC")
+    # a CR LF split across reads doesn't make an empty line
+    assert feed(framer, [b"TED N0CALL GW 2300\r", b"\n", b"OK\r"]) == [
+        "CONNECTED N0CALL GW 2300",
+        "OK",
+    ]
+
+
+def test_overlong_line_discarded():
+    framer = LineFramer(max_line=16)
+    assert feed(framer, [b"x" * 10, b"x" * 10]) == []
+    assert not framer
+    assert feed(framer, [b"tail\rOK\r"]) == ["tail", "OK"]
+
+
+@pytest.fixture
+def control(monkeypatch, fake_io):
+    monkeypatch.setattr(
+        vara,
+        "gensio",
+        types.SimpleNamespace(gensio=lambda osfuncs, gensio_str, handler: fake_io()),
+    )
+    control = vara.VaraControlEvent(laddr="GW", data_port="data", spawn="gateway")
+    control.io = fake_io("control")
+    control.events = []
+    for event_type in (varaproto.Ptt, varaproto.Buffer, varaproto.Connected):
+        control.subscribe(event_type, control.events.append)
+    return control
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, len(STREAM)])
+def test_control_read_callback(control, chunk_size):
+    for i in range(0, len(STREAM), chunk_size):
+        chunk = STREAM[i : i + chunk_size]
+        assert control.read_callback(control.io, None, chunk, None) == len(chunk)
+    assert control.events == [varaproto.parse(line) for line in LINES]
+    assert control.connected == "N0CALL"
+    assert control.tx_buffer == 120
+    assert not control.ptt
@@ -0,0 +1,132 @@
+import socket
+import sys
+
+import pytest
+
+from gensio_modems.workers import (
+    PER_WORKER_OPTIONS,
+    Worker,
+    kiss_over_tcp,
+    listen_socket,
+    numbered_path,
+    numbered_port,
+    run_ax25_workers,
+    strip_options,
+    worker_options,
+)
+
+
+def test_strip_options():
+    argv = ["--workers", "2", "-l", "tcp,8772", "--listen=x", "-lfoo", "-g", "GW"]
+    base = strip_options(argv, ("--workers",))
+    assert strip_options(base, ("-l", "--listen")) == ["-g", "GW"]
+
+
+def test_worker_options():
+    per_worker = {"--metrics": numbered_port, "--capture": numbered_path}
+    argv = ["--metrics", "tcp,localhost,9100", "--capture=/tmp/cap", "-g", "GW"]
+    assert worker_options(argv, 2, per_worker) == [
+        "--metrics",
+        "tcp,localhost,9102",
+        "--capture=/tmp/cap.2",
+        "-g",
+        "GW",
+    ]
+
+
+def test_per_worker_files():
+    argv = ["--profiles", "/var/lib/profiles.json", "--capture", "/tmp/cap"]
+    assert worker_options(argv, 1, PER_WORKER_OPTIONS) == [
+        "--profiles",
+        "/var/lib/profiles.json.1",
+        "--capture",
+        "/tmp/cap.1",
+    ]
+
+
+def test_numbered_port():
+    assert numbered_port("tcp,9100", 1) == "tcp,9101"
+    assert numbered_port("unix,/run/metrics", 1) == "unix,/run/metrics.1"
+
+
+def test_kiss_over_tcp():
+    assert kiss_over_tcp("tcp,localhost,8001")
+    assert kiss_over_tcp("tcp(nodelay),direwolf,8001")
+    assert not kiss_over_tcp("serialdev,/dev/ttyUSB0,9600n81")
+
+
+def test_ax25_workers_need_a_tcp_tnc():
+    with pytest.raises(ValueError):
+        run_ax25_workers(["GW-1", "GW-2"], "serialdev,/dev/ttyUSB0", [], 2)
+
+
+def test_listen_socket_tcp():
+    sock = listen_socket("tcp,127.0.0.1,0")
+    try:
+        assert sock.family == socket.AF_INET
+        port = sock.getsockname()[1]
+        socket.create_connection(("127.0.0.1", port), timeout=5).close()
+    finally:
+        sock.close()
+
+
+def test_listen_socket_unix(tmp_path):
+    path = str(tmp_path / "proxy.sock")
+    sock = listen_socket("unix," + path)
+    try:
+        assert sock.getsockname() == path
+    finally:
+        sock.close()
+
+
+@pytest.mark.parametrize("listen", ["telnet,tcp,8772", "tcp,localhost,http", "stdio"])
+def test_listen_socket_unsupported(listen):
+    with pytest.raises(ValueError):
+        listen_socket(listen)
+
+
+# accepts one connection on the inherited socket, greets it and exits
+WORKER = """
+import socket, sys
+from gensio_modems.gutils import IOEvent, ListenerEvent
+from gensio_modems.sockio import SocketAccepter, SocketSelector
+
+class Once(ListenerEvent):
+    def new_connection(self, acc, io):
+        acc.shutdown(self)  # leave the next connection to the other worker
+        ioev = IOEvent()
+        ioev.io = io
+        self.track(ioev)
+        ioev.bufB.extend(b"worker " + sys.argv[2].encode())
+        ioev.close()
+        return io
+
+sockets = SocketSelector()
+listener = Once()
+listener.acc = SocketAccepter(sockets, socket.socket(fileno=int(sys.argv[1])), listener)
+listener.acc.startup()
+sockets.serve(listener)
+"""
+
+
+def test_workers_share_the_listening_socket():
+    sock = listen_socket("tcp,127.0.0.1,0")
+    fd = sock.fileno()
+    workers = [
+        Worker(ix, [sys.executable, "-c", WORKER, str(fd), str(ix)], pass_fds=(fd,))
+        for ix in range(2)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        greetings = set()
+        for _ in workers:
+            with socket.create_connection(sock.getsockname(), timeout=10) as conn:
+                greetings.add(conn.makefile("rb").read())
+        assert greetings == {b"worker 0", b"worker 1"}
+        for worker in workers:
+            assert worker.proc.wait(timeout=10) == 0
+    finally:
+        for worker in workers:
+            worker.stop()
+        sock.close()